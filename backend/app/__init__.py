@@ -0,0 +1,2 @@
+# Imported first so startup timing covers every import that follows.
+from .core import startup  # noqa: F401
@@ -0,0 +1,160 @@
+"""
+File attachments. Uploads are the raw request body (not multipart), streamed into the
+content-addressed blob store (app/core/blob_store.py) one chunk at a time. The file
+is hashed on the way in and never buffered whole. Downloads hand the blob's path to
+the server instead of reading it in Python. Uvicorn sends it with Starlette's
+FileResponse, which honours Range and uses the zero-copy `pathsend` extension where
+the server offers it. With ATTACHMENT_ACCEL_REDIRECT set, an nginx in front serves
+the file with sendfile and the app only answers the permission check.
+"""
+import json
+import logging
+import os
+import uuid
+from typing import List, Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ...cruds import chat_crud
+from ...core import blob_store
+from ...core.security import get_current_user
+from ...db import database, models
+from ...schemas import schemas
+from ...websocket import manager
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# e.g. "/_attachments/": an nginx `internal` location aliased to ATTACHMENT_DIR. Empty
+# serves files from the app.
+ATTACHMENT_ACCEL_REDIRECT = os.getenv("ATTACHMENT_ACCEL_REDIRECT", "")
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+
+def _require_participant(db: Session, user: models.User, conversation_id: uuid.UUID) -> None:
+    if not chat_crud.is_user_participant(db, user_id=user.id, conversation_id=conversation_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a participant of this conversation")
+
+
+def _clean_filename(filename: str) -> str:
+    # Keep only the last path component, whatever separator the client used.
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1].strip()
+    return name[:255] or "file"
+
+
+def _attachment_dict(attachment: models.Attachment) -> dict:
+    return {
+        "id": str(attachment.id),
+        "message_id": str(attachment.message_id),
+        "filename": attachment.filename,
+        "content_type": attachment.content_type,
+        "size": attachment.size,
+        "sha256": attachment.sha256,
+        "created_at": attachment.created_at.isoformat(),
+    }
+
+
+def _download_headers(attachment: models.Attachment) -> dict:
+    # Blobs never change, so the digest is a strong validator and clients may cache for good.
+    return {
+        "ETag": f'"{attachment.sha256}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+
+@router.post("/{conversation_id}/attachments", response_model=schemas.Attachment, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    conversation_id: uuid.UUID,
+    request: Request,
+    filename: str = Query(..., min_length=1),
+    caption: Optional[str] = Query(None, max_length=4000),
+    content_length: Optional[int] = Header(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Sends a file to the conversation. The body is the file itself, with its type in
+    Content-Type. Creates a message (the caption, or the file name) carrying the
+    attachment and broadcasts it like a chat message.
+    """
+    # Checked before a single byte of the body is read.
+    await run_in_threadpool(_require_participant, db, current_user, conversation_id)
+    if content_length is not None and content_length > blob_store.ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment is too large")
+    # An upload can take minutes: give the connection back to the pool rather than hold
+    # a transaction open while the body streams in. The session checks out a new one
+    # for the insert below. current_user keeps its loaded attributes.
+    db.close()
+    try:
+        digest, size, created = await blob_store.store(request.stream(), blob_store.ATTACHMENT_MAX_BYTES)
+    except blob_store.BlobTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment is too large")
+
+    name = _clean_filename(filename)
+    content_type = request.headers.get("content-type") or DEFAULT_CONTENT_TYPE
+    db_message, attachment = await run_in_threadpool(
+        chat_crud.create_attachment_message,
+        db, conversation_id, current_user.id, caption, digest, size, name, content_type,
+    )
+    database.note_write(current_user.username)
+    logger.debug("Stored attachment %s (%d bytes, %s blob)", attachment.id, size, "new" if created else "existing")
+
+    broadcast_message = {
+        "id": str(db_message.id),
+        "sender": {"id": str(current_user.id), "username": current_user.username},
+        "content": caption or name,
+        "created_at": db_message.created_at.isoformat(),
+        "conversation_id": str(conversation_id),
+        "status": db_message.status.value,
+        "attachments": [_attachment_dict(attachment)],
+    }
+    await manager.broadcast(json.dumps(broadcast_message), str(conversation_id))
+    return attachment
+
+
+@router.get("/{conversation_id}/attachments", response_model=List[schemas.Attachment])
+def read_conversation_attachments(
+    conversation_id: uuid.UUID,
+    limit: int = Query(100, ge=1, le=100),
+    before: Optional[uuid.UUID] = None,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """The conversation's attachments, newest first. Pass the last id as `before` for the next page."""
+    _require_participant(db, current_user, conversation_id)
+    return chat_crud.get_conversation_attachments(db, conversation_id, limit=limit, before=before)
+
+
+@router.get("/{conversation_id}/attachments/{attachment_id}")
+def download_attachment(
+    conversation_id: uuid.UUID,
+    attachment_id: uuid.UUID,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """The file's bytes. Supports Range requests and If-None-Match."""
+    _require_participant(db, current_user, conversation_id)
+    attachment = chat_crud.get_attachment(db, conversation_id, attachment_id)
+    if attachment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+
+    headers = _download_headers(attachment)
+    if if_none_match and headers["ETag"] in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if ATTACHMENT_ACCEL_REDIRECT:
+        headers["X-Accel-Redirect"] = ATTACHMENT_ACCEL_REDIRECT.rstrip("/") + "/" + blob_store.relative_path(attachment.sha256)
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(attachment.filename)}"
+        return Response(headers=headers, media_type=attachment.content_type)
+
+    path = blob_store.blob_path(attachment.sha256)
+    if not os.path.exists(path):
+        logger.error("Blob %s of attachment %s is missing", attachment.sha256, attachment.id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+    return FileResponse(path, media_type=attachment.content_type, filename=attachment.filename, headers=headers)
@@ -1,13 +1,17 @@
 
+import csv
+import hashlib
+import io
 import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 import uuid
 
 from ...cruds import chat_crud
-from ...schemas import schemas
+from ...schemas import schemas, serializers
 from ...db import database, models
 from ...core.security import get_current_user
 from ...websocket import manager
@@ -20,24 +24,154 @@ def create_new_conversation(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    return chat_crud.create_conversation(db=db, conversation=conversation, creator_id=current_user.id)
+    db_convo = chat_crud.create_conversation(db=db, conversation=conversation, creator_id=current_user.id)
+    database.note_write(current_user.username)
+    return db_convo
+
+# --- Conditional GET ---
+# Clients poll the list and history endpoints. Each response carries a weak ETag built
+# from a cheap version query; a matching If-None-Match gets a 304 before any of the
+# expensive loading, decryption or serialization runs.
+def _make_etag(*parts) -> str:
+    return 'W/"%s"' % hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    # Weak comparison: W/"x" and "x" are the same validator.
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
 
 @router.get("/", response_model=List[schemas.Conversation])
 def read_user_conversations(
-    db: Session = Depends(database.get_db),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    return chat_crud.get_user_conversations(db=db, user_id=current_user.id)
+    version = chat_crud.get_conversation_list_version(db=db, user_id=current_user.id)
+    etag = _make_etag("conversations", current_user.id, *version)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    rows = chat_crud.get_user_conversations(db=db, user_id=current_user.id)
+    return serializers.FastJSONResponse(serializers.conversation_dicts(rows), headers=_cache_headers(etag))
+
+
+@router.get("/bootstrap", response_model=schemas.InboxBootstrap)
+def read_inbox_bootstrap(
+    conversations: int = Query(50, ge=1, le=200),
+    messages: int = Query(20, ge=0, le=100),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Everything the client needs to draw the inbox in one call: the `conversations` most
+    recently active conversations, the last `messages` messages of each and who is online
+    in them. Three queries after authentication, whatever the inbox size.
+    """
+    rows = chat_crud.get_user_conversations(db=db, user_id=current_user.id, limit=conversations)
+    convo_ids = [row[0] for row in rows]
+    latest = chat_crud.get_latest_messages(db=db, conversation_ids=convo_ids, per_conversation=messages)
+    presence = manager.presence(str(convo_id) for convo_id in convo_ids)
+    return serializers.FastJSONResponse({
+        "conversations": serializers.conversation_dicts(rows),
+        "messages": {str(convo_id): serializers.message_dicts(latest.get(convo_id, ())) for convo_id in convo_ids},
+        "presence": presence,
+    })
 
 @router.get("/{conversation_id}/messages", response_model=List[schemas.Message])
 def read_conversation_messages(
     conversation_id: uuid.UUID,
-    db: Session = Depends(database.get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     if not chat_crud.is_user_participant(db, user_id=current_user.id, conversation_id=conversation_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a participant of this conversation")
-    return chat_crud.get_conversation_messages(db=db, conversation_id=conversation_id)
+    version = chat_crud.get_conversation_history_version(db=db, conversation_id=conversation_id)
+    etag = _make_etag("messages", conversation_id, skip, limit, *(version or ()))
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    rows = chat_crud.get_conversation_messages(db=db, conversation_id=conversation_id, skip=skip, limit=limit)
+    return serializers.FastJSONResponse(serializers.message_dicts(rows), headers=_cache_headers(etag))
+
+
+@router.get("/{conversation_id}/search", response_model=List[schemas.Message])
+def search_conversation_messages(
+    conversation_id: uuid.UUID,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Keyword search over the conversation (all terms must match), newest first."""
+    if not chat_crud.is_user_participant(db, user_id=current_user.id, conversation_id=conversation_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a participant of this conversation")
+    rows = chat_crud.search_conversation_messages(db=db, conversation_id=conversation_id, query=q, limit=limit)
+    return serializers.FastJSONResponse(serializers.message_dicts(rows))
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_HEADER = ["id", "sender_id", "sender_username", "content", "created_at", "status"]
+
+
+def _ndjson_chunks(rows_chunks):
+    for rows in rows_chunks:
+        yield "".join(
+            json.dumps({
+                "id": str(msg_id),
+                "sender": {"id": str(sender_id), "username": username},
+                "content": content,
+                "created_at": created_at.isoformat(),
+                "status": msg_status.value,
+            }) + "\n"
+            for msg_id, content, created_at, msg_status, sender_id, username in rows
+        )
+
+
+def _csv_chunks(rows_chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for rows in rows_chunks:
+        writer.writerows(
+            (str(msg_id), str(sender_id), username, content, created_at.isoformat(), msg_status.value)
+            for msg_id, content, created_at, msg_status, sender_id, username in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/{conversation_id}/export")
+def export_conversation(
+    conversation_id: uuid.UUID,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Streams the whole conversation history as NDJSON or CSV, one chunk per DB batch."""
+    if not chat_crud.is_user_participant(db, user_id=current_user.id, conversation_id=conversation_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a participant of this conversation")
+
+    rows_chunks = chat_crud.iter_conversation_messages(db=db, conversation_id=conversation_id)
+    chunks = _ndjson_chunks(rows_chunks) if format == "ndjson" else _csv_chunks(rows_chunks)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="conversation-{conversation_id}.{format}"'},
+    )
 
 
 @router.post("/{conversation_id}/read", status_code=status.HTTP_204_NO_CONTENT)
@@ -48,6 +182,7 @@ async def mark_as_read(
 ):
     """Marks messages as read and broadcasts read receipts to senders."""
     read_receipts = chat_crud.mark_conversation_as_read(db, user_id=current_user.id, conversation_id=conversation_id)
+    database.note_write(current_user.username)
     
     # After marking as read, broadcast the updates to the relevant senders
     for sender_id, message_ids in read_receipts.items():
@@ -58,6 +193,6 @@ async def mark_as_read(
         }
         # Broadcast to all connections of the sender
         await manager.broadcast_to_user(sender_id, json.dumps(receipt_message))
-        logger.info(f"sender: {sender_id}")
+        logger.debug("Sent read receipts for %d messages to sender %s", len(message_ids), sender_id)
 
     return
\ No newline at end of file
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends
+
+from ...db import models
+from ...core import log_config, startup
+from ...core.rate_limit import rate_limiter
+from ...core.security import get_current_admin
+from ...ephemeral import typing_coalescer
+from ...spool import message_spool
+from ...websocket import manager
+
+router = APIRouter()
+
+
+@router.get("/rate-limits")
+def read_rate_limit_stats(current_user: models.User = Depends(get_current_admin)):
+    """
+    Counters of the WebSocket rate limiter in this process: admitted frames, rejections
+    per scope (socket, user, conversation), tracked and evicted buckets and the
+    configured limits. Admins only (ADMIN_USERNAMES).
+    """
+    return rate_limiter.stats()
+
+
+@router.get("/connections")
+def read_connection_stats(current_user: models.User = Depends(get_current_admin)):
+    """
+    WebSocket state of this process: open sockets, online users, heartbeat counters and
+    wheel occupancy, approximate memory per connection, and the depth of the in-memory
+    queues (log records waiting for the writer thread, typing updates waiting to flush,
+    messages spooled while the database was unavailable). Admins only (ADMIN_USERNAMES).
+    """
+    stats = manager.stats()
+    stats["queues"] = {"log": log_config.queue_stats(), "typing": typing_coalescer.stats(), "spool": message_spool.stats()}
+    return stats
+
+
+@router.get("/startup")
+def read_startup_stats(current_user: models.User = Depends(get_current_admin)):
+    """
+    How long this worker took to start: import, DB connect, schema check and pool
+    warm-up, in ms. Admins only (ADMIN_USERNAMES).
+    """
+    return startup.report()
@@ -1,8 +1,7 @@
-
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 
 from ...cruds import user_crud
 from ...schemas import schemas
@@ -14,15 +13,24 @@ logger = logging.getLogger(__name__)
 
 @router.get("/", response_model=List[schemas.User])
 def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(database.get_db),
+    response: Response,
+    q: Optional[str] = None,
+    match: Literal["prefix", "contains"] = "prefix",
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Retrieve users. This is used to select users for a new conversation.
+    `q` searches username, full name and email. Pages are keyset-paginated by username:
+    pass the `X-Next-Cursor` header of a full page back as `after` to get the next one.
+    `skip` (an offset) still works for older clients but gets slower the deeper it goes.
     """
-    logger.info("getting user")
-    users = user_crud.get_users(db, skip=skip, limit=limit)
-    # Filter out the current user from the list
-    return [user for user in users if user.id != current_user.id]
\ No newline at end of file
+    users = user_crud.search_users(
+        db, exclude_user_id=current_user.id, query=q, match=match, after=after, limit=limit, skip=skip
+    )
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = users[-1].username
+    return users
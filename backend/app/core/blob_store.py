@@ -0,0 +1,96 @@
+"""
+Content-addressed store for attachment bytes on local disk.
+
+A blob is stored once under its SHA-256, at blobs/<aa>/<bb>/<digest>, so identical
+uploads share one file. Uploads stream into a temporary file in the same filesystem
+while being hashed, then are renamed into place, or dropped if the blob already
+exists. Nothing holds more than one chunk in memory. Blob files are never modified,
+which is what lets downloads hand them straight to the server (FileResponse,
+X-Accel-Redirect).
+"""
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+# Every app instance must see the same directory.
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(2 * 1024 ** 3)))
+# Request chunks are small; they are gathered up to this size before each disk write.
+ATTACHMENT_WRITE_BUFFER = int(os.getenv("ATTACHMENT_WRITE_BUFFER", str(1024 * 1024)))
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+def relative_path(digest: str) -> str:
+    return os.path.join("blobs", digest[:2], digest[2:4], digest)
+
+
+def blob_path(digest: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or ATTACHMENT_DIR, relative_path(digest))
+
+
+class _PendingBlob:
+    """A temporary file being written and hashed. Blocking calls; run them off the event loop."""
+
+    def __init__(self, root: str):
+        directory = os.path.join(root, "tmp")
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory)
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.hash.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    def commit(self, root: str) -> Tuple[str, bool]:
+        """Moves the file to its content address. Returns (digest, True if it is a new blob)."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        digest = self.hash.hexdigest()
+        final = blob_path(digest, root)
+        if os.path.exists(final):
+            os.remove(self.path)
+            return digest, False
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(self.path, final)
+        return digest, True
+
+    def discard(self) -> None:
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def store(chunks: AsyncIterator[bytes], max_bytes: int = ATTACHMENT_MAX_BYTES,
+                root: Optional[str] = None) -> Tuple[str, int, bool]:
+    """
+    Streams `chunks` into the store. Returns (sha256, size, True if the blob is new).
+    Raises BlobTooLarge as soon as more than `max_bytes` arrive.
+    """
+    root = root or ATTACHMENT_DIR
+    pending = await run_in_threadpool(_PendingBlob, root)
+    try:
+        buffer = bytearray()
+        async for chunk in chunks:
+            if pending.size + len(buffer) + len(chunk) > max_bytes:
+                raise BlobTooLarge(f"Attachment exceeds {max_bytes} bytes")
+            buffer += chunk
+            if len(buffer) >= ATTACHMENT_WRITE_BUFFER:
+                await run_in_threadpool(pending.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(pending.write, bytes(buffer))
+        digest, created = await run_in_threadpool(pending.commit, root)
+    except BaseException:
+        await run_in_threadpool(pending.discard)
+        raise
+    return digest, pending.size, created
@@ -0,0 +1,128 @@
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+from typing import Dict, Optional
+
+# --- Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Comma separated "logger=rate" pairs. Records below WARNING on these loggers are
+# sampled at the given rate (0.01 keeps one record in a hundred). Only per-frame
+# loggers belong here; app.main's startup and outage records must all be kept.
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "app.websocket=0.01")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Matches `"content": "..."` pairs in anything that looks like a serialized message.
+_CONTENT_FIELD = re.compile(r'("content"\s*:\s*)"(?:[^"\\]|\\.)*"')
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every N records below WARNING. Warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if not self.every:
+            return False
+        self._seen += 1
+        return (self._seen - 1) % self.every == 0
+
+
+class RedactingFormatter(logging.Formatter):
+    """Formatter that scrubs message bodies, so plaintext can never reach the log output."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return _CONTENT_FIELD.sub(r'\1"[redacted]"', super().format(record))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and never blocks.
+    The message is rendered on the calling thread, so args mutated after the call
+    are logged as they were; timestamps, tracebacks and redaction are left to the
+    listener. When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parses "logger=rate,logger=rate" into a dict, ignoring malformed entries."""
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            try:
+                rates[name.strip()] = float(rate)
+            except ValueError:
+                continue
+    return rates
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DeferredQueueHandler] = None
+_listening = False
+
+
+def setup_logging() -> None:
+    """
+    Routes the root logger through a bounded in-memory queue drained by a background
+    thread. Safe to call more than once; it only (re)starts the listener.
+    """
+    global _listener, _queue_handler, _listening
+    if _queue_handler is None:
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = DeferredQueueHandler(log_queue)
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(RedactingFormatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_queue_handler)
+
+        for name, rate in parse_sample_rates(LOG_SAMPLE_RATES).items():
+            logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    if not _listening:
+        _listener.start()
+        _listening = True
+
+
+def stop_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listening
+    if _listening:
+        _listener.stop()
+        _listening = False
+
+
+def queue_stats() -> dict:
+    """Depth of the log queue and records dropped because it was full."""
+    if _queue_handler is None:
+        return {"depth": 0, "capacity": LOG_QUEUE_SIZE, "dropped": 0}
+    return {"depth": _queue_handler.queue.qsize(), "capacity": LOG_QUEUE_SIZE, "dropped": _queue_handler.dropped}
@@ -0,0 +1,123 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+# --- Configuration ---
+# Each limit is a sustained rate (messages per second) and a burst size. A rate of 0
+# turns that limit off.
+WS_SOCKET_RATE = float(os.getenv("WS_SOCKET_RATE", "5"))
+WS_SOCKET_BURST = float(os.getenv("WS_SOCKET_BURST", "10"))
+WS_USER_RATE = float(os.getenv("WS_USER_RATE", "10"))
+WS_USER_BURST = float(os.getenv("WS_USER_BURST", "20"))
+WS_CONVERSATION_RATE = float(os.getenv("WS_CONVERSATION_RATE", "50"))
+WS_CONVERSATION_BURST = float(os.getenv("WS_CONVERSATION_BURST", "100"))
+
+SCOPES = ("socket", "user", "conversation")
+
+
+class TokenBucket:
+    """Classic token bucket: refills at `rate` tokens per second up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return self.tokens
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (call after refill)."""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Token buckets per socket, per user and per conversation, all checked in O(1).
+    A frame is admitted only when every bucket has a token, and only then is a token
+    taken from each, so a rejection by one scope does not drain the others.
+    Each table keeps its buckets in least-recently-used order and holds at most
+    `max_tracked` of them: adding one past that evicts the least recently used, in
+    O(1). That is almost always an idle bucket, and a full bucket is indistinguishable
+    from a missing one.
+    """
+
+    def __init__(
+        self,
+        socket_limit=(WS_SOCKET_RATE, WS_SOCKET_BURST),
+        user_limit=(WS_USER_RATE, WS_USER_BURST),
+        conversation_limit=(WS_CONVERSATION_RATE, WS_CONVERSATION_BURST),
+        max_tracked: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = {"socket": socket_limit, "user": user_limit, "conversation": conversation_limit}
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._buckets: Dict[str, "OrderedDict[Hashable, TokenBucket]"] = {scope: OrderedDict() for scope in SCOPES}
+        self.allowed = 0
+        self.rejected: Dict[str, int] = {scope: 0 for scope in SCOPES}
+        self.evicted = 0
+
+    def _bucket(self, scope: str, key: Hashable, now: float) -> Optional[TokenBucket]:
+        rate, burst = self.limits[scope]
+        if rate <= 0:
+            return None
+        table = self._buckets[scope]
+        bucket = table.get(key)
+        if bucket is None:
+            if len(table) >= self.max_tracked:
+                table.popitem(last=False)
+                self.evicted += 1
+            bucket = table[key] = TokenBucket(rate, burst, now)
+        else:
+            table.move_to_end(key)
+        bucket.refill(now)
+        return bucket
+
+    def check(self, socket_key: Hashable, user_id: Hashable, conversation_id: Hashable) -> float:
+        """
+        Takes one token from each scope. Returns 0.0 when the frame is allowed,
+        otherwise the number of seconds the client should wait before retrying.
+        """
+        now = self.clock()
+        buckets = (
+            ("socket", self._bucket("socket", socket_key, now)),
+            ("user", self._bucket("user", user_id, now)),
+            ("conversation", self._bucket("conversation", conversation_id, now)),
+        )
+        retry_after = 0.0
+        for scope, bucket in buckets:
+            if bucket is not None and bucket.tokens < 1:
+                self.rejected[scope] += 1
+                retry_after = max(retry_after, bucket.wait_time())
+        if retry_after:
+            return retry_after
+        for _, bucket in buckets:
+            if bucket is not None:
+                bucket.tokens -= 1
+        self.allowed += 1
+        return 0.0
+
+    def release(self, socket_key: Hashable) -> None:
+        """Forgets a closed socket's bucket."""
+        self._buckets["socket"].pop(socket_key, None)
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+            "tracked": {scope: len(table) for scope, table in self._buckets.items()},
+            "evicted": self.evicted,
+            "limits": {scope: {"rate": rate, "burst": burst} for scope, (rate, burst) in self.limits.items()},
+        }
+
+
+# Shared by every WebSocket handled by this process, like websocket.manager.
+rate_limiter = RateLimiter()
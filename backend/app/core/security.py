@@ -1,20 +1,27 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from ..db import database, models
 from ..cruds import user_crud
 from ..schemas import schemas
+import hashlib
+import hmac
 import os
+import re
+import unicodedata
+import zlib
 
 # --- Configuration ---
 SECRET_KEY = "a_very_secret_key_that_should_be_in_env_vars"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Usernames (comma separated) allowed to read operational endpoints such as /stats/rate-limits.
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -23,19 +30,101 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 FERNET_KEY = os.getenv("MESSAGE_ENCRYPTION_KEY", "mR8EaAKcQkYDJE8a5oX4GgxJ2RkC0z4qDIaiDpaC0HY=") #Shouldn't be here
 if not FERNET_KEY:
     raise RuntimeError("Please set MESSAGE_ENCRYPTION_KEY in your environment!")
-fernet = Fernet(FERNET_KEY.encode())
+# Retired keys, comma separated. They are only used to decrypt, so they must stay listed
+# until `python -m app.jobs.rotate_message_keys` has re-encrypted every message.
+OLD_FERNET_KEYS = [key.strip() for key in os.getenv("MESSAGE_DECRYPTION_KEYS", "").split(",") if key.strip()]
+
+
+def build_fernet(primary_key: str, old_keys: List[str] = ()) -> MultiFernet:
+    """Encrypts with the primary key and decrypts with any of the keys, primary first."""
+    return MultiFernet([Fernet(key.encode()) for key in [primary_key, *old_keys]])
+
+
+fernet = build_fernet(FERNET_KEY, OLD_FERNET_KEYS)
+
+
+# --- Payload envelope ---
+# What goes inside the Fernet token is either raw UTF-8 (short messages, and everything
+# written before compression existed) or an envelope: one version byte followed by the
+# compressed UTF-8. The version bytes come from 0xF8-0xFF, which never start valid UTF-8,
+# so old tokens keep decrypting unchanged.
+ENVELOPE_ZLIB = 0xF8
+ENVELOPE_ZSTD = 0xF9
+MESSAGE_COMPRESSION_THRESHOLD = int(os.getenv("MESSAGE_COMPRESSION_THRESHOLD", "512"))
+# Codec for new messages: "zlib" or "zstd". Every instance that may read a message must
+# be able to decode it, so switch to zstd only once all of them have zstandard installed.
+MESSAGE_COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "zlib")
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always available
+    zstandard = None
+
+if MESSAGE_COMPRESSION not in ("zlib", "zstd"):
+    raise ValueError(f"MESSAGE_COMPRESSION must be 'zlib' or 'zstd', not {MESSAGE_COMPRESSION!r}")
+if MESSAGE_COMPRESSION == "zstd" and zstandard is None:
+    raise RuntimeError("MESSAGE_COMPRESSION=zstd needs the 'zstandard' package")
+
+
+def pack_payload(plaintext: str) -> bytes:
+    """UTF-8 encodes the text, compressing it when it is long enough and it actually helps."""
+    raw = plaintext.encode("utf-8")
+    if len(raw) < MESSAGE_COMPRESSION_THRESHOLD:
+        return raw
+    if MESSAGE_COMPRESSION == "zstd":
+        packed = bytes([ENVELOPE_ZSTD]) + zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        packed = bytes([ENVELOPE_ZLIB]) + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else raw
+
+
+def unpack_payload(data: bytes) -> str:
+    if data and data[0] == ENVELOPE_ZLIB:
+        data = zlib.decompress(data[1:])
+    elif data and data[0] == ENVELOPE_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Message was compressed with zstd; install the 'zstandard' package")
+        data = zstandard.ZstdDecompressor().decompress(data[1:])
+    return data.decode("utf-8")
 
 
 def encrypt_message(plaintext: str) -> str:
     """Encrypt a UTF-8 string → URL-safe base64 token."""
-    token = fernet.encrypt(plaintext.encode("utf-8"))
+    token = fernet.encrypt(pack_payload(plaintext))
     return token.decode("utf-8")
 
 
 def decrypt_message(token: str) -> str:
     """Decrypt a URL-safe base64 token → original UTF-8 string."""
-    plaintext = fernet.decrypt(token.encode("utf-8"))
-    return plaintext.decode("utf-8")
+    return unpack_payload(fernet.decrypt(token.encode("utf-8")))
+
+
+def decrypt_messages(tokens: List[str]) -> List[str]:
+    """Decrypt a batch of tokens, keeping the input order."""
+    decrypt = fernet.decrypt
+    return [unpack_payload(decrypt(token.encode("utf-8"))) for token in tokens]
+
+# Key for the blind keyword index. It must differ from the Fernet key: the index only
+# ever stores keyed hashes of terms, never the terms themselves.
+MESSAGE_INDEX_KEY = os.getenv("MESSAGE_INDEX_KEY", "Vt4h2m8dJr0wq3QeLk9ZcX7yPbN6sUaF") #Shouldn't be here
+MAX_INDEXED_TERMS = 256
+_TERM_PATTERN = re.compile(r"\w{2,}")
+
+
+def normalize_terms(text: str) -> List[str]:
+    """Splits text into unique, case-folded, accent-stripped words, in first-seen order."""
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return list(dict.fromkeys(_TERM_PATTERN.findall(folded)))[:MAX_INDEXED_TERMS]
+
+
+def blind_index_tokens(text: str) -> List[str]:
+    """Keyed HMAC-SHA256 (truncated to 128 bits) of every normalized term in the text."""
+    key = MESSAGE_INDEX_KEY.encode("utf-8")
+    return [
+        hmac.new(key, term.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+        for term in normalize_terms(text)
+    ]
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -69,6 +158,11 @@ def get_current_user(db: Session = Depends(database.get_db), token: str = Depend
         raise credentials_exception
     return user
 
+def get_current_admin(current_user: models.User = Depends(get_current_user)) -> models.User:
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
 def get_user_from_token(db: Session, token: str) -> Optional[models.User]:
     """Helper for WebSocket auth"""
     try:
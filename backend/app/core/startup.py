@@ -0,0 +1,44 @@
+"""
+Startup timing for this worker: how long importing the app, connecting to the
+database, checking the schema version and warming the pool took. Logged once at the
+end of the lifespan startup and served at GET /stats/startup.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Set when the `app` package is first imported (app/__init__.py imports this module
+# first), so "import" covers the framework and every app module.
+IMPORT_STARTED = time.perf_counter()
+
+_phases: Dict[str, float] = {}
+
+
+def imports_done() -> None:
+    _phases.setdefault("import", time.perf_counter() - IMPORT_STARTED)
+
+
+@contextmanager
+def phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = time.perf_counter() - started
+
+
+def report() -> dict:
+    phases_ms = {name: round(seconds * 1000, 1) for name, seconds in _phases.items()}
+    return {"pid": os.getpid(), "phases_ms": phases_ms, "total_ms": round(sum(phases_ms.values()), 1)}
+
+
+def log_report() -> None:
+    timings = report()
+    logger.info(
+        "Worker %d ready in %.0f ms (%s)", timings["pid"], timings["total_ms"],
+        ", ".join(f"{name} {ms:.0f} ms" for name, ms in timings["phases_ms"].items()),
+    )
@@ -1,11 +1,20 @@
-from ..core.security import decrypt_message, encrypt_message
-from sqlalchemy.orm import Session
+from ..core.security import blind_index_tokens, decrypt_message, decrypt_messages, encrypt_message
+from sqlalchemy.orm import Session, aliased
 from ..schemas import schemas
-from ..db import models
+from ..db import models, segments
 import uuid
+from typing import List, Optional
 from datetime import datetime
-from sqlalchemy import and_, func, update
+from sqlalchemy import and_, case, func, insert, or_, select, union_all, update
 from datetime import datetime, timezone 
+import os
+
+# Rows fetched (and decrypted) per round-trip when streaming a conversation export.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+# Characters of the newest message kept (encrypted) on the conversation for the inbox.
+MESSAGE_PREVIEW_LENGTH = int(os.getenv("MESSAGE_PREVIEW_LENGTH", "100"))
+# Conversations per get_latest_messages query (SQLite allows at most 500 UNION members).
+LATEST_MESSAGES_CHUNK = 200
 
 def create_conversation(db: Session, conversation: schemas.ConversationCreate, creator_id: uuid.UUID):
     # Check for existing 1-on-1 conversation to prevent duplicates
@@ -13,15 +22,18 @@ def create_conversation(db: Session, conversation: schemas.ConversationCreate, c
         other_user_id = conversation.user_ids[0]
         # Query for a non-group conversation that has exactly 2 participants,
         # and those participants are the current user and the other user.
+        # Starts from the creator's memberships (participants primary key) and probes
+        # the other user's, instead of grouping every 1-on-1 in the table.
+        mine, theirs = aliased(models.Participant), aliased(models.Participant)
+        member_count = select(func.count()).where(
+            models.Participant.conversation_id == models.Conversation.id
+        ).scalar_subquery()
         existing_convo = db.query(models.Conversation)\
-            .join(models.Participant)\
-            .filter(models.Conversation.is_group_chat == False)\
-            .group_by(models.Conversation.id)\
-            .having(and_(
-                func.count(models.Participant.user_id) == 2,
-                func.bool_and(models.Participant.user_id.in_([creator_id, other_user_id]))
-            )).first()
-        
+            .join(mine, and_(mine.conversation_id == models.Conversation.id, mine.user_id == creator_id))\
+            .join(theirs, and_(theirs.conversation_id == models.Conversation.id, theirs.user_id == other_user_id))\
+            .filter(models.Conversation.is_group_chat == False, member_count == 2)\
+            .first() if other_user_id != creator_id else None
+
         if existing_convo:
             return existing_convo
 
@@ -45,24 +57,105 @@ def create_conversation(db: Session, conversation: schemas.ConversationCreate, c
     return db_convo
 
 
-def get_user_conversations(db: Session, user_id: uuid.UUID):
-    user_conversations = db.query(models.Conversation).join(models.Participant).filter(models.Participant.user_id == user_id).all()
+def get_user_conversations(db: Session, user_id: uuid.UUID, limit: Optional[int] = None):
+    """
+    The user's inbox as plain tuples, in two queries regardless of its size:
+    (id, name, is_group_chat, last_message_at, has_unread, participants, last_message),
+    where participants is a list of (user_id, username) and last_message is
+    (message_id, sender_id, sender_username, preview) or None. Most recently active
+    first; `limit` keeps only the top of the inbox.
+    """
+    sender = aliased(models.User)
+    convo_rows = db.execute(
+        select(
+            models.Conversation.id,
+            models.Conversation.name,
+            models.Conversation.is_group_chat,
+            models.Conversation.last_message_at,
+            models.Participant.last_read_timestamp,
+            models.Conversation.last_message_id,
+            sender.id,
+            sender.username,
+            models.Conversation.last_message_preview,
+        )
+        .join(models.Participant, models.Participant.conversation_id == models.Conversation.id)
+        .outerjoin(sender, sender.id == models.Conversation.last_message_sender_id)
+        .where(models.Participant.user_id == user_id)
+        .order_by(models.Conversation.last_message_at.desc().nulls_last(), models.Conversation.id)
+        .limit(limit)
+    ).all()
+    participants = get_conversation_participants(db, [row[0] for row in convo_rows])
+    with_preview = [row for row in convo_rows if row.last_message_preview is not None]
+    previews = dict(zip(
+        (row.id for row in with_preview),
+        decrypt_messages([row.last_message_preview for row in with_preview]),
+    ))
+
     aware_min_dt = datetime.min.replace(tzinfo=timezone.utc)
-    for convo in user_conversations:
-        participant_entry = db.query(models.Participant).filter(
-            models.Participant.user_id == user_id,
-            models.Participant.conversation_id == convo.id
-        ).first()
+    conversations = []
+    for convo_id, name, is_group_chat, last_message_raw, last_read_raw, message_id, sender_id, sender_username, _ in convo_rows:
         # normalize both sides to UTC‐aware
-        last_read_raw    = participant_entry.last_read_timestamp
-        last_message_raw = convo.last_message_at
-
         last_read    = _ensure_aware(last_read_raw)    or aware_min_dt
         last_message = _ensure_aware(last_message_raw) or aware_min_dt
+        preview = (message_id, sender_id, sender_username, previews[convo_id]) if convo_id in previews else None
+        conversations.append(
+            (convo_id, name, is_group_chat, last_message_raw, last_message > last_read, participants.get(convo_id, []), preview)
+        )
+    return conversations
+
 
-        convo.has_unread = (last_message > last_read)
+def get_conversation_participants(db: Session, conversation_ids: List[uuid.UUID]):
+    """Maps each conversation id to its [(user_id, username)] in one query."""
+    if not conversation_ids:
+        return {}
+    rows = db.execute(
+        select(models.Participant.conversation_id, models.User.id, models.User.username)
+        .join(models.User, models.User.id == models.Participant.user_id)
+        .where(models.Participant.conversation_id.in_(conversation_ids))
+        .order_by(models.Participant.conversation_id, models.Participant.user_id)
+    ).all()
+    participants = {}
+    for convo_id, participant_id, username in rows:
+        participants.setdefault(convo_id, []).append((participant_id, username))
+    return participants
 
-    return user_conversations
+
+def get_conversation_list_version(db: Session, user_id: uuid.UUID):
+    """
+    A cheap fingerprint of everything get_user_conversations depends on, in one
+    aggregate query: membership count, newest message time and newest read time.
+    Both timestamps only ever move forward, so any change to the list changes it.
+    """
+    return db.query(
+        func.count(models.Participant.conversation_id),
+        func.max(models.Conversation.last_message_at),
+        func.max(models.Participant.last_read_timestamp),
+    ).join(models.Conversation, models.Conversation.id == models.Participant.conversation_id)\
+        .filter(models.Participant.user_id == user_id).one()
+
+
+def get_conversation_history_version(db: Session, conversation_id: uuid.UUID):
+    """
+    Fingerprint of a conversation's history: every stored, archived or restored message
+    bumps history_version, and status changes (read receipts) only happen together
+    with a participant's last_read_timestamp moving forward.
+    """
+    return db.query(
+        models.Conversation.history_version,
+        func.max(models.Participant.last_read_timestamp),
+    ).join(models.Participant, models.Participant.conversation_id == models.Conversation.id)\
+        .filter(models.Conversation.id == conversation_id)\
+        .group_by(models.Conversation.id, models.Conversation.history_version).one_or_none()
+
+
+def bump_history_version(db: Session, conversation_ids: List[uuid.UUID]):
+    """Marks the histories of these conversations as changed (see get_conversation_history_version). Does not commit."""
+    if conversation_ids:
+        db.execute(
+            update(models.Conversation)
+            .where(models.Conversation.id.in_(conversation_ids))
+            .values(history_version=models.Conversation.history_version + 1)
+        )
 
 
 def mark_conversation_as_read(db: Session, user_id: uuid.UUID, conversation_id: uuid.UUID):
@@ -98,12 +191,99 @@ def mark_conversation_as_read(db: Session, user_id: uuid.UUID, conversation_id:
         
     return read_receipts
 
+def _message_rows():
+    """Select for message rows as (id, content, created_at, status, sender_id, sender_username)."""
+    return select(
+        models.Message.id,
+        models.Message.content,
+        models.Message.created_at,
+        models.Message.status,
+        models.User.id,
+        models.User.username,
+    ).join(models.User, models.User.id == models.Message.sender_id)
+
+
+def _decrypt_rows(rows):
+    contents = decrypt_messages([row[1] for row in rows])
+    return [(row[0], content, row[2], row[3], row[4], row[5]) for row, content in zip(rows, contents)]
+
+
+def _with_senders(db: Session, rows):
+    """Adds the sender's username to archived (id, content, created_at, status, sender_id) rows."""
+    sender_ids = {row[4] for row in rows if row[4] is not None}
+    usernames = dict(db.execute(
+        select(models.User.id, models.User.username).where(models.User.id.in_(sender_ids))
+    ).all()) if sender_ids else {}
+    return [(*row, usernames.get(row[4])) for row in rows]
+
+
 def get_conversation_messages(db: Session, conversation_id: uuid.UUID, skip: int = 0, limit: int = 100):
-    messages = db.query(models.Message).filter(models.Message.conversation_id == conversation_id).order_by(models.Message.created_at.asc()).offset(skip).limit(limit).all()
-    for msg in messages:
-        msg.content = decrypt_message(msg.content)
-        print(f"msg {msg.content} ")
-    return messages
+    """
+    A page of history as decrypted message rows (see _message_rows), oldest first.
+    Archived months come before everything still in `messages`, so the page is read
+    from the segment files while `skip` falls inside them and from the table after.
+    """
+    archived, archived_count = segments.read_conversation(db, conversation_id, skip, limit)
+    rows = _with_senders(db, archived) if archived else []
+    if len(rows) < limit:
+        rows += db.execute(
+            _message_rows()
+            .where(models.Message.conversation_id == conversation_id)
+            .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+            .offset(max(0, skip - archived_count)).limit(limit - len(rows))
+        ).all()
+    return _decrypt_rows(rows)
+
+
+def get_latest_messages(db: Session, conversation_ids: List[uuid.UUID], per_conversation: int):
+    """
+    The last `per_conversation` messages of each conversation, batch-decrypted:
+    {conversation_id: [message rows oldest first]}. One UNION ALL query per
+    LATEST_MESSAGES_CHUNK conversations, each member a `LIMIT per_conversation` walk
+    down ix_messages_conversation_order, so the cost does not grow with history.
+    """
+    if not conversation_ids or per_conversation <= 0:
+        return {}
+    latest = {}
+    for start in range(0, len(conversation_ids), LATEST_MESSAGES_CHUNK):
+        members = [
+            select(newest.c) for newest in (
+                _message_rows()
+                .add_columns(models.Message.conversation_id)
+                .where(models.Message.conversation_id == conversation_id)
+                .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+                .limit(per_conversation)
+                .subquery()
+                for conversation_id in conversation_ids[start:start + LATEST_MESSAGES_CHUNK]
+            )
+        ]
+        newest = union_all(*members).subquery()
+        rows = db.execute(
+            select(newest).order_by(newest.c[6], newest.c[2].asc(), newest.c[0].asc())
+        ).all()
+        for row, decrypted in zip(rows, _decrypt_rows(rows)):
+            latest.setdefault(row[6], []).append(decrypted)
+    return latest
+
+
+def iter_conversation_messages(db: Session, conversation_id: uuid.UUID, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Streams a conversation's full history as chunks of plain tuples
+    (id, content, created_at, status, sender_id, sender_username), oldest first.
+    Archived months come first, then the table through a server-side cursor. No ORM
+    objects are built, so memory stays flat however long the conversation is.
+    """
+    for archived in segments.iter_conversation(db, conversation_id):
+        for start in range(0, len(archived), chunk_size):
+            yield _decrypt_rows(_with_senders(db, archived[start:start + chunk_size]))
+    stmt = (
+        _message_rows()
+        .where(models.Message.conversation_id == conversation_id)
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    for partition in db.execute(stmt).partitions():
+        yield _decrypt_rows(partition)
 
 
 def is_user_participant(db: Session, user_id: uuid.UUID, conversation_id: uuid.UUID) -> bool:
@@ -113,21 +293,201 @@ def is_user_participant(db: Session, user_id: uuid.UUID, conversation_id: uuid.U
         models.Participant.conversation_id == conversation_id
     ).first() is not None
 # --- Message CRUD ---
-def create_message(db: Session, message: schemas.MessageCreate, sender_id: uuid.UUID, conversation_id: uuid.UUID):
+def create_message(db: Session, message: schemas.MessageCreate, sender_id: uuid.UUID, conversation_id: uuid.UUID,
+                   client_message_id: Optional[str] = None, message_id: Optional[uuid.UUID] = None):
+    """
+    Stores a message. With a client_message_id the send is idempotent: a retry with the
+    same id returns the message stored the first time. The socket loop passes the id it
+    will also spool the message under if this write times out.
+    """
+    if client_message_id is not None:
+        existing = get_message_by_client_id(db, sender_id, client_message_id)
+        if existing is not None:
+            return existing
+    db_message = _add_message(db, message, sender_id, conversation_id, message_id=message_id,
+                              client_message_id=client_message_id)
+    db.commit()
+    db.refresh(db_message)
+    return db_message
+
+
+def _add_message(db: Session, message: schemas.MessageCreate, sender_id: uuid.UUID, conversation_id: uuid.UUID,
+                 message_id: Optional[uuid.UUID] = None, created_at: Optional[datetime] = None,
+                 client_message_id: Optional[str] = None):
+    """
+    Inserts the message, its search terms, its idempotency key and the conversation's
+    last-message pointer. Does not commit. The timestamp is only given for messages
+    accepted earlier (the spool); otherwise it, and the id unless given, are assigned here.
+    """
     encrypted_content = encrypt_message(message.content)
     db_message = models.Message(
         content=encrypted_content,
         sender_id=sender_id,
         conversation_id=conversation_id
     )
+    if message_id is not None:
+        db_message.id = message_id
+    if created_at is not None:
+        db_message.created_at = created_at
     db.add(db_message)
+    db.flush()
+    index_message_terms(db, db_message.id, conversation_id, message.content)
+    if client_message_id is not None:
+        db.add(models.MessageClientId(sender_id=sender_id, client_message_id=client_message_id, message_id=db_message.id))
     
-    # Update conversation's last_message_at timestamp
-    db.query(models.Conversation).filter(models.Conversation.id == conversation_id).update({"last_message_at": datetime.utcnow()})
-    
+    # Update conversation's last_message_at timestamp and its last-message preview, only
+    # forward: a spooled message drained late is older than what was written meanwhile.
+    # The history version moves either way.
+    sent_at = created_at or datetime.utcnow()
+    newest = models.Conversation.last_message_at
+    is_newer = or_(
+        newest.is_(None),
+        newest < sent_at,
+        and_(newest == sent_at, models.Conversation.last_message_id < db_message.id),
+    )
+    values = {
+        name: case((is_newer, value), else_=getattr(models.Conversation, name))
+        for name, value in last_message_values(db_message.id, sender_id, message.content, sent_at).items()
+    }
+    values["history_version"] = models.Conversation.history_version + 1
+    db.query(models.Conversation).filter(models.Conversation.id == conversation_id).update(
+        values, synchronize_session="fetch"
+    )
+    return db_message
+
+
+def get_message_by_client_id(db: Session, sender_id: uuid.UUID, client_message_id: str) -> Optional[models.Message]:
+    message_id = db.execute(
+        select(models.MessageClientId.message_id).where(
+            models.MessageClientId.sender_id == sender_id,
+            models.MessageClientId.client_message_id == client_message_id,
+        )
+    ).scalar_one_or_none()
+    return db.get(models.Message, message_id) if message_id is not None else None
+
+
+def store_spooled_messages(db: Session, records: List[dict]) -> List[dict]:
+    """
+    Writes messages accepted by the spool (app/spool.py) in one transaction, keeping
+    their ids and timestamps. Records already in the database, by id or by client
+    message id, are skipped, so replaying a batch is harmless. Returns the records
+    that are in the database afterwards under their own id.
+    """
+    ids = [uuid.UUID(record["id"]) for record in records]
+    present = set(db.execute(select(models.Message.id).where(models.Message.id.in_(ids))).scalars())
+    persisted = []
+    for message_id, record in zip(ids, records):
+        sender_id = uuid.UUID(record["sender_id"])
+        client_message_id = record.get("client_message_id")
+        if message_id not in present:
+            if client_message_id is not None and get_message_by_client_id(db, sender_id, client_message_id) is not None:
+                continue  # the client's retry reached the database by another path first
+            _add_message(
+                db, schemas.MessageCreate(content=decrypt_message(record["content"])), sender_id,
+                uuid.UUID(record["conversation_id"]), message_id=message_id,
+                created_at=datetime.fromisoformat(record["created_at"]), client_message_id=client_message_id,
+            )
+            present.add(message_id)
+        persisted.append(record)
+    db.commit()
+    return persisted
+
+
+# --- Attachment CRUD ---
+def create_attachment_message(
+    db: Session,
+    conversation_id: uuid.UUID,
+    sender_id: uuid.UUID,
+    caption: str,
+    sha256: str,
+    size: int,
+    filename: str,
+    content_type: str,
+):
+    """
+    Creates the message that carries an uploaded file and the attachment row pointing at
+    its blob, in one transaction. The caption (or the file name) is the message content,
+    so the file shows up in history, previews and search like any other message.
+    """
+    db_message = _add_message(db, schemas.MessageCreate(content=caption or filename), sender_id, conversation_id)
+    db_attachment = models.Attachment(
+        conversation_id=conversation_id,
+        message_id=db_message.id,
+        uploader_id=sender_id,
+        sha256=sha256,
+        size=size,
+        filename=filename,
+        content_type=content_type,
+    )
+    db.add(db_attachment)
     db.commit()
     db.refresh(db_message)
-    return db_message
+    db.refresh(db_attachment)
+    return db_message, db_attachment
+
+
+def get_attachment(db: Session, conversation_id: uuid.UUID, attachment_id: uuid.UUID) -> Optional[models.Attachment]:
+    return db.execute(
+        select(models.Attachment).where(
+            models.Attachment.id == attachment_id,
+            models.Attachment.conversation_id == conversation_id,
+        )
+    ).scalar_one_or_none()
+
+
+def get_conversation_attachments(db: Session, conversation_id: uuid.UUID, limit: int = 100,
+                                 before: Optional[uuid.UUID] = None) -> List[models.Attachment]:
+    """Newest first; `before` is the last id of the previous page (ids are time-ordered)."""
+    stmt = select(models.Attachment).where(models.Attachment.conversation_id == conversation_id)
+    if before is not None:
+        stmt = stmt.where(models.Attachment.id < before)
+    return db.execute(stmt.order_by(models.Attachment.id.desc()).limit(limit)).scalars().all()
+
+
+def last_message_values(message_id: uuid.UUID, sender_id: uuid.UUID, plaintext: str, sent_at: datetime) -> dict:
+    """Column values for the denormalized last-message pointer on a conversation."""
+    return {
+        "last_message_at": sent_at,
+        "last_message_id": message_id,
+        "last_message_sender_id": sender_id,
+        "last_message_preview": encrypt_message(plaintext[:MESSAGE_PREVIEW_LENGTH]),
+    }
+
+
+def index_message_terms(db: Session, message_id: uuid.UUID, conversation_id: uuid.UUID, plaintext: str):
+    """Writes the blind index rows for one message in a single batched INSERT. Does not commit."""
+    rows = [
+        {"conversation_id": conversation_id, "token": token, "message_id": message_id}
+        for token in blind_index_tokens(plaintext)
+    ]
+    if rows:
+        db.execute(insert(models.MessageTerm), rows)
+
+
+def search_conversation_messages(db: Session, conversation_id: uuid.UUID, query: str, limit: int = 50):
+    """
+    Finds messages containing every term of the query, newest first. Only the postings
+    for the query's tokens are read from the index, then just the hits are decrypted.
+    """
+    tokens = blind_index_tokens(query)
+    if not tokens:
+        return []
+    matching_ids = (
+        select(models.MessageTerm.message_id)
+        .where(
+            models.MessageTerm.conversation_id == conversation_id,
+            models.MessageTerm.token.in_(tokens),
+        )
+        .group_by(models.MessageTerm.message_id)
+        .having(func.count() == len(tokens))
+    )
+    rows = db.execute(
+        _message_rows()
+        .where(models.Message.id.in_(matching_ids))
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(limit)
+    ).all()
+    return _decrypt_rows(rows)
 
 
 def _ensure_aware(dt):
@@ -1,10 +1,17 @@
 
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, literal, or_
+from typing import Optional
 from ..db import models
 from ..schemas import schemas
-from ..core.security import get_password_hash
+from ..core import security
 import uuid
 
+# Must match the expression of the ix_users_search_trgm index in models.py.
+USER_SEARCH_TEXT = func.lower(
+    models.User.username + literal(" ") + func.coalesce(models.User.full_name, "") + literal(" ") + models.User.email
+)
+
 def get_user(db: Session, user_id: uuid.UUID):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
@@ -17,8 +24,51 @@ def get_user_by_username(db: Session, username: str):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _prefix_match(expr, term: str, dialect: str):
+    # Postgres serves LIKE 'term%' from the text_pattern_ops indexes. SQLite only turns
+    # LIKE into an index range for NOCASE columns, so spell the range out instead.
+    if dialect == "postgresql":
+        return expr.like(f"{_escape_like(term)}%", escape="\\")
+    return and_(expr >= term, expr < term + "\U0010ffff")
+
+def search_users(
+    db: Session,
+    exclude_user_id: uuid.UUID,
+    query: Optional[str] = None,
+    match: str = "prefix",
+    after: Optional[str] = None,
+    limit: int = 100,
+    skip: int = 0,
+):
+    """
+    Keyset-paginated user directory, ordered by username.
+    `prefix` matches the start of username, full name or email through index range scans;
+    `contains` matches anywhere (trigram index on Postgres). `after` is the last username
+    of the previous page. The current user is excluded in SQL so pages are never short.
+    `skip` is the deprecated offset pagination, kept for old clients.
+    """
+    q = db.query(models.User).filter(models.User.id != exclude_user_id)
+    term = (query or "").strip().lower()
+    if term and match == "contains":
+        q = q.filter(USER_SEARCH_TEXT.like(f"%{_escape_like(term)}%", escape="\\"))
+    elif term:
+        dialect = db.get_bind().dialect.name
+        q = q.filter(or_(*(
+            _prefix_match(func.lower(column), term, dialect)
+            for column in (models.User.username, models.User.full_name, models.User.email)
+        )))
+    if after is not None:
+        q = q.filter(models.User.username > after)
+    q = q.order_by(models.User.username)
+    if skip:
+        q = q.offset(skip)
+    return q.limit(limit).all()
+
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+    hashed_password = security.get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -1,25 +1,255 @@
+import contextvars
+import logging
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
 
 # Get the database URL from an environment variable.
 # The default value is for the Docker setup in docker-compose.yml.
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/chatflowdb")
+# Optional read replica for the heavy read endpoints. Unset means everything uses the primary.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+# After a user writes, their reads stay on the primary for this long so they see their own writes.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Carries the signed time of the client's last write, so any worker can pin its reads.
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "10"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+# Connections each worker opens at startup so its first requests do not pay for connecting.
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "2"))
+# Seconds to wait for a new Postgres connection, so an unreachable server is an error, not a hang.
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+
+def _connect_args(url: str) -> dict:
+    return {"connect_timeout": DB_CONNECT_TIMEOUT} if url.startswith("postgresql") else {}
+
 
 # Create the SQLAlchemy engine.
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=_connect_args(SQLALCHEMY_DATABASE_URL))
 
 # Create a SessionLocal class. Each instance of this class will be a database session.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = (
+    create_engine(READ_DATABASE_URL, pool_pre_ping=True, connect_args=_connect_args(READ_DATABASE_URL))
+    if READ_DATABASE_URL else None
+)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else None
+
 # Create a Base class. Our ORM models will inherit from this class.
 Base = declarative_base()
 
+
+class ReplicaRouter:
+    """
+    Decides whether a read-only session comes from the replica or the primary.
+    Falls back to the primary when there is no replica, when the replica failed its
+    last health check, or when the caller wrote recently (read-your-writes).
+
+    A write is remembered in this process, which only helps if the next read reaches
+    the same worker, and handed back to the client as a signed token (write_token).
+    Clients send the token with their reads, so the worker that serves them
+    pins them to the primary too, whichever one it is.
+    """
+
+    def __init__(
+        self,
+        primary: sessionmaker,
+        replica: Optional[sessionmaker],
+        read_your_writes_seconds: float = READ_YOUR_WRITES_SECONDS,
+        health_check_seconds: float = REPLICA_HEALTH_CHECK_SECONDS,
+        max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.health_check_seconds = health_check_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.clock = clock
+        # Write tokens cross processes (and hosts), so they carry wall-clock time.
+        self.wall_clock = wall_clock
+        # writer key -> time until which their reads must go to the primary
+        self._pinned_until: Dict[str, float] = {}
+        self._replica_healthy = True
+        self._checked_at: Optional[float] = None
+        self._check_lock = threading.Lock()
+
+    def note_write(self, key: str) -> Optional[str]:
+        """Pins the writer's reads here and returns the token that pins them elsewhere (None without a replica)."""
+        if self.replica is None:
+            return None
+        now = self.clock()
+        self._pinned_until[key] = now + self.read_your_writes_seconds
+        if len(self._pinned_until) > 10_000:
+            self._pinned_until = {k: t for k, t in self._pinned_until.items() if t > now}
+        return self.write_token(key)
+
+    def write_token(self, key: str) -> str:
+        # security imports this module, so its signing key is looked up here.
+        from ..core.security import ALGORITHM, SECRET_KEY
+        return jwt.encode({"sub": key, "wrote_at": self.wall_clock()}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def written_at(self, token: Optional[str], key: Optional[str]) -> Optional[float]:
+        """When `key` last wrote according to a write token, or None if the token is missing, forged or someone else's."""
+        if not token or key is None:
+            return None
+        from ..core.security import ALGORITHM, SECRET_KEY
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        if claims.get("sub") != key or not isinstance(claims.get("wrote_at"), (int, float)):
+            return None
+        return float(claims["wrote_at"])
+
+    def replica_healthy(self) -> bool:
+        now = self.clock()
+        due = self._checked_at is None or now - self._checked_at >= self.health_check_seconds
+        # Only one request runs the probe; the others use the last known state.
+        if due and self._check_lock.acquire(blocking=False):
+            try:
+                self._replica_healthy = self._probe()
+                self._checked_at = now
+            finally:
+                self._check_lock.release()
+        return self._replica_healthy
+
+    def _probe(self) -> bool:
+        session = self.replica()
+        try:
+            bind = session.get_bind()
+            if bind.dialect.name == "postgresql":
+                lag = session.execute(text(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )).scalar()
+                healthy = lag <= self.max_lag_seconds
+            else:
+                session.execute(text("SELECT 1"))
+                healthy = True
+        except Exception as e:
+            logger.warning("Read replica unavailable, using the primary: %s", type(e).__name__)
+            healthy = False
+        finally:
+            session.close()
+        return healthy
+
+    def session_for(self, key: Optional[str] = None, written_at: Optional[float] = None) -> Session:
+        if self.replica is None:
+            return self.primary()
+        if key is not None and self._pinned_until.get(key, 0) > self.clock():
+            return self.primary()
+        if written_at is not None and self.wall_clock() - written_at < self.read_your_writes_seconds:
+            return self.primary()
+        if not self.replica_healthy():
+            return self.primary()
+        return self.replica()
+
+
+replica_router = ReplicaRouter(SessionLocal, ReadSessionLocal)
+
+
+def check_connection() -> None:
+    """Opens the first pooled connection and runs a trivial query; fails fast if the database is unreachable."""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def warm_pool(connections: int = DB_POOL_WARMUP) -> int:
+    """Opens `connections` connections at once and returns them to the pool."""
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+# Write tokens issued while handling the current request (see ReadYourWritesMiddleware).
+_request_write_tokens: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "request_write_tokens", default=None
+)
+
+
+def note_write(key: str) -> Optional[str]:
+    """
+    Records that `key` (a username) just wrote, pinning their reads to the primary for a
+    while. Returns the write token; during an HTTP request it is also added to the response.
+    """
+    token = replica_router.note_write(key)
+    tokens = _request_write_tokens.get()
+    if token is not None and tokens is not None:
+        tokens.append(token)
+    return token
+
+
+class ReadYourWritesMiddleware:
+    """Adds the write token to the response of a request that wrote, as READ_YOUR_WRITES_HEADER."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # A list, not a value: sync endpoints run in a copy of this context, so only
+        # mutations are seen here.
+        tokens: List[str] = []
+        reset = _request_write_tokens.set(tokens)
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and tokens:
+                MutableHeaders(scope=message).append(READ_YOUR_WRITES_HEADER, tokens[-1])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            _request_write_tokens.reset(reset)
+
+
+def subject_from_request(request: Request) -> Optional[str]:
+    """
+    The JWT subject of the request, used only to route reads. The signature is not
+    checked here; authentication still happens in get_current_user.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
 # Dependency to get a DB session. This will be used in API endpoints.
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency for read-only endpoints: a replica session when it is safe to use one.
+def get_read_db(request: Request):
+    key = subject_from_request(request)
+    written_at = replica_router.written_at(request.headers.get(READ_YOUR_WRITES_HEADER), key)
+    db = replica_router.session_for(key, written_at)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,121 @@
+"""
+Schema migrations outside the request-serving process.
+
+Deploys run `python -m app.db.migrate` once, before any worker starts. It applies the
+Alembic revisions under migrations/ up to head. On Postgres it holds an advisory lock
+while doing so, so concurrent deploy jobs take turns instead of racing. Workers never
+create tables. At boot they only compare the database's revision with SCHEMA_REVISION
+(check_schema_version). That takes one query against alembic_version and does not
+load Alembic.
+
+    python -m app.db.migrate [--check]
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Head of migrations/versions. Bump it with every new revision; tests/migrations_test.py
+# fails while it is out of date.
+SCHEMA_REVISION = "0007"
+# Set to 0 to skip the boot-time check (tests that build the schema with create_all).
+SCHEMA_VERSION_CHECK = os.getenv("SCHEMA_VERSION_CHECK", "1") != "0"
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+# Arbitrary key for pg_advisory_lock; only migrate runs take it.
+MIGRATION_LOCK_KEY = 0x43484154
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def _config(connection: Optional[Connection] = None):
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["configure_logger"] = False
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def head_revision() -> str:
+    """The head of the revision scripts, read with Alembic."""
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(_config()).get_current_head()
+
+
+def current_revision(connection: Connection) -> Optional[str]:
+    if not inspect(connection).has_table("alembic_version"):
+        return None
+    return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def check_schema_version(engine: Engine) -> str:
+    """Raises SchemaVersionError unless the database is at SCHEMA_REVISION."""
+    with engine.connect() as connection:
+        current = current_revision(connection)
+    if current != SCHEMA_REVISION:
+        raise SchemaVersionError(
+            f"Database schema is at revision {current or 'none'} but this build expects {SCHEMA_REVISION}. "
+            "Run `python -m app.db.migrate` before starting the app."
+        )
+    return current
+
+
+def upgrade(engine: Engine) -> str:
+    """Migrates the database to head and returns the revision it ended at."""
+    from alembic import command
+
+    with engine.connect() as connection:
+        postgres = connection.dialect.name == "postgresql"
+        if postgres:
+            connection.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_KEY})")
+            connection.commit()
+        try:
+            before = current_revision(connection)
+            # End the transaction that read opened: Alembic must begin its own, or
+            # revisions that build indexes CONCURRENTLY cannot leave it.
+            connection.commit()
+            command.upgrade(_config(connection), "head")
+            connection.commit()
+            after = current_revision(connection)
+        finally:
+            if postgres:
+                connection.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_KEY})")
+                connection.commit()
+    if before == after:
+        logger.info("Schema already at %s", after)
+    else:
+        logger.info("Schema migrated from %s to %s", before or "empty", after)
+    return after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations up to head.")
+    parser.add_argument("--check", action="store_true", help="only report whether the schema is current")
+    args = parser.parse_args()
+
+    from . import database
+
+    logging.basicConfig(level=logging.INFO)
+    if args.check:
+        try:
+            logger.info("Schema is current at %s", check_schema_version(database.engine))
+        except SchemaVersionError as e:
+            logger.error("%s", e)
+            sys.exit(1)
+    else:
+        upgrade(database.engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 
 import uuid
-from sqlalchemy import Boolean, Column, String, Text, ForeignKey, TIMESTAMP, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Boolean, Column, DDL, Integer, String, Text, ForeignKey, TIMESTAMP, Enum, Index, Uuid, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
+from ..core.ids import uuid7
 import enum
 
 class MessageStatus(enum.Enum):
@@ -14,7 +14,7 @@ class MessageStatus(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True, nullable=False)
     username = Column(String, unique=True, index=True, nullable=False)
     full_name = Column(String)
@@ -22,21 +22,51 @@ class User(Base):
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     avatar_url = Column(String, nullable=True)
 
+    __table_args__ = (
+        # Expression indexes serve the case-insensitive prefix search in user_crud.search_users.
+        # text_pattern_ops lets Postgres use them for LIKE 'term%' under any collation.
+        Index("ix_users_username_lower", func.lower(username).label("username_lower"),
+              postgresql_ops={"username_lower": "text_pattern_ops"}),
+        Index("ix_users_full_name_lower", func.lower(full_name).label("full_name_lower"),
+              postgresql_ops={"full_name_lower": "text_pattern_ops"}),
+        Index("ix_users_email_lower", func.lower(email).label("email_lower"),
+              postgresql_ops={"email_lower": "text_pattern_ops"}),
+    )
+
+# Substring search on Postgres is served by a trigram index over the same expression
+# user_crud.USER_SEARCH_TEXT builds. SQLite has no equivalent and falls back to a scan.
+event.listen(User.__table__, "after_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+event.listen(User.__table__, "after_create", DDL(
+    "CREATE INDEX IF NOT EXISTS ix_users_search_trgm ON users "
+    "USING gin ((lower(username || ' ' || coalesce(full_name, '') || ' ' || email)) gin_trgm_ops)"
+).execute_if(dialect="postgresql"))
+
 class Conversation(Base):
     __tablename__ = "conversations"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid7)
     name = Column(String, nullable=True) # For group chats
     is_group_chat = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     last_message_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Denormalized pointer to the newest message, written by chat_crud.create_message in
+    # the same transaction as the message, so the inbox can show a preview without
+    # reading `messages`. No foreign key to messages, like message_terms.
+    last_message_id = Column(Uuid, nullable=True)
+    last_message_sender_id = Column(Uuid, ForeignKey("users.id"), nullable=True)
+    last_message_preview = Column(Text, nullable=True)  # encrypted, like messages.content
+    # Bumped whenever the conversation's history changes in a way last_message_at does not
+    # show: every stored message (a drained spool record may land between older ones)
+    # and every archive or restore of its messages. Part of the history ETag.
+    history_version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    participants = relationship("Participant", back_populates="conversation")
+    participants = relationship("Participant", back_populates="conversation", order_by="Participant.user_id")
     messages = relationship("Message", back_populates="conversation")
 
 class Participant(Base):
     __tablename__ = "participants"
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), primary_key=True)
+    user_id = Column(Uuid, ForeignKey("users.id"), primary_key=True)
+    # The primary key leads with user_id; members of a conversation need their own index.
+    conversation_id = Column(Uuid, ForeignKey("conversations.id"), primary_key=True, index=True)
     
     user = relationship("User")
     conversation = relationship("Conversation", back_populates="participants")
@@ -44,11 +74,83 @@ class Participant(Base):
 
 class Message(Base):
     __tablename__ = "messages"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Time-ordered ids: inserts append to the primary-key index, and (created_at, id)
+    # is a unique, stable order for history even when created_at ties.
+    # On Postgres, migration 0003 partitions the table by month of created_at
+    # (app/db/partitions.py), and its primary key there is (id, created_at).
+    id = Column(Uuid, primary_key=True, default=uuid7)
     content = Column(Text, nullable=False)
-    sender_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"))
+    sender_id = Column(Uuid, ForeignKey("users.id"))
+    conversation_id = Column(Uuid, ForeignKey("conversations.id"))
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     status = Column(Enum(MessageStatus), default=MessageStatus.sent, nullable=False)
     sender = relationship("User")
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_messages_conversation_order", conversation_id, created_at, id),
+    )
+
+class MessageTerm(Base):
+    """
+    Blind keyword index: one row per (conversation, HMAC of a term, message).
+    The primary key doubles as the lookup index for per-conversation search.
+    No foreign key to messages, so the index can be rebuilt independently.
+    """
+    __tablename__ = "message_terms"
+    conversation_id = Column(Uuid, primary_key=True)
+    token = Column(String(32), primary_key=True)
+    message_id = Column(Uuid, primary_key=True)
+
+
+class MessageClientId(Base):
+    """
+    Idempotency keys: the id a client gave a message, per sender. A retried send with
+    the same key returns the stored message instead of a copy. A table of its own
+    because a unique index on the partitioned `messages` table would have to include
+    created_at.
+    """
+    __tablename__ = "message_client_ids"
+    sender_id = Column(Uuid, primary_key=True)
+    client_message_id = Column(String(64), primary_key=True)
+    message_id = Column(Uuid, nullable=False)
+
+
+class Attachment(Base):
+    """
+    A file sent in a conversation, shown with the message created for it. The bytes
+    live in the content-addressed store (app/core/blob_store.py) under `sha256`, so
+    identical files uploaded twice share one blob. No foreign key to messages, like
+    message_terms: messages may be partitioned or archived.
+    """
+    __tablename__ = "attachments"
+    id = Column(Uuid, primary_key=True, default=uuid7)
+    conversation_id = Column(Uuid, ForeignKey("conversations.id"), nullable=False)
+    message_id = Column(Uuid, nullable=False)
+    uploader_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_attachments_conversation_id", conversation_id, id),
+    )
+
+
+class MessageSegment(Base):
+    """
+    A month of messages moved out of `messages` into a read-only segment file
+    (app/db/segments.py) by app.jobs.archive_messages. The registry row and the
+    deletion of the month's rows commit together, so history reads see each message
+    in exactly one place.
+    """
+    __tablename__ = "message_segments"
+    period_start = Column(TIMESTAMP(timezone=True), primary_key=True)
+    period_end = Column(TIMESTAMP(timezone=True), nullable=False)
+    file_name = Column(String, nullable=False)  # under MESSAGE_ARCHIVE_DIR
+    message_count = Column(Integer, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
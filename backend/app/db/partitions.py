@@ -0,0 +1,106 @@
+"""
+Monthly time ranges of `messages`.
+
+On Postgres, migration 0003 makes `messages` a table partitioned by RANGE (created_at).
+It has one partition per calendar month (UTC) plus a DEFAULT partition that catches
+anything no monthly partition covers. The archive job creates partitions a few months
+ahead. Queries that filter on created_at are pruned to the months they touch, and a
+whole month can be dropped by detaching its partition.
+
+Limitation: SQLite (development and tests) gets no table-per-month layout. It has no
+declarative partitioning, and emulating it with one table per month behind a UNION ALL
+view would need INSTEAD OF triggers for every write. There `messages` stays a single
+table: queries are not pruned to the months they touch, and archiving a month deletes
+its rows by created_at range instead of dropping a table, so the file only shrinks
+after a VACUUM. The same month boundaries still decide what the archive job moves out.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+# How many months past the current one get an empty partition in advance.
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+DEFAULT_PARTITION = "messages_default"
+
+
+def month_start(dt: datetime) -> datetime:
+    """First instant of dt's month, in UTC. Naive datetimes are taken to be UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(start: datetime, months: int) -> datetime:
+    index = start.year * 12 + start.month - 1 + months
+    return start.replace(year=index // 12, month=index % 12 + 1)
+
+
+def months_between(start: datetime, end: datetime) -> Iterator[Tuple[datetime, datetime]]:
+    """(month_start, next_month_start) for every month overlapping [start, end)."""
+    current = month_start(start)
+    while current < end:
+        following = add_months(current, 1)
+        yield current, following
+        current = following
+
+
+def partition_name(start: datetime) -> str:
+    return f"messages_p{start:%Y_%m}"
+
+
+def ensure_partitions(connection: Connection, start: datetime, end: datetime) -> List[str]:
+    """
+    Creates the monthly partitions covering [start, end) that do not exist yet and
+    returns their names. Postgres only. Rows of a month that already landed in the
+    DEFAULT partition (the job did not run for a while) are moved into the new one.
+    """
+    created = []
+    for lower, upper in months_between(start, end):
+        name = partition_name(lower)
+        exists = connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists is None:
+            bounds = {"lower": lower, "upper": upper}
+            stranded = connection.execute(text(
+                f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE created_at >= :lower AND created_at < :upper"
+            ), bounds).scalar()
+            if stranded:
+                # Postgres refuses to add a partition while the DEFAULT partition holds
+                # rows in its range, so take the DEFAULT out while they are moved.
+                connection.execute(text(f"ALTER TABLE messages DETACH PARTITION {DEFAULT_PARTITION}"))
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF messages "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            ))
+            if stranded:
+                connection.execute(text(
+                    f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} "
+                    "WHERE created_at >= :lower AND created_at < :upper"
+                ), bounds)
+                connection.execute(text(
+                    f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :lower AND created_at < :upper"
+                ), bounds)
+                connection.execute(text(f"ALTER TABLE messages ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+                logger.warning("Moved %d messages from %s into new partition %s", stranded, DEFAULT_PARTITION, name)
+            created.append(name)
+    return created
+
+
+def ensure_upcoming_partitions(connection: Connection, now: datetime, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    current = month_start(now)
+    return ensure_partitions(connection, current, add_months(current, months_ahead + 1))
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages'))"
+    )).scalar())
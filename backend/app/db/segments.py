@@ -0,0 +1,259 @@
+"""
+Read-only segment files holding archived months of messages (see
+app.jobs.archive_messages).
+
+A segment is written once and never modified. It has one zlib-compressed block of
+rows per conversation, followed by an index of fixed-size entries sorted by
+conversation id. Readers memory-map the file and binary-search the index in place.
+Opening a segment therefore reads no rows, and a page of one conversation's history
+decompresses one block. Message contents are stored exactly as in `messages`, so they
+are still encrypted.
+
+    header   magic, flags (bit 0: timestamps were naive UTC), padding
+    block    per row: id, sender_id (16 bytes each), created_at (int64 microseconds
+             since the epoch, UTC), status (uint8), content length (uint32), content
+    index    per conversation: id (16 bytes), block offset (uint64), block length
+             (uint32), row count (uint32)
+    trailer  index offset (uint64), entry count (uint32), magic
+"""
+import hashlib
+import mmap
+import os
+import secrets
+import struct
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Where segment files live. Every app instance must see the same directory.
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "./archive")
+
+MAGIC = b"CFMSEG01"
+FLAG_NAIVE_TIMESTAMPS = 0x01
+_HEADER = struct.Struct("<8sB7x")
+_ROW = struct.Struct("<16s16sqBI")
+_ENTRY = struct.Struct("<16sQII")
+_TRAILER = struct.Struct("<QI8s")
+_STATUSES = list(models.MessageStatus)
+_NIL = bytes(16)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# A stored row is (id, content, created_at, status, sender_id): the message row of
+# chat_crud without the sender's username, which is looked up when reading.
+Row = Tuple[uuid.UUID, str, datetime, models.MessageStatus, Optional[uuid.UUID]]
+
+
+def file_name(period_start: datetime) -> str:
+    """A new name on every archive run, so a month archived again never reuses a path."""
+    return f"messages-{period_start:%Y-%m}-{secrets.token_hex(4)}.seg"
+
+
+def _pack_row(row: Row) -> bytes:
+    message_id, content, created_at, status, sender_id = row
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    data = content.encode("ascii")
+    return _ROW.pack(
+        message_id.bytes, sender_id.bytes if sender_id else _NIL,
+        (created_at - _EPOCH) // _MICROSECOND, _STATUSES.index(status), len(data),
+    ) + data
+
+
+class SegmentWriter:
+    """Writes a segment atomically: to a temporary file that close() fsyncs and renames."""
+
+    def __init__(self, path: str, naive_timestamps: bool):
+        self.path = path
+        self.message_count = 0
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._hash = hashlib.sha256()
+        self._offset = 0
+        self._entries: Dict[bytes, Tuple[int, int, int]] = {}
+        self._write(_HEADER.pack(MAGIC, FLAG_NAIVE_TIMESTAMPS if naive_timestamps else 0))
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._hash.update(data)
+        self._offset += len(data)
+
+    def add_conversation(self, conversation_id: uuid.UUID, rows: List[Row]) -> None:
+        """Appends all of a conversation's rows in this period, in history order."""
+        key = conversation_id.bytes
+        if key in self._entries:
+            raise ValueError(f"Conversation {conversation_id} was already written to this segment")
+        block = zlib.compress(b"".join(_pack_row(row) for row in rows), 6)
+        self._entries[key] = (self._offset, len(block), len(rows))
+        self._write(block)
+        self.message_count += len(rows)
+
+    def close(self) -> Tuple[int, str]:
+        """Finishes the file and moves it into place. Returns (size in bytes, sha256)."""
+        index_offset = self._offset
+        for key in sorted(self._entries):
+            self._write(_ENTRY.pack(key, *self._entries[key]))
+        self._write(_TRAILER.pack(index_offset, len(self._entries), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        return self._offset, self._hash.hexdigest()
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class SegmentReader:
+    """A memory-mapped segment. Safe to share between threads: nothing is mutated after open."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size + _TRAILER.size:
+            raise ValueError(f"{path} is not a message segment")
+        magic, flags = _HEADER.unpack_from(self._map, 0)
+        self._index_offset, self._count, trailer_magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != MAGIC or trailer_magic != MAGIC:
+            raise ValueError(f"{path} is not a message segment")
+        self._naive = bool(flags & FLAG_NAIVE_TIMESTAMPS)
+
+    def _entry_at(self, position: int) -> Tuple[bytes, int, int, int]:
+        return _ENTRY.unpack_from(self._map, self._index_offset + position * _ENTRY.size)
+
+    def _find(self, conversation_id: uuid.UUID) -> Optional[Tuple[int, int, int]]:
+        key = conversation_id.bytes
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry_at(middle)
+            if entry[0] < key:
+                low = middle + 1
+            elif entry[0] > key:
+                high = middle
+            else:
+                return entry[1:]
+        return None
+
+    def count(self, conversation_id: uuid.UUID) -> int:
+        entry = self._find(conversation_id)
+        return entry[2] if entry else 0
+
+    def rows(self, conversation_id: uuid.UUID, skip: int = 0, limit: Optional[int] = None) -> List[Row]:
+        """The conversation's rows in history order, from `skip`, at most `limit` of them."""
+        entry = self._find(conversation_id)
+        if entry is None:
+            return []
+        offset, length, _ = entry
+        return self._parse(zlib.decompress(self._map[offset:offset + length]), skip, limit)
+
+    def conversations(self) -> Iterator[Tuple[uuid.UUID, List[Row]]]:
+        """Every conversation in the segment with all its rows, in index order."""
+        for position in range(self._count):
+            key, offset, length, _ = self._entry_at(position)
+            yield uuid.UUID(bytes=key), self._parse(zlib.decompress(self._map[offset:offset + length]))
+
+    def _parse(self, block: bytes, skip: int = 0, limit: Optional[int] = None) -> List[Row]:
+        rows = []
+        position = 0
+        index = 0
+        while position < len(block) and (limit is None or len(rows) < limit):
+            message_id, sender_id, micros, status, length = _ROW.unpack_from(block, position)
+            position += _ROW.size
+            if index >= skip:
+                created_at = _EPOCH + micros * _MICROSECOND
+                rows.append((
+                    uuid.UUID(bytes=message_id),
+                    block[position:position + length].decode("ascii"),
+                    created_at.replace(tzinfo=None) if self._naive else created_at,
+                    _STATUSES[status],
+                    uuid.UUID(bytes=sender_id) if sender_id != _NIL else None,
+                ))
+            position += length
+            index += 1
+        return rows
+
+    def close(self) -> None:
+        self._map.close()
+
+
+# Segments never change once written, so open readers are kept, keyed by path and the
+# sha256 in `message_segments`. When a month is restored (and maybe archived again under
+# a new name), its old reader is dropped the next time the registry is read.
+_readers: Dict[Tuple[str, str], SegmentReader] = {}
+_readers_lock = threading.Lock()
+
+
+def segment_path(name: str, archive_dir: Optional[str] = None) -> str:
+    return os.path.join(archive_dir or MESSAGE_ARCHIVE_DIR, name)
+
+
+def open_segment(name: str, sha256: str, archive_dir: Optional[str] = None) -> SegmentReader:
+    key = (segment_path(name, archive_dir), sha256)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is None:
+            reader = _readers[key] = SegmentReader(key[0])
+        return reader
+
+
+def close_segment(name: str, sha256: str, archive_dir: Optional[str] = None) -> None:
+    with _readers_lock:
+        reader = _readers.pop((segment_path(name, archive_dir), sha256), None)
+    if reader is not None:
+        reader.close()
+
+
+def _archived_readers(db: Session) -> List[SegmentReader]:
+    """Readers for every registered segment, oldest month first. One small query."""
+    registry = db.execute(
+        select(models.MessageSegment.file_name, models.MessageSegment.sha256)
+        .order_by(models.MessageSegment.period_start)
+    ).all()
+    live = {(segment_path(name), digest) for name, digest in registry}
+    directory = os.path.dirname(segment_path(""))
+    with _readers_lock:
+        for key in [key for key in _readers if key not in live and os.path.dirname(key[0]) == directory]:
+            # Not closed here: a request on another thread may still be reading it. The
+            # map is released when the last reference goes.
+            del _readers[key]
+    return [open_segment(name, digest) for name, digest in registry]
+
+
+def read_conversation(db: Session, conversation_id: uuid.UUID, skip: int, limit: int) -> Tuple[List[Row], int]:
+    """
+    Up to `limit` archived rows of the conversation starting at `skip`, oldest first,
+    and the total number of archived rows it has. Segments the conversation does not
+    appear in cost one index probe each.
+    """
+    rows: List[Row] = []
+    total = 0
+    for reader in _archived_readers(db):
+        count = reader.count(conversation_id)
+        if count and len(rows) < limit and skip < total + count:
+            rows.extend(reader.rows(conversation_id, max(0, skip - total), limit - len(rows)))
+        total += count
+    return rows, total
+
+
+def iter_conversation(db: Session, conversation_id: uuid.UUID) -> Iterator[List[Row]]:
+    """All archived rows of the conversation, one list per segment, oldest first."""
+    for reader in _archived_readers(db):
+        rows = reader.rows(conversation_id)
+        if rows:
+            yield rows
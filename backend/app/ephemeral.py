@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How often the coalescer pushes typing updates to rooms, in seconds.
+TYPING_FLUSH_INTERVAL = float(os.getenv("TYPING_FLUSH_INTERVAL", "0.5"))
+# A user who has not sent a typing frame for this long is treated as stopped.
+TYPING_TTL = float(os.getenv("TYPING_TTL", "6"))
+
+# Client frame types handled in memory only, never stored. "pong" answers the
+# heartbeat ping; receiving it (like any frame) is what keeps the socket alive.
+# Such frames carry "ephemeral": true, so a chat message whose text merely looks like
+# one (sent as a raw text frame) is still stored.
+EPHEMERAL_TYPES = {"typing", "pong"}
+
+
+class TypingCoalescer:
+    """
+    In-memory typing state per conversation. Nothing here touches the database.
+    Clients may send a typing frame on every keystroke; only start/stop transitions
+    (and expiries) mark a room dirty, and each dirty room gets at most one update per
+    flush carrying the full list of users currently typing.
+    """
+
+    def __init__(self, ttl: float = TYPING_TTL, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        # conversation_id -> {user_id: expires_at}
+        self._typing: Dict[str, Dict[str, float]] = {}
+        self._dirty: Set[str] = set()
+
+    def update(self, conversation_id: str, user_id: str, is_typing: bool) -> None:
+        room = self._typing.get(conversation_id)
+        if is_typing:
+            if room is None:
+                room = self._typing[conversation_id] = {}
+            if user_id not in room:
+                self._dirty.add(conversation_id)
+            room[user_id] = self.clock() + self.ttl
+        elif room is not None and room.pop(user_id, None) is not None:
+            self._dirty.add(conversation_id)
+            if not room:
+                del self._typing[conversation_id]
+
+    def stats(self) -> dict:
+        return {"rooms": len(self._typing), "pending_updates": len(self._dirty)}
+
+    def typing_users(self, conversation_id: str) -> List[str]:
+        return sorted(self._typing.get(conversation_id, ()))
+
+    def flush(self) -> Iterator[Tuple[str, List[str]]]:
+        """Expires stale entries and yields (conversation_id, user_ids) for every changed room."""
+        now = self.clock()
+        for conversation_id, room in list(self._typing.items()):
+            expired = [user_id for user_id, expires_at in room.items() if expires_at <= now]
+            for user_id in expired:
+                self.update(conversation_id, user_id, False)
+        dirty, self._dirty = self._dirty, set()
+        for conversation_id in dirty:
+            yield conversation_id, self.typing_users(conversation_id)
+
+    async def run(self, broadcast: Callable[[str, str], Awaitable[None]], interval: float = TYPING_FLUSH_INTERVAL) -> None:
+        """Background loop started from the app lifespan; sends one update per changed room per interval."""
+        while True:
+            await asyncio.sleep(interval)
+            for conversation_id, user_ids in self.flush():
+                message = json.dumps({"type": "typing", "conversation_id": conversation_id, "user_ids": user_ids})
+                try:
+                    await broadcast(message, conversation_id)
+                except Exception as e:
+                    logger.warning("Typing update to %s failed: %s", conversation_id, type(e).__name__)
+
+
+def parse_event(data: str):
+    """
+    Returns the ephemeral event in a client frame, or None for an ordinary chat message.
+    Ephemeral frames are JSON objects marked as such, for example
+    {"type": "typing", "ephemeral": true, "typing": true}.
+    """
+    if not data.startswith("{"):
+        return None
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(event, dict) and event.get("ephemeral") is True and event.get("type") in EPHEMERAL_TYPES:
+        return event
+    return None
+
+
+def parse_message(data: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns (content, client_message_id) for a chat message frame: either raw text, or
+    {"type": "message", "content": "...", "client_message_id": "..."} from clients that
+    tag their sends so a retry is not stored twice.
+    """
+    if data.startswith("{"):
+        try:
+            frame = json.loads(data)
+        except ValueError:
+            return data, None
+        if isinstance(frame, dict) and frame.get("type") == "message" and isinstance(frame.get("content"), str):
+            client_message_id = frame.get("client_message_id")
+            return frame["content"], str(client_message_id)[:64] if client_message_id else None
+    return data, None
+
+
+typing_coalescer = TypingCoalescer()
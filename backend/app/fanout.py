@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rooms with at least this many open sockets on this worker are fanned out by the
+# scheduler; smaller rooms are sent to inline by the broadcasting coroutine.
+FANOUT_THRESHOLD = int(os.getenv("FANOUT_THRESHOLD", "500"))
+# Sockets sent to per turn. The event loop runs other work between shards, so this
+# bounds how long one large room can hold it.
+FANOUT_SHARD_SIZE = int(os.getenv("FANOUT_SHARD_SIZE", "100"))
+# Scheduler tasks. Each works on one room at a time, so several large rooms progress
+# side by side while every room's messages still go out in order.
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "2"))
+
+
+class _Job:
+    __slots__ = ("message", "sockets", "position", "submitted_at")
+
+    def __init__(self, message: str, sockets: List, submitted_at: float):
+        self.message = message
+        self.sockets = sockets
+        self.position = 0
+        self.submitted_at = submitted_at
+
+
+class FanoutScheduler:
+    """
+    Delivers broadcasts to large rooms a shard at a time. Each room has a FIFO of
+    pending messages, and rooms with work take turns: a worker sends one shard of the
+    room's oldest message, then yields and puts the room at the back of the line. A
+    room with thousands of sockets therefore costs other rooms at most one shard of
+    waiting per turn, instead of the whole loop over its sockets. The broadcasting
+    coroutine returns as soon as the message is queued.
+
+    Membership is snapshotted when a message is submitted; sockets that close before
+    their shard comes up are skipped.
+    """
+
+    def __init__(self, threshold: int = FANOUT_THRESHOLD, shard_size: int = FANOUT_SHARD_SIZE,
+                 is_open: Callable[[object], bool] = lambda websocket: True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.shard_size = shard_size
+        self.is_open = is_open
+        self.clock = clock
+        # conversation_id -> pending messages, oldest first
+        self._rooms: Dict[str, Deque[_Job]] = {}
+        # Rooms waiting for a turn. A room is taken off while a worker sends its shard,
+        # so no two workers hold the same room, which keeps its messages in order.
+        self._ready: Deque[str] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.running = False
+        self.messages = 0
+        self.shards = 0
+        self.failed_sends = 0
+        self.max_delivery_seconds = 0.0
+
+    def should_schedule(self, conversation_id: str, sockets: int) -> bool:
+        """
+        True when a broadcast to the room must go through the scheduler: the room is
+        large, or earlier messages to it are still queued and must go out first.
+        """
+        return self.running and (sockets >= self.threshold or conversation_id in self._rooms)
+
+    def submit(self, conversation_id: str, message: str, sockets: List) -> None:
+        queue = self._rooms.get(conversation_id)
+        if queue is None:
+            queue = self._rooms[conversation_id] = deque()
+            self._ready.append(conversation_id)
+        queue.append(_Job(message, sockets, self.clock()))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _send_shard(self, conversation_id: str) -> None:
+        queue = self._rooms[conversation_id]
+        job = queue[0]
+        shard = job.sockets[job.position:job.position + self.shard_size]
+        job.position += len(shard)
+        for websocket in shard:
+            if not self.is_open(websocket):
+                continue
+            try:
+                await websocket.send_text(job.message)
+            except Exception as e:
+                # A dead socket is reaped by the heartbeat; the rest of the room still gets the message.
+                self.failed_sends += 1
+                logger.debug("Fan-out send to %s failed: %s", conversation_id, type(e).__name__)
+        self.shards += 1
+        if job.position >= len(job.sockets):
+            queue.popleft()
+            self.messages += 1
+            self.max_delivery_seconds = max(self.max_delivery_seconds, self.clock() - job.submitted_at)
+        if queue:
+            self._ready.append(conversation_id)
+        else:
+            del self._rooms[conversation_id]
+
+    async def _worker(self) -> None:
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            conversation_id = self._ready.popleft()
+            try:
+                await self._send_shard(conversation_id)
+            except Exception:
+                logger.exception("Fan-out to %s failed", conversation_id)
+                self._rooms.pop(conversation_id, None)
+            # Let the socket handlers and small-room broadcasts run before the next shard.
+            await asyncio.sleep(0)
+
+    async def run(self, workers: int = FANOUT_WORKERS) -> None:
+        """Background loop started from the app lifespan. Until it runs, every broadcast is sent inline."""
+        self._wakeup = asyncio.Event()
+        self.running = True
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(workers)))
+        finally:
+            self.running = False
+            self._wakeup = None
+            # Shutting down: drop what is still queued rather than hold on to the sockets.
+            self._rooms.clear()
+            self._ready.clear()
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "shard_size": self.shard_size,
+            "rooms_queued": len(self._rooms),
+            "messages_queued": sum(len(queue) for queue in self._rooms.values()),
+            "messages_delivered": self.messages,
+            "shards_sent": self.shards,
+            "failed_sends": self.failed_sends,
+            "max_delivery_ms": round(self.max_delivery_seconds * 1000, 3),
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Callable, Generic, Hashable, List, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Every socket is pinged once per interval and reaped when nothing (pong or any other
+# frame) has arrived for HEARTBEAT_TIMEOUT seconds.
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "25"))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "60"))
+# Granularity of the wheel; each tick handles 1/(interval/tick) of the sockets.
+HEARTBEAT_TICK = float(os.getenv("HEARTBEAT_TICK", "1"))
+
+T = TypeVar("T", bound=Hashable)
+
+
+class TimerWheel(Generic[T]):
+    """
+    Hashed timer wheel with a fixed period: items sit in one of `slots` buckets and
+    the cursor visits one bucket per tick, so every item comes due once per rotation.
+    Adding is O(1); removing probes each slot once, which is bounded by the slot
+    count rather than the number of items and saves a slot-lookup table entry per item.
+    One task drives all items.
+    """
+
+    def __init__(self, slots: int):
+        self.slots: List[Set[T]] = [set() for _ in range(max(1, slots))]
+        self.cursor = 0
+        self._size = 0
+
+    def add(self, item: T) -> None:
+        # The slot just behind the cursor, so a new item waits a full rotation.
+        slot = self.slots[(self.cursor - 1) % len(self.slots)]
+        if item not in slot:
+            slot.add(item)
+            self._size += 1
+
+    def remove(self, item: T) -> None:
+        for slot in self.slots:
+            if item in slot:
+                slot.remove(item)
+                self._size -= 1
+                return
+
+    def advance(self) -> List[T]:
+        """Returns the items due at this tick and moves the cursor on."""
+        due = list(self.slots[self.cursor])
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        return due
+
+    def __len__(self) -> int:
+        return self._size
+
+    def occupancy(self) -> dict:
+        sizes = [len(slot) for slot in self.slots]
+        return {"slots": len(sizes), "min": min(sizes), "max": max(sizes)}
+
+
+def wheel_slots(interval: float = HEARTBEAT_INTERVAL, tick: float = HEARTBEAT_TICK) -> int:
+    return max(1, math.ceil(interval / tick))
+
+
+async def run(manager, tick: float = HEARTBEAT_TICK, clock: Callable[[], float] = time.monotonic) -> None:
+    """Background loop started from the app lifespan: one wheel slot per tick."""
+    while True:
+        await asyncio.sleep(tick)
+        try:
+            await manager.check_heartbeats(manager.heartbeat_wheel.advance(), clock())
+        except Exception as e:
+            logger.error("Heartbeat tick failed: %s", type(e).__name__)
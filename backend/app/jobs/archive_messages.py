@@ -0,0 +1,204 @@
+"""
+Moves whole months of old messages out of the database into read-only segment files
+(app/db/segments.py). On Postgres it also creates the upcoming monthly partitions.
+
+A month is archived once it ended more than MESSAGE_HOT_DAYS ago. Its rows are
+streamed in (conversation_id, created_at, id) order into a segment under
+MESSAGE_ARCHIVE_DIR, which is fsynced and renamed into place. Then one transaction
+registers the segment in `message_segments`, removes the rows and their keyword
+index entries, and bumps each conversation's history version (its history ETag). On
+Postgres the month's partition is detached and dropped, and SQLite deletes the range.
+History reads put the segments in front of the table
+(chat_crud.get_conversation_messages), so clients see the same pages as before.
+
+Archived messages are read-only. Read receipts no longer change their status, and
+keyword search and the inbox bootstrap only cover messages still in the table. Restoring
+a month indexes its messages for search again.
+Segments keep the messages encrypted under the key that was current when they were
+written, so restore them before a key rotation and archive them again afterwards.
+Every run writes a new file name, and app servers drop their reader for a segment once
+its registry row is gone, so they pick up the re-archived month without a restart.
+
+    python -m app.jobs.archive_messages [--hot-days N]
+    python -m app.jobs.archive_messages --restore 2025-01
+"""
+import argparse
+import itertools
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from ..core.security import decrypt_message
+from ..cruds import chat_crud
+from ..db import database, models, partitions, segments
+
+logger = logging.getLogger(__name__)
+
+# Months that ended less than this many days ago stay in the database.
+MESSAGE_HOT_DAYS = int(os.getenv("MESSAGE_HOT_DAYS", "180"))
+# Rows fetched per round-trip while writing a segment, and inserted per batch on restore.
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+
+
+def _month_rows(start: datetime, end: datetime):
+    return (
+        models.Message.created_at >= start,
+        models.Message.created_at < end,
+    )
+
+
+def archive_month(db: Session, start: datetime, end: datetime, archive_dir: Optional[str] = None) -> Optional[models.MessageSegment]:
+    """Archives the messages created in [start, end). Returns the new segment, or None if there were none."""
+    name = segments.file_name(start)
+    path = segments.segment_path(name, archive_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    stmt = (
+        select(
+            models.Message.id,
+            models.Message.content,
+            models.Message.created_at,
+            models.Message.status,
+            models.Message.sender_id,
+            models.Message.conversation_id,
+        )
+        .where(*_month_rows(start, end))
+        .order_by(models.Message.conversation_id, models.Message.created_at, models.Message.id)
+        .execution_options(stream_results=True, yield_per=ARCHIVE_BATCH_SIZE)
+    )
+    writer = None
+    try:
+        for conversation_id, rows in itertools.groupby(db.execute(stmt), key=lambda row: row[5]):
+            rows = [tuple(row[:5]) for row in rows]
+            if writer is None:
+                writer = segments.SegmentWriter(path, naive_timestamps=rows[0][2].tzinfo is None)
+            writer.add_conversation(conversation_id, rows)
+            _delete_terms(db, conversation_id, [row[0] for row in rows])
+            chat_crud.bump_history_version(db, [conversation_id])
+        if writer is None:
+            return None
+        size, digest = writer.close()
+    except BaseException:
+        db.rollback()
+        if writer is not None:
+            writer.abort()
+        raise
+
+    segment = models.MessageSegment(
+        period_start=start, period_end=end, file_name=name,
+        message_count=writer.message_count, size_bytes=size, sha256=digest,
+    )
+    db.add(segment)
+    connection = db.connection()
+    if partitions.is_partitioned(connection):
+        partition = partitions.partition_name(start)
+        if connection.execute(text("SELECT to_regclass(:name)"), {"name": partition}).scalar() is not None:
+            connection.execute(text(f"ALTER TABLE messages DETACH PARTITION {partition}"))
+            connection.execute(text(f"DROP TABLE {partition}"))
+    # On Postgres this only reaches rows that landed in the DEFAULT partition.
+    db.execute(delete(models.Message).where(*_month_rows(start, end)))
+    db.commit()
+    logger.info("Archived %d messages from %s into %s (%d bytes)", segment.message_count, f"{start:%Y-%m}", name, size)
+    return segment
+
+
+def _delete_terms(db: Session, conversation_id, message_ids):
+    """Removes the keyword index rows of archived messages, within the conversation's key range."""
+    for i in range(0, len(message_ids), ARCHIVE_BATCH_SIZE):
+        db.execute(delete(models.MessageTerm).where(
+            models.MessageTerm.conversation_id == conversation_id,
+            models.MessageTerm.message_id.in_(message_ids[i:i + ARCHIVE_BATCH_SIZE]),
+        ))
+
+
+def archive_messages(db: Session, cutoff: datetime, archive_dir: Optional[str] = None) -> List[models.MessageSegment]:
+    """Archives every month that ended before `cutoff` and is still in the table."""
+    connection = db.connection()
+    if partitions.is_partitioned(connection):
+        created = partitions.ensure_upcoming_partitions(connection, datetime.now(timezone.utc))
+        db.commit()
+        if created:
+            logger.info("Created partitions %s", ", ".join(created))
+
+    oldest = db.execute(select(func.min(models.Message.created_at))).scalar()
+    if oldest is None:
+        return []
+    archived = {
+        partitions.month_start(start)
+        for start in db.execute(select(models.MessageSegment.period_start)).scalars()
+    }
+    written = []
+    for start, end in partitions.months_between(oldest, partitions.month_start(cutoff)):
+        if start in archived:
+            # Messages dated into an archived month: leave them in the table, where reads still find them.
+            logger.warning("Month %s is already archived but has messages in the table; skipping", f"{start:%Y-%m}")
+            continue
+        segment = archive_month(db, start, end, archive_dir)
+        if segment is not None:
+            written.append(segment)
+    return written
+
+
+def restore_month(db: Session, start: datetime, archive_dir: Optional[str] = None) -> int:
+    """Moves an archived month back into `messages` and deletes its segment. Returns the row count."""
+    start = partitions.month_start(start)
+    segment = db.execute(
+        select(models.MessageSegment).where(models.MessageSegment.period_start == start)
+    ).scalar_one()
+    connection = db.connection()
+    if partitions.is_partitioned(connection):
+        partitions.ensure_partitions(connection, start, partitions.add_months(start, 1))
+
+    reader = segments.open_segment(segment.file_name, segment.sha256, archive_dir)
+    batch = []
+    restored = 0
+    for conversation_id, rows in reader.conversations():
+        chat_crud.bump_history_version(db, [conversation_id])
+        for message_id, content, created_at, status, sender_id in rows:
+            batch.append({
+                "id": message_id, "content": content, "created_at": created_at, "status": status,
+                "sender_id": sender_id, "conversation_id": conversation_id,
+            })
+            chat_crud.index_message_terms(db, message_id, conversation_id, decrypt_message(content))
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            db.execute(insert(models.Message), batch)
+            restored += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(models.Message), batch)
+        restored += len(batch)
+    name, digest = segment.file_name, segment.sha256
+    db.delete(segment)
+    db.commit()
+
+    segments.close_segment(name, digest, archive_dir)
+    os.remove(segments.segment_path(name, archive_dir))
+    logger.info("Restored %d messages from %s", restored, name)
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old months of messages into segment files.")
+    parser.add_argument("--hot-days", type=int, default=MESSAGE_HOT_DAYS,
+                        help="keep months that ended less than this many days ago")
+    parser.add_argument("--restore", metavar="YYYY-MM", help="move an archived month back into the database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = database.SessionLocal()
+    try:
+        if args.restore:
+            restore_month(db, datetime.strptime(args.restore, "%Y-%m").replace(tzinfo=timezone.utc))
+        else:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=args.hot_days)
+            written = archive_messages(db, cutoff)
+            logger.info("Done, %d months archived.", len(written))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Rebuilds the denormalized last-message pointer and encrypted preview on conversations.
+
+create_message keeps these columns current. Run this once for conversations whose
+history predates the columns, and after a key rotation to re-encrypt the previews
+under the new key. Walks `conversations` in primary-key order, one committed batch
+at a time.
+
+    python -m app.jobs.rebuild_last_message [--missing-only] [--batch-size N]
+"""
+import argparse
+import logging
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from ..cruds import chat_crud
+from ..db import database, models
+
+logger = logging.getLogger(__name__)
+
+# Only while the pointer is still the one read before the latest message was looked
+# up: a message sent in between has already set a newer one.
+_update_pointer = (
+    update(models.Conversation.__table__)
+    .where(
+        models.Conversation.__table__.c.id == bindparam("b_id"),
+        models.Conversation.__table__.c.last_message_id.is_not_distinct_from(bindparam("b_seen_id")),
+    )
+    .values(
+        last_message_id=bindparam("last_message_id"),
+        last_message_sender_id=bindparam("last_message_sender_id"),
+        last_message_preview=bindparam("last_message_preview"),
+    )
+)
+
+
+def rebuild_last_message(db: Session, missing_only: bool = False, batch_size: int = 500) -> int:
+    """Recomputes the pointer for every conversation with messages. Returns the number updated."""
+    updated = 0
+    after = None
+    while True:
+        stmt = (
+            select(models.Conversation.id, models.Conversation.last_message_id)
+            .order_by(models.Conversation.id).limit(batch_size)
+        )
+        if missing_only:
+            stmt = stmt.where(models.Conversation.last_message_id.is_(None))
+        if after is not None:
+            stmt = stmt.where(models.Conversation.id > after)
+        seen = dict(db.execute(stmt).all())
+        if not seen:
+            return updated
+        convo_ids = list(seen)
+
+        latest = chat_crud.get_latest_messages(db, convo_ids, per_conversation=1)
+        rows = []
+        for convo_id, ((message_id, content, created_at, _status, sender_id, _username),) in latest.items():
+            values = chat_crud.last_message_values(message_id, sender_id, content, created_at)
+            rows.append({
+                "b_id": convo_id,
+                "b_seen_id": seen[convo_id],
+                "last_message_id": values["last_message_id"],
+                "last_message_sender_id": values["last_message_sender_id"],
+                "last_message_preview": values["last_message_preview"],
+            })
+        if rows:
+            db.execute(_update_pointer, rows)
+        db.commit()
+
+        updated += len(rows)
+        after = convo_ids[-1]
+        logger.info("Updated %d conversations, last id %s", updated, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the last-message preview of conversations.")
+    parser.add_argument("--missing-only", action="store_true", help="skip conversations that already have one")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = database.SessionLocal()
+    try:
+        total = rebuild_last_message(db, args.missing_only, args.batch_size)
+        logger.info("Done, %d conversations updated.", total)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Rebuilds the blind keyword index (message_terms) from the encrypted messages.
+
+Needed once for history written before the index existed, and after changing
+MESSAGE_INDEX_KEY. Walks `messages` in primary-key order, one committed batch at a
+time, so it can run next to live traffic and be restarted with --after.
+
+    python -m app.jobs.rebuild_message_index [--conversation ID] [--batch-size N] [--after ID]
+"""
+import argparse
+import logging
+import uuid
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from ..core.security import blind_index_tokens, decrypt_messages
+from ..db import database, models
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild_message_index(
+    db: Session,
+    conversation_id: Optional[uuid.UUID] = None,
+    batch_size: int = 1000,
+    after: Optional[uuid.UUID] = None,
+) -> int:
+    """Re-indexes every message (optionally of one conversation). Returns the number of messages processed."""
+    processed = 0
+    while True:
+        stmt = select(models.Message.id, models.Message.conversation_id, models.Message.content)
+        if conversation_id is not None:
+            stmt = stmt.where(models.Message.conversation_id == conversation_id)
+        if after is not None:
+            stmt = stmt.where(models.Message.id > after)
+        batch = db.execute(stmt.order_by(models.Message.id).limit(batch_size)).all()
+        if not batch:
+            return processed
+
+        message_ids = [row.id for row in batch]
+        db.execute(delete(models.MessageTerm).where(models.MessageTerm.message_id.in_(message_ids)))
+        rows = [
+            {"conversation_id": row.conversation_id, "token": token, "message_id": row.id}
+            for row, plaintext in zip(batch, decrypt_messages([row.content for row in batch]))
+            for token in blind_index_tokens(plaintext)
+        ]
+        if rows:
+            db.execute(insert(models.MessageTerm), rows)
+        db.commit()
+
+        processed += len(batch)
+        after = message_ids[-1]
+        logger.info("Indexed %d messages, last id %s", processed, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the blind keyword index for messages.")
+    parser.add_argument("--conversation", type=uuid.UUID, help="only re-index this conversation")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--after", type=uuid.UUID, help="resume after this message id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = database.SessionLocal()
+    try:
+        total = rebuild_message_index(db, args.conversation, args.batch_size, args.after)
+        logger.info("Done, %d messages indexed.", total)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Re-encrypts every message under the current MESSAGE_ENCRYPTION_KEY.
+
+Rotation steps:
+  0. If months have been archived, restore them first
+     (`python -m app.jobs.archive_messages --restore YYYY-MM`): segment files are not
+     re-encrypted. Archive them again after step 2.
+  1. Set the new key as MESSAGE_ENCRYPTION_KEY and move the old one to
+     MESSAGE_DECRYPTION_KEYS, then restart the app. New messages use the new key and
+     old ones still decrypt.
+  2. Run this job until it reports completion, then
+     `python -m app.jobs.rebuild_last_message` to re-encrypt the inbox previews.
+  3. Remove the old key from MESSAGE_DECRYPTION_KEYS.
+
+The job walks `messages` in primary-key order, one batch at a time. Each batch is
+re-encrypted by a pool of worker processes and written back with a single executemany
+UPDATE. The UPDATE only applies if the row still holds the token that was read, so
+concurrent writes are never overwritten. Progress is checkpointed after every commit,
+and SIGINT/SIGTERM stop the job cleanly after the current batch.
+
+    python -m app.jobs.rotate_message_keys [--batch-size N] [--workers N]
+        [--rows-per-second N] [--checkpoint PATH] [--restart]
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from ..core import security
+from ..db import database, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = ".rotate_message_keys.checkpoint"
+
+
+@dataclass
+class RotationStats:
+    scanned: int = 0
+    rotated: int = 0
+    last_id: Optional[uuid.UUID] = None
+    finished: bool = False
+
+
+# --- Worker side ---
+_worker_keys = None
+
+
+def _init_worker(primary_key: str, old_keys: List[str]):
+    global _worker_keys
+    _worker_keys = (Fernet(primary_key.encode()), security.build_fernet(primary_key, old_keys))
+
+
+def _rotate_chunk(rows: List[Tuple[uuid.UUID, str]]) -> List[Tuple[uuid.UUID, str, str]]:
+    """Returns (id, old_token, new_token) for every row not already under the primary key."""
+    primary, keyring = _worker_keys
+    rotated = []
+    for message_id, token in rows:
+        raw = token.encode("utf-8")
+        try:
+            primary.decrypt(raw)
+            continue
+        except InvalidToken:
+            pass
+        rotated.append((message_id, token, keyring.rotate(raw).decode("utf-8")))
+    return rotated
+
+
+# --- Checkpointing ---
+def load_checkpoint(path: str) -> RotationStats:
+    if not os.path.exists(path):
+        return RotationStats()
+    with open(path) as checkpoint_file:
+        data = json.load(checkpoint_file)
+    last_id = data.get("last_id")
+    return RotationStats(
+        scanned=data.get("scanned", 0),
+        rotated=data.get("rotated", 0),
+        last_id=uuid.UUID(last_id) if last_id else None,
+        finished=data.get("finished", False),
+    )
+
+
+def save_checkpoint(path: str, stats: RotationStats) -> None:
+    """Writes the checkpoint atomically, so a crash never leaves a half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump({
+            "scanned": stats.scanned,
+            "rotated": stats.rotated,
+            "last_id": str(stats.last_id) if stats.last_id else None,
+            "finished": stats.finished,
+        }, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- Job ---
+_update_content = (
+    update(models.Message.__table__)
+    .where(
+        models.Message.__table__.c.id == bindparam("b_id"),
+        models.Message.__table__.c.content == bindparam("b_old"),
+    )
+    .values(content=bindparam("b_new"))
+)
+
+
+def rotate_message_keys(
+    db: Session,
+    primary_key: str = security.FERNET_KEY,
+    old_keys: List[str] = security.OLD_FERNET_KEYS,
+    batch_size: int = 500,
+    workers: int = os.cpu_count() or 1,
+    rows_per_second: Optional[float] = None,
+    checkpoint_path: Optional[str] = DEFAULT_CHECKPOINT,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> RotationStats:
+    """
+    Runs (or resumes) the re-encryption. `workers=0` re-encrypts in this process.
+    `rows_per_second` caps the scan rate to protect live traffic.
+    """
+    stats = load_checkpoint(checkpoint_path) if checkpoint_path else RotationStats()
+    if stats.finished:
+        return stats
+
+    pool = None
+    if workers > 0:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(primary_key, old_keys))
+    else:
+        _init_worker(primary_key, old_keys)
+    started = time.monotonic()
+    scanned_this_run = 0
+    try:
+        while not should_stop():
+            stmt = select(models.Message.id, models.Message.content).order_by(models.Message.id).limit(batch_size)
+            if stats.last_id is not None:
+                stmt = stmt.where(models.Message.id > stats.last_id)
+            batch = [tuple(row) for row in db.execute(stmt).all()]
+            if not batch:
+                stats.finished = True
+                break
+
+            if pool is not None:
+                chunk = -(-len(batch) // workers)
+                results = pool.map(_rotate_chunk, [batch[i:i + chunk] for i in range(0, len(batch), chunk)])
+                rotated = [row for part in results for row in part]
+            else:
+                rotated = _rotate_chunk(batch)
+
+            if rotated:
+                db.execute(_update_content, [
+                    {"b_id": message_id, "b_old": old, "b_new": new} for message_id, old, new in rotated
+                ])
+            db.commit()
+
+            stats.scanned += len(batch)
+            stats.rotated += len(rotated)
+            stats.last_id = batch[-1][0]
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, stats)
+            logger.info("Scanned %d messages, re-encrypted %d, last id %s", stats.scanned, stats.rotated, stats.last_id)
+
+            scanned_this_run += len(batch)
+            if rows_per_second:
+                ahead = scanned_this_run / rows_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt all messages under the current encryption key.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rows-per-second", type=float, default=None, help="throttle (default: unthrottled)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        logger.info("Stop requested, finishing the current batch...")
+        stopping = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    db = database.SessionLocal()
+    try:
+        stats = rotate_message_keys(
+            db,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            rows_per_second=args.rows_per_second,
+            checkpoint_path=args.checkpoint,
+            should_stop=lambda: stopping,
+        )
+    finally:
+        db.close()
+    state = "complete" if stats.finished else "stopped, run again to resume"
+    logger.info("Rotation %s: scanned %d, re-encrypted %d.", state, stats.scanned, stats.rotated)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,62 @@
 # Main application entry point.
 
+import asyncio
 import logging
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from .db import models, database
-from .api.v1 import auth, conversations, user
+from .db import database, migrate
+from .api.v1 import auth, conversations, stats, user, attachments
 from .websocket import manager
+from .ephemeral import parse_event, parse_message, typing_coalescer
+from . import heartbeat, spool
+from .spool import message_spool
 import json
+from typing import Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
 from .schemas import schemas
 from .cruds import user_crud, chat_crud
 from .core.security import get_user_from_token
+from .core import log_config, startup
+from .core.rate_limit import rate_limiter
+from .core.ids import uuid7
 import uuid
 
 logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup
-    logger.info("Application startup: Creating database tables...")
-    # Create all database tables based on the models
-    # In a real production app, you would use Alembic for migrations.
-    #models.Base.metadata.drop_all(bind=database.engine)
-
-    models.Base.metadata.create_all(bind=database.engine)
+    # Logging goes through a queue drained by a background thread, so handlers never
+    # block the event loop.
+    log_config.setup_logging()
+    startup.imports_done()
+    # Tables are created and migrated by `python -m app.db.migrate` before workers start;
+    # a worker only checks that the schema is at the revision it was built for.
+    with startup.phase("db_connect"):
+        database.check_connection()
+    if migrate.SCHEMA_VERSION_CHECK:
+        with startup.phase("schema_check"):
+            migrate.check_schema_version(database.engine)
+    with startup.phase("pool_warmup"):
+        database.warm_pool()
+    if message_spool.enabled:
+        with startup.phase("spool_recovery"):
+            message_spool.open()
+    startup.log_report()
+    typing_task = asyncio.create_task(typing_coalescer.run(manager.broadcast))
+    heartbeat_task = asyncio.create_task(heartbeat.run(manager))
+    fanout_task = asyncio.create_task(manager.fanout.run())
+    spool_task = asyncio.create_task(message_spool.run(database.SessionLocal, manager.broadcast)) if message_spool.enabled else None
     yield
+    typing_task.cancel()
+    heartbeat_task.cancel()
+    fanout_task.cancel()
+    if spool_task is not None:
+        spool_task.cancel()
+        message_spool.close()
     # On shutdown (if needed)
     logger.info("Application shutdown.")
+    log_config.stop_logging()
 
 
 
@@ -44,13 +75,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Response headers the frontend reads: cursors, cache validators and the write token.
+    expose_headers=["X-Next-Cursor", "ETag", database.READ_YOUR_WRITES_HEADER],
 )
+app.add_middleware(database.ReadYourWritesMiddleware)
 
 # --- API Routers ---
 # Include routers for different parts of the API for better organization.
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(conversations.router, prefix="/conversations", tags=["Conversations"])
+app.include_router(attachments.router, prefix="/conversations", tags=["Attachments"])
 app.include_router(user.router, prefix="/users", tags=["users"])
+app.include_router(stats.router, prefix="/stats", tags=["Stats"])
 
 
 
@@ -61,6 +97,22 @@ async def root():
 
 
 
+def _write_message(content: str, sender_id: uuid.UUID, conversation_id: uuid.UUID,
+                   client_message_id: Optional[str], message_id: uuid.UUID) -> Tuple[uuid.UUID, str, str]:
+    """
+    Stores a socket message from a worker thread, in a session of its own: the socket
+    loop may stop waiting for it, and the socket's session must not be shared with it.
+    """
+    db = database.SessionLocal()
+    try:
+        db_message = chat_crud.create_message(
+            db, schemas.MessageCreate(content=content), sender_id, conversation_id, client_message_id, message_id,
+        )
+        return db_message.id, db_message.created_at.isoformat(), db_message.status.value
+    finally:
+        db.close()
+
+
 @app.websocket("/ws/{conversation_id}/{token}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -76,42 +128,97 @@ async def websocket_endpoint(
 
         convo_uuid = uuid.UUID(conversation_id)
         if not chat_crud.is_user_participant(db, user_id=user.id, conversation_id=convo_uuid):
-            logger.debug(f"participant not in conversation, {user.id} :{conversation_id}")
+            logger.debug("participant not in conversation, %s :%s", user.id, conversation_id)
             await websocket.close(code=1011)
             return
 
         await manager.connect(websocket, str(user.id), conversation_id)
         while True:
             data = await websocket.receive_text()
-            
-            message = schemas.MessageCreate(content=data)
-            db_message = chat_crud.create_message(db, message, user.id, convo_uuid)
-            # Case were messages were not saving in db but getting sent to user.
-            if not db_message:
-                logger.debug("Message couldn't save so we do not want to send it.")
-                # Handle case where message fails to save
+            manager.touch(websocket)
+
+            event = parse_event(data)
+            if event is not None:
+                if event["type"] == "typing":
+                    typing_coalescer.update(conversation_id, str(user.id), bool(event.get("typing", True)))
+                continue
+
+            retry_after = rate_limiter.check(id(websocket), user.id, conversation_id)
+            if retry_after:
+                await websocket.send_text(json.dumps({
+                    "type": "error",
+                    "code": "rate_limited",
+                    "content": "You are sending messages too fast",
+                    "retry_after": round(retry_after, 3),
+                }))
+                continue
+
+            content, client_message_id = parse_message(data)
+            message_id = uuid7()
+            stored = None
+            # While the spool holds messages, new ones queue behind them instead of
+            # racing them (and the recovering database) with direct writes.
+            if not message_spool.active():
+                try:
+                    stored = await asyncio.wait_for(
+                        asyncio.to_thread(_write_message, content, user.id, convo_uuid, client_message_id, message_id),
+                        spool.SPOOL_SLOW_WRITE if message_spool.enabled else None,
+                    )
+                except asyncio.TimeoutError:
+                    # The thread keeps running. If it commits after all, the spooled copy
+                    # has the same id and is skipped when drained.
+                    logger.warning("Message write still running after %ss", spool.SPOOL_SLOW_WRITE)
+                    message_spool.engage("slow message write")
+                except SQLAlchemyError as e:
+                    logger.warning("Message write failed: %s", type(e).__name__)
+                    if message_spool.enabled:
+                        message_spool.engage(f"message write failed ({type(e).__name__})")
+
+            if stored is not None:
+                write_token = database.note_write(user.username)
+                if write_token is not None:
+                    # The sender's next HTTP reads may reach another worker; the token pins them to the primary there.
+                    await websocket.send_text(json.dumps({"type": "read_your_writes", "token": write_token}))
+                message_id, created_at, message_status = stored
+            elif message_spool.enabled:
+                try:
+                    record = await message_spool.append(
+                        spool.new_record(convo_uuid, user.id, content, client_message_id, message_id))
+                except OSError:
+                    record = None
+                if record is None:
+                    await websocket.send_text(json.dumps({"type": "error", "content": "Message failed to send"}))
+                    continue
+                message_id, created_at, message_status = record["id"], record["created_at"], "pending"
+            else:
+                # Case were messages were not saving in db but getting sent to user.
                 await websocket.send_text(json.dumps({"type": "error", "content": "Message failed to send"}))
                 continue
+            typing_coalescer.update(conversation_id, str(user.id), False)
 
             broadcast_message = {
-                "id": str(db_message.id),
+                "id": str(message_id),
                 "sender": { "id": str(user.id), "username": user.username },
-                "content": message.content,
-                "created_at": db_message.created_at.isoformat(),
-                "conversation_id": str(db_message.conversation_id),
-                "status": db_message.status.value
+                "content": content,
+                "created_at": created_at,
+                "conversation_id": conversation_id,
+                "status": message_status
             }
-            logger.info("Broadcasting!!!")
+            if client_message_id is not None:
+                broadcast_message["client_message_id"] = client_message_id
+            logger.debug("Broadcasting message %s", message_id)
             await manager.broadcast(json.dumps(broadcast_message), conversation_id)
 
     except WebSocketDisconnect:
-            logger.error("disconnecting: ")
             if user:
-                logger.info(f"disconnecting: user: {user.id} ")
+                logger.info("disconnecting: user: %s", user.id)
+                typing_coalescer.update(conversation_id, str(user.id), False)
                 await manager.disconnect(websocket, str(user.id), conversation_id)
     except Exception as e:
         if user:
-            logger.error(f"Something happened: {e}")
+            logger.error("Something happened: %s", type(e).__name__)
+            typing_coalescer.update(conversation_id, str(user.id), False)
             await manager.disconnect(websocket, str(user.id), conversation_id)
     finally:
+        rate_limiter.release(id(websocket))
         db.close()
\ No newline at end of file
@@ -2,7 +2,7 @@
 from ..db.models import MessageStatus, Participant
 from pydantic import BaseModel, EmailStr, validator
 import uuid
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 # --- User Schemas ---
@@ -49,6 +49,22 @@ class Message(MessageBase):
     class Config:
         orm_mode = True
 
+class Attachment(BaseModel):
+    id: uuid.UUID
+    message_id: uuid.UUID
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+    class Config:
+        orm_mode = True
+
+class MessagePreview(BaseModel):
+    id: uuid.UUID
+    sender: User
+    content: str
+
 # --- Conversation Schemas ---
 class ConversationBase(BaseModel):
     name: Optional[str] = None
@@ -62,9 +78,18 @@ class Conversation(ConversationBase):
     participants: List[User]
     last_message_at: Optional[datetime] = None
     has_unread: bool = False 
+    last_message: Optional[MessagePreview] = None
     @validator('participants', pre=True, allow_reuse=True)
     def participants_from_relationship(cls, v: List[Participant]) -> List[User]:
         return [participant.user for participant in v]
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# --- Bootstrap Schema ---
+class InboxBootstrap(BaseModel):
+    conversations: List[Conversation]
+    # Keyed by conversation id; the newest messages of each listed conversation, oldest first.
+    messages: Dict[uuid.UUID, List[Message]]
+    # Keyed by conversation id; ids of users with an open socket in that conversation.
+    presence: Dict[uuid.UUID, List[uuid.UUID]]
@@ -0,0 +1,62 @@
+"""
+Fast response path for the hot list endpoints.
+
+The CRUD layer returns plain row tuples; the functions here turn them into dicts laid
+out exactly like the pydantic schemas (same keys, same order) and FastJSONResponse
+encodes them. The bytes are identical to what `response_model` would produce, without
+validating every row and every nested sender/participant. Keep these in step with
+schemas.Message and schemas.Conversation; tests/serializers_test.py compares the two.
+"""
+from typing import Any, Iterable, List
+
+import pydantic_core
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional; pydantic-core produces the same bytes, a little slower
+    orjson = None
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            # OPT_UTC_Z writes UTC datetimes as "...Z", like pydantic does.
+            return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+        return pydantic_core.to_json(content)
+
+
+def message_dicts(rows: Iterable[tuple]) -> List[dict]:
+    """Decrypted message rows (id, content, created_at, status, sender_id, username) → schemas.Message layout."""
+    return [
+        {
+            "content": content,
+            "id": msg_id,
+            "status": msg_status,
+            "sender": {"id": sender_id, "username": username},
+            "created_at": created_at,
+        }
+        for msg_id, content, created_at, msg_status, sender_id, username in rows
+    ]
+
+
+def conversation_dicts(rows: Iterable[tuple]) -> List[dict]:
+    """Inbox rows from chat_crud.get_user_conversations → schemas.Conversation layout."""
+    return [
+        {
+            "name": name,
+            "id": convo_id,
+            "is_group_chat": is_group_chat,
+            "participants": [{"id": user_id, "username": username} for user_id, username in participants],
+            "last_message_at": last_message_at,
+            "has_unread": has_unread,
+            "last_message": None if last_message is None else {
+                "id": last_message[0],
+                "sender": {"id": last_message[1], "username": last_message[2]},
+                "content": last_message[3],
+            },
+        }
+        for convo_id, name, is_group_chat, last_message_at, has_unread, participants, last_message in rows
+    ]
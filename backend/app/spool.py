@@ -0,0 +1,409 @@
+"""
+Write-ahead spool for chat messages while the database is failing or slow.
+
+When a direct write fails, or is still running after SPOOL_SLOW_WRITE, the socket
+loop engages the spool. From then on, messages are appended to a local file and
+broadcast with status "pending". They keep being spooled until the spool is empty
+again, so they reach the database in the order they were accepted. Appends are group
+committed: records gathered over SPOOL_FSYNC_INTERVAL share one write and fsync, and
+a message is only acknowledged once its record is on disk. A background task drains
+the file into the database at no more than SPOOL_DRAIN_RATE messages a second. It
+backs off with jitter while writes fail, so workers do not all retry at the moment
+the database returns. Each drained batch is announced to its rooms as
+{"type": "messages_persisted", ...}.
+
+A spool file is one JSON record per line, content encrypted as in `messages`. Every
+worker holds an exclusive lock on its own file in MESSAGE_SPOOL_DIR. At startup a
+worker also takes over the files of workers that are gone and replays them.
+Records carry their message id, and the sender's client_message_id when the client
+sent one, so replaying records that were already stored is harmless
+(chat_crud.store_spooled_messages).
+
+Only errors the database recovers from by itself (lost or refused connections, pool
+timeouts) are retried. A batch failing any other way is stored one record at a time,
+and a record that still fails is moved to DEAD_LETTER_FILE, next to the spool files,
+and its room is told {"type": "messages_failed", ...}, so one bad record cannot hold
+every later message in "pending".
+
+Spooled messages are not in history, search or exports until they are drained.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .core.ids import uuid7
+from .core.security import encrypt_message
+from .cruds import chat_crud
+
+logger = logging.getLogger(__name__)
+
+# Empty disables the spool: a failed write is reported to the sender as before.
+MESSAGE_SPOOL_DIR = os.getenv("MESSAGE_SPOOL_DIR", "")
+# Appends wait at most this long (seconds) for others to share their fsync...
+SPOOL_FSYNC_INTERVAL = float(os.getenv("SPOOL_FSYNC_INTERVAL", "0.005"))
+# ...or until this many records are waiting.
+SPOOL_FSYNC_BATCH = int(os.getenv("SPOOL_FSYNC_BATCH", "256"))
+# Messages per second written back to the database, and per transaction.
+SPOOL_DRAIN_RATE = float(os.getenv("SPOOL_DRAIN_RATE", "200"))
+SPOOL_DRAIN_BATCH = int(os.getenv("SPOOL_DRAIN_BATCH", "50"))
+# Retry delay after a failed drain, doubling up to SPOOL_RETRY_MAX (seconds).
+SPOOL_RETRY_INITIAL = float(os.getenv("SPOOL_RETRY_INITIAL", "0.5"))
+SPOOL_RETRY_MAX = float(os.getenv("SPOOL_RETRY_MAX", "30"))
+# A direct write still running after this many seconds is given up on: the message is
+# spooled under the same id and the spool engages.
+SPOOL_SLOW_WRITE = float(os.getenv("SPOOL_SLOW_WRITE", "1.0"))
+
+FILE_PREFIX, FILE_SUFFIX = "spool-", ".log"
+# Records the database rejected for good, one JSON line each with the error, for an operator to look at.
+DEAD_LETTER_FILE = "dead-letter.log"
+
+
+def new_record(conversation_id: uuid.UUID, sender_id: uuid.UUID, content: str,
+               client_message_id: Optional[str] = None, message_id: Optional[uuid.UUID] = None) -> dict:
+    """A message accepted now: its final id and timestamp are assigned here, not by the database."""
+    return {
+        "id": str(message_id or uuid7()),
+        "conversation_id": str(conversation_id),
+        "sender_id": str(sender_id),
+        "client_message_id": client_message_id,
+        "content": encrypt_message(content),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _read_records(f) -> Tuple[List[dict], int]:
+    """Records in a spool file and the length of its intact part. A torn last line (crash mid-write) is dropped."""
+    f.seek(0)
+    records, valid = [], 0
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+        valid += len(line)
+    return records, valid
+
+
+class MessageSpool:
+    def __init__(self, directory: str = MESSAGE_SPOOL_DIR, fsync_interval: float = SPOOL_FSYNC_INTERVAL,
+                 fsync_batch: int = SPOOL_FSYNC_BATCH, clock: Callable[[], float] = time.monotonic):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.clock = clock
+        self.path: Optional[str] = None
+        self._file = None
+        # On disk, not yet in the database, oldest first.
+        self._pending: Deque[dict] = deque()
+        # Waiting for the next group commit: (line, record, future).
+        self._buffer: List[Tuple[bytes, dict, asyncio.Future]] = []
+        # (sender_id, client_message_id) -> record, for records not yet drained.
+        self._by_client_id: Dict[Tuple[str, str], dict] = {}
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        self._file_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.engaged = False
+        self.engaged_since: Optional[float] = None
+        self.accepted = 0
+        self.duplicates = 0
+        self.drained = 0
+        self.fsyncs = 0
+        self.drain_failures = 0
+        self.dead_lettered = 0
+        # Records left to store one at a time after a batch failed with a permanent error.
+        self._isolating = 0
+
+    # --- Files ---
+
+    def open(self) -> int:
+        """
+        Claims this worker's spool file and takes over the files no live worker holds.
+        Returns the number of recovered records, which are drained first.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        recovered: List[dict] = []
+        orphans = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            f = open(path, "r+b")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()  # a live worker's spool
+                continue
+            records, valid = _read_records(f)
+            recovered.extend(records)
+            if self._file is None:
+                f.truncate(valid)
+                f.seek(valid)
+                self._file, self.path = f, path
+            else:
+                orphans.append((f, path, records))
+        if self._file is None:
+            self.path = os.path.join(self.directory, f"{FILE_PREFIX}{uuid7()}{FILE_SUFFIX}")
+            self._file = open(self.path, "w+b")
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        for f, path, records in orphans:
+            # Copy the other file's records into ours, durably, before deleting it.
+            self._write(b"".join(json.dumps(record).encode() + b"\n" for record in records))
+            os.remove(path)
+            f.close()
+        for record in recovered:
+            self._track(record)
+        if recovered:
+            self.engage("recovered spool")
+            logger.warning("Recovered %d spooled messages from %s", len(recovered), self.directory)
+        return len(recovered)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, data: bytes) -> None:
+        """Blocking; runs in the thread pool."""
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _truncate(self) -> None:
+        self._file.seek(0)
+        self._file.truncate()
+        os.fsync(self._file.fileno())
+
+    # --- Accepting messages ---
+
+    def active(self) -> bool:
+        """True while new messages must be spooled rather than written directly."""
+        return self.enabled and bool(self.engaged or self._pending or self._buffer)
+
+    def engage(self, reason: str) -> None:
+        if not self.engaged:
+            logger.warning("Spooling messages: %s", reason)
+            self.engaged, self.engaged_since = True, self.clock()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _track(self, record: dict) -> None:
+        self._pending.append(record)
+        if record.get("client_message_id"):
+            self._by_client_id[(record["sender_id"], record["client_message_id"])] = record
+
+    async def append(self, record: dict) -> dict:
+        """
+        Spools a record and returns once it is on disk. A record whose client message
+        id is already spooled is not written again; the first record is returned.
+        """
+        key = (record["sender_id"], record["client_message_id"]) if record.get("client_message_id") else None
+        if key is not None:
+            existing = self._by_client_id.get(key)
+            if existing is not None:
+                self.duplicates += 1
+                return existing
+            self._by_client_id[key] = record
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((json.dumps(record).encode() + b"\n", record, future))
+        if len(self._buffer) >= self.fsync_batch:
+            self._schedule_flush(0)
+        elif self._flush_timer is None:
+            self._schedule_flush(self.fsync_interval)
+        await future
+        return record
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        task = asyncio.get_running_loop().create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self) -> None:
+        """Group commit: one write and fsync for every record waiting."""
+        self._flush_timer = None
+        async with self._file_lock:
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                await run_in_threadpool(self._write, b"".join(line for line, _, _ in batch))
+            except Exception as e:
+                logger.error("Spool write failed: %s", type(e).__name__)
+                for _, record, future in batch:
+                    if record.get("client_message_id"):
+                        self._by_client_id.pop((record["sender_id"], record["client_message_id"]), None)
+                    future.set_exception(e)
+                return
+            self.fsyncs += 1
+            for _, record, future in batch:
+                self._pending.append(record)
+                self.accepted += 1
+                future.set_result(None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- Draining ---
+
+    async def run(self, session_factory: Callable[[], Session], broadcast: Callable[[str, str], Awaitable[None]],
+                  rate: float = SPOOL_DRAIN_RATE, batch_size: int = SPOOL_DRAIN_BATCH) -> None:
+        """Background loop started from the app lifespan: drains the spool into the database."""
+        self._wakeup = asyncio.Event()
+        retry = 0.0
+        while True:
+            if not self._pending:
+                if self._buffer or not self.engaged:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                # Engaged with nothing to drain: stay engaged until the database answers.
+                try:
+                    await run_in_threadpool(_probe, session_factory)
+                except Exception as e:
+                    retry = await self._back_off(retry, e)
+                    continue
+                await self._release()
+                retry = 0.0
+                continue
+
+            batch = list(islice(self._pending, 1 if self._isolating else batch_size))
+            try:
+                persisted = await run_in_threadpool(_store, session_factory, batch)
+            except Exception as e:
+                if _is_transient(e):
+                    retry = await self._back_off(retry, e)
+                    continue
+                if len(batch) > 1:
+                    # Something in this batch can never be stored: find it by storing the
+                    # records one at a time.
+                    logger.warning("Spool batch rejected (%s); retrying its %d records one by one",
+                                   type(e).__name__, len(batch))
+                    self._isolating = len(batch)
+                    continue
+                await self._dead_letter(batch[0], e, broadcast)
+                persisted = []
+            retry = 0.0
+            self._isolating = max(0, self._isolating - 1) if len(batch) == 1 else 0
+            for record in batch:
+                self._pending.popleft()
+                if record.get("client_message_id"):
+                    self._by_client_id.pop((record["sender_id"], record["client_message_id"]), None)
+            self.drained += len(persisted)
+            await self._announce(persisted, broadcast)
+            if not self._pending:
+                await self._release()
+            await asyncio.sleep(len(batch) / rate)
+
+    async def _back_off(self, retry: float, error: Exception) -> float:
+        self.drain_failures += 1
+        retry = min(SPOOL_RETRY_MAX, max(SPOOL_RETRY_INITIAL, retry * 2))
+        logger.warning("Spool drain failed (%s); %d messages waiting, retrying in %.1fs",
+                       type(error).__name__, len(self._pending), retry)
+        # Jitter, so every worker does not hit the recovering database at the same moment.
+        await asyncio.sleep(retry * random.uniform(0.5, 1.5))
+        return retry
+
+    async def _dead_letter(self, record: dict, error: Exception,
+                           broadcast: Callable[[str, str], Awaitable[None]]) -> None:
+        """Moves a record the database rejects for good out of the way and tells its room."""
+        self.dead_lettered += 1
+        logger.error("Spooled message %s rejected by the database (%s); moved to %s",
+                     record["id"], type(error).__name__, DEAD_LETTER_FILE)
+        line = json.dumps({**record, "error": type(error).__name__}).encode() + b"\n"
+        await run_in_threadpool(_append_dead_letter, os.path.join(self.directory, DEAD_LETTER_FILE), line)
+        try:
+            await broadcast(json.dumps({
+                "type": "messages_failed", "conversation_id": record["conversation_id"],
+                "sender_id": record["sender_id"], "message_ids": [record["id"]],
+            }), record["conversation_id"])
+        except Exception as e:
+            logger.warning("Failed notice to %s failed: %s", record["conversation_id"], type(e).__name__)
+
+    async def _release(self) -> None:
+        """Everything is in the database: empty the file and go back to direct writes."""
+        async with self._file_lock:
+            if self._pending or self._buffer:
+                return
+            await run_in_threadpool(self._truncate)
+        if self.engaged:
+            logger.info("Spool drained after %.1fs; writing messages directly again", self.clock() - self.engaged_since)
+        self.engaged, self.engaged_since = False, None
+
+    async def _announce(self, persisted: List[dict], broadcast: Callable[[str, str], Awaitable[None]]) -> None:
+        by_room: Dict[str, List[str]] = {}
+        for record in persisted:
+            by_room.setdefault(record["conversation_id"], []).append(record["id"])
+        for conversation_id, message_ids in by_room.items():
+            try:
+                await broadcast(json.dumps({
+                    "type": "messages_persisted", "conversation_id": conversation_id, "message_ids": message_ids,
+                }), conversation_id)
+            except Exception as e:
+                logger.warning("Persisted notice to %s failed: %s", conversation_id, type(e).__name__)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "engaged": self.engaged,
+            "pending": len(self._pending),
+            "unsynced": len(self._buffer),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "drained": self.drained,
+            "fsyncs": self.fsyncs,
+            "drain_failures": self.drain_failures,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+def _is_transient(error: Exception) -> bool:
+    """Errors the database recovers from by itself, so the same batch is worth retrying."""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def _append_dead_letter(path: str, line: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _probe(session_factory: Callable[[], Session]) -> None:
+    with session_factory() as db:
+        db.execute(text("SELECT 1"))
+
+
+def _store(session_factory: Callable[[], Session], records: List[dict]) -> List[dict]:
+    with session_factory() as db:
+        try:
+            return chat_crud.store_spooled_messages(db, records)
+        except Exception:
+            db.rollback()
+            raise
+
+
+message_spool = MessageSpool()
@@ -1,18 +1,49 @@
 import json
 import logging
+import sys
+import time
 from fastapi import WebSocket
-from typing import Dict, List, Set
+from typing import Callable, Dict, Iterable, List, Set
+
+from . import fanout, heartbeat
 
 # Get a logger instance for this module
 logger = logging.getLogger(__name__)
 
+PING_MESSAGE = json.dumps({"type": "ping"})
+
+
+class Connection:
+    """
+    One open socket: who it belongs to and when we last heard from it. Every index
+    below points at the same record, and the ids are interned, so a socket costs one
+    small object plus one dict entry per index.
+    """
+
+    __slots__ = ("websocket", "user_id", "conversation_id", "last_seen")
+
+    def __init__(self, websocket: WebSocket, user_id: str, conversation_id: str, now: float):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.last_seen = now
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        # Maps user_id to a list of their active WebSocket connections
-        self.user_connections: Dict[str, List[WebSocket]] = {}
-        # Tracks online status: user_id -> set of conversation_ids they are active in
-        self.online_users: Dict[str, Set[str]] = {}
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        # conversation_id -> {websocket: Connection} for every socket open in that room
+        self.active_connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        # Maps user_id to their active connections. Which conversations a user is online
+        # in is read off these records rather than kept in a separate set per user.
+        self.user_connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        # One record per socket; the heartbeat wheel holds the same records.
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.heartbeat_wheel = heartbeat.TimerWheel(heartbeat.wheel_slots())
+        # Large rooms are sent to in shards by this scheduler (its run() is started from the app lifespan).
+        self.fanout = fanout.FanoutScheduler(is_open=self.connections.__contains__)
+        self.clock = clock
+        self.pings_sent = 0
+        self.reaped = 0
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Sends a message to a single WebSocket connection."""
@@ -20,78 +51,190 @@ class ConnectionManager:
 
     async def connect(self, websocket: WebSocket, user_id: str, conversation_id: str):
         await websocket.accept()
-        logger.info(f"WebSocket accepted for user {user_id} in conversation {conversation_id}")
+        logger.info("WebSocket accepted for user %s in conversation %s", user_id, conversation_id)
         
         # Inform the new user who is already online in this room
         users_in_this_room = {
-            uid for uid, convos in self.online_users.items() if conversation_id in convos
+            connection.user_id for connection in self.active_connections.get(conversation_id, {}).values()
         }
         online_list_message = {
             "type": "online_users_list",
             "user_ids": list(users_in_this_room)
         }
         await self.send_personal_message(json.dumps(online_list_message), websocket)
-        logger.debug(f"Sent online user list {users_in_this_room} to user {user_id}")
-        
-        # Add the new user to all tracking objects
-        if conversation_id not in self.active_connections:
-            self.active_connections[conversation_id] = []
-        self.active_connections[conversation_id].append(websocket)
+        logger.debug("Sent online user list (%d users) to user %s", len(users_in_this_room), user_id)
         
-        if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        self.user_connections[user_id].append(websocket)
+        connection = self._add_connection(websocket, user_id, conversation_id)
 
-        if user_id not in self.online_users:
-            self.online_users[user_id] = set()
-        self.online_users[user_id].add(conversation_id)
-        
         # Broadcast to everyone in the room that a new user has come online
         online_status_message = json.dumps({"type": "status", "user_id": user_id, "status": "online"})
-        await self.broadcast(online_status_message, conversation_id)
-        logger.info(f"User {user_id} connected. Broadcasted 'online' status to conversation {conversation_id}.")
+        await self.broadcast(online_status_message, connection.conversation_id)
+        logger.info("User %s connected. Broadcasted 'online' status to conversation %s.", user_id, conversation_id)
+
+    def _add_connection(self, websocket: WebSocket, user_id: str, conversation_id: str) -> Connection:
+        """Registers the socket in every index. No I/O; connect() does the handshake and broadcasts."""
+        # Path params and str(uuid) build fresh strings per socket; share one copy of each id.
+        user_id, conversation_id = sys.intern(user_id), sys.intern(conversation_id)
+        connection = Connection(websocket, user_id, conversation_id, self.clock())
+
+        self.connections[websocket] = connection
+        self.active_connections.setdefault(conversation_id, {})[websocket] = connection
+        self.user_connections.setdefault(user_id, {})[websocket] = connection
+        self.heartbeat_wheel.add(connection)
+        return connection
 
     async def disconnect(self, websocket: WebSocket, user_id: str, conversation_id: str):
-        logger.info(f"Disconnecting user {user_id} from conversation {conversation_id}")
+        logger.info("Disconnecting user %s from conversation %s", user_id, conversation_id)
         
-        # Get a copy of all conversations the user was active in before disconnection.
-        all_user_convos = self.online_users.get(user_id, set()).copy()
-
-        # Remove the specific websocket connection from the conversation room.
-        if conversation_id in self.active_connections:
-            if websocket in self.active_connections[conversation_id]:
-                self.active_connections[conversation_id].remove(websocket)
-            if not self.active_connections[conversation_id]:
+        # All conversations the user was active in before disconnection.
+        all_user_convos = self.user_conversations(user_id)
+
+        # If the user has no more active connections, they are fully offline.
+        if self._remove_connection(websocket, user_id, conversation_id):
+            # Broadcast the "offline" status to ALL conversations the user was in.
+            offline_message = json.dumps({"type": "status", "user_id": user_id, "status": "offline"})
+            logger.info("User %s is now fully offline. Broadcasting to %d conversations", user_id, len(all_user_convos))
+            for convo_id in all_user_convos:
+                await self.broadcast(offline_message, convo_id)
+
+    def _remove_connection(self, websocket: WebSocket, user_id: str, conversation_id: str) -> bool:
+        """Drops the socket from every index. Returns True when it was the user's last socket."""
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            self.heartbeat_wheel.remove(connection)
+
+        room = self.active_connections.get(conversation_id)
+        if room is not None:
+            room.pop(websocket, None)
+            if not room:
                 del self.active_connections[conversation_id]
-        
-        # Remove the specific websocket from the user's list of connections.
-        if user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-            # If the user has no more active connections, they are fully offline.
-            if not self.user_connections[user_id]:
-                del self.user_connections[user_id]
-                if user_id in self.online_users:
-                    del self.online_users[user_id]
-                
-                # Broadcast the "offline" status to ALL conversations the user was in.
-                offline_message = json.dumps({"type": "status", "user_id": user_id, "status": "offline"})
-                logger.info(f"User {user_id} is now fully offline. Broadcasting to conversations: {all_user_convos}")
-                for convo_id in all_user_convos:
-                    await self.broadcast(offline_message, convo_id)
+
+        user_sockets = self.user_connections.get(user_id)
+        if user_sockets is None:
+            return False
+        user_sockets.pop(websocket, None)
+        if user_sockets:
+            return False
+        del self.user_connections[user_id]
+        return True
+
+    def user_conversations(self, user_id: str) -> Set[str]:
+        return {connection.conversation_id for connection in self.user_connections.get(user_id, {}).values()}
+
+    def presence(self, conversation_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Online user ids per conversation, for the given rooms only."""
+        return {
+            conversation_id: sorted({c.user_id for c in self.active_connections.get(conversation_id, {}).values()})
+            for conversation_id in conversation_ids
+        }
+
+    @property
+    def online_users(self) -> Dict[str, Set[str]]:
+        """Snapshot of user_id -> conversation_ids they are active in. O(sockets); for introspection."""
+        return {user_id: self.user_conversations(user_id) for user_id in self.user_connections}
 
     async def broadcast(self, message: str, conversation_id: str):
-        if conversation_id in self.active_connections:
-            logger.debug(f"Broadcasting to conversation {conversation_id}: {message}")
-            for connection in self.active_connections[conversation_id]:
-                await connection.send_text(message)
+        room = self.active_connections.get(conversation_id)
+        if room is None:
+            return
+        if self.fanout.should_schedule(conversation_id, len(room)):
+            logger.debug("Queueing %d bytes for %d sockets in conversation %s", len(message), len(room), conversation_id)
+            self.fanout.submit(conversation_id, message, list(room))
+            return
+        logger.debug("Broadcasting %d bytes to conversation %s", len(message), conversation_id)
+        for websocket in list(room):
+            try:
+                await websocket.send_text(message)
+            except Exception as e:
+                # As in fan-out: the heartbeat reaps a dead socket, the rest of the room still gets the message.
+                logger.debug("Send to conversation %s failed: %s", conversation_id, type(e).__name__)
 
     async def broadcast_to_user(self, user_id: str, message: str):
         """Sends a message to all active connections for a specific user."""
         if user_id in self.user_connections:
-            logger.debug(f"Broadcasting to user {user_id}: {message}")
-            for connection in self.user_connections[user_id]:
-                await connection.send_text(message)
+            logger.debug("Broadcasting %d bytes to user %s", len(message), user_id)
+            for websocket in list(self.user_connections[user_id]):
+                await websocket.send_text(message)
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Records that the socket is alive; called for every frame the client sends."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = self.clock()
+
+    async def check_heartbeats(self, due: Iterable[Connection], now: float) -> None:
+        """
+        Pings the connections whose wheel slot came up and reaps the silent ones. A failure
+        on one connection is logged and does not stop the pass.
+        """
+        for connection in due:
+            try:
+                await self._check_heartbeat(connection, now)
+            except Exception:
+                logger.exception("Heartbeat check of user %s in conversation %s failed", connection.user_id, connection.conversation_id)
+
+    async def _check_heartbeat(self, connection: Connection, now: float) -> None:
+        if now - connection.last_seen > heartbeat.HEARTBEAT_TIMEOUT:
+            logger.info("Reaping silent socket of user %s in conversation %s", connection.user_id, connection.conversation_id)
+            await self.reap(connection)
+            return
+        try:
+            await connection.websocket.send_text(PING_MESSAGE)
+            self.pings_sent += 1
+        except Exception as e:
+            logger.info("Ping to user %s failed (%s), reaping", connection.user_id, type(e).__name__)
+            await self.reap(connection)
+
+    async def reap(self, connection: Connection) -> None:
+        self.reaped += 1
+        await self.disconnect(connection.websocket, connection.user_id, connection.conversation_id)
+        try:
+            await connection.websocket.close(code=1001)
+        except Exception:
+            pass  # already gone; the receive loop will see the disconnect
+
+    def approximate_memory(self) -> int:
+        """
+        Bytes held by the connection indices and records, counting shared objects once.
+        The WebSocket objects themselves belong to the server and are not included.
+        """
+        seen: Set[int] = set()
+        sockets = {id(ws) for ws in self.connections}
+
+        def size(obj) -> int:
+            if id(obj) in seen or id(obj) in sockets:
+                return 0
+            seen.add(id(obj))
+            total = sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                total += sum(size(k) + size(v) for k, v in obj.items())
+            elif isinstance(obj, (list, set, tuple)):
+                total += sum(size(item) for item in obj)
+            elif isinstance(obj, Connection):
+                total += sum(size(getattr(obj, name)) for name in Connection.__slots__)
+            return total
+
+        return sum(size(index) for index in (
+            self.active_connections, self.user_connections,
+            self.connections, self.heartbeat_wheel.slots,
+        ))
+
+    def stats(self) -> dict:
+        sockets = len(self.connections)
+        memory = self.approximate_memory()
+        return {
+            "sockets": sockets,
+            "users_online": len(self.user_connections),
+            "conversations_active": len(self.active_connections),
+            "heartbeat": {
+                "pings_sent": self.pings_sent,
+                "reaped": self.reaped,
+                "wheel": self.heartbeat_wheel.occupancy(),
+            },
+            "fanout": self.fanout.stats(),
+            "memory_bytes": memory,
+            "bytes_per_connection": memory // sockets if sockets else 0,
+        }
 
 # The singleton instance is created here, making it the single source of truth.
 manager = ConnectionManager()
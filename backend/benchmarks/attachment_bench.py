@@ -0,0 +1,135 @@
+"""
+Attachment upload and download throughput and server memory, over a real socket.
+
+Starts uvicorn in a subprocess on a fresh SQLite database, uploads one large file as
+a streamed request body, downloads it whole and in Range pieces, and reports MB/s for
+each with the server's peak RSS (VmHWM) after each step. Memory must not grow with the
+file size: the upload is hashed and written a chunk at a time, and the download is
+sent from the file by the server.
+
+Run from the backend directory:
+    python -m benchmarks.attachment_bench [megabytes]
+"""
+import hashlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+MEGABYTES = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+CHUNK = 1024 * 1024
+RANGE_PIECES = 64
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def _body():
+    # Pseudo-random so the bytes do not compress or repeat on disk.
+    block = hashlib.sha256(b"seed").digest() * (CHUNK // 32)
+    for n in range(MEGABYTES):
+        yield block[n % 32:] + block[:n % 32]
+
+
+def _start_server(directory: str, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        "ATTACHMENT_DIR": os.path.join(directory, "attachments"),
+        "ATTACHMENT_MAX_BYTES": str((MEGABYTES + 1) * CHUNK),
+        "LOG_LEVEL": "WARNING",
+    }
+    subprocess.run([sys.executable, "-m", "app.db.migrate"], env=env, check=True, capture_output=True)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+def _login(client: httpx.Client, name: str) -> dict:
+    client.post("/auth/register", json={"email": f"{name}@example.com", "username": name, "password": "password123"})
+    token = client.post("/auth/login", data={"username": name, "password": "password123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    port = _free_port()
+    server = _start_server(directory, port)
+    size = MEGABYTES * CHUNK
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            headers = _login(client, "sender")
+            friend = client.post("/auth/register", json={
+                "email": "friend@example.com", "username": "friend", "password": "password123"}).json()
+            convo_id = client.post("/conversations/", json={"user_ids": [friend["id"]]}, headers=headers).json()["id"]
+            idle = _peak_rss_mb(server.pid)
+            print(f"{MEGABYTES} MB attachment, server idle at {idle:.0f} MB peak RSS")
+
+            started = time.perf_counter()
+            res = client.post(
+                f"/conversations/{convo_id}/attachments", params={"filename": "big.bin"}, content=_body(),
+                headers={**headers, "Content-Type": "application/octet-stream"},
+            )
+            elapsed = time.perf_counter() - started
+            res.raise_for_status()
+            attachment = res.json()
+            print(f"  upload          {size / elapsed / 1e6:8.0f} MB/s   peak RSS {_peak_rss_mb(server.pid):6.0f} MB")
+
+            url = f"/conversations/{convo_id}/attachments/{attachment['id']}"
+            digest = hashlib.sha256()
+            started = time.perf_counter()
+            with client.stream("GET", url, headers=headers) as res:
+                for chunk in res.iter_bytes(CHUNK):
+                    digest.update(chunk)
+            elapsed = time.perf_counter() - started
+            assert digest.hexdigest() == attachment["sha256"]
+            print(f"  download        {size / elapsed / 1e6:8.0f} MB/s   peak RSS {_peak_rss_mb(server.pid):6.0f} MB")
+
+            piece = size // RANGE_PIECES
+            started = time.perf_counter()
+            for n in range(RANGE_PIECES):
+                res = client.get(url, headers={**headers, "Range": f"bytes={n * piece}-{(n + 1) * piece - 1}"})
+                assert res.status_code == 206 and len(res.content) == piece
+            elapsed = time.perf_counter() - started
+            print(f"  ranged download {size / elapsed / 1e6:8.0f} MB/s   peak RSS {_peak_rss_mb(server.pid):6.0f} MB"
+                  f"   ({RANGE_PIECES} requests)")
+
+        # Reference point: copying the stored blob with the kernel, no HTTP.
+        blob = os.path.join(directory, "attachments", "blobs", attachment["sha256"][:2],
+                            attachment["sha256"][2:4], attachment["sha256"])
+        started = time.perf_counter()
+        shutil.copyfile(blob, os.path.join(directory, "copy.bin"))
+        print(f"  disk copy       {size / (time.perf_counter() - started) / 1e6:8.0f} MB/s")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
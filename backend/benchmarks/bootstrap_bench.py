@@ -0,0 +1,108 @@
+"""
+Cold start of the inbox: the current call sequence against GET /conversations/bootstrap.
+
+Seeds one user with 50 conversations of 30 messages each on SQLite. The sequence is
+GET /conversations/ followed by one GET /conversations/{id}/messages per visible
+conversation, as the client issues them today; bootstrap asks for the same
+conversations with their last 20 messages in one call. Reports server time,
+SQL statements and round-trips, and the total once a per-request network round-trip
+(RTT_MS) is added, since the client makes these calls one after another.
+
+Run from the backend directory:
+    python -m benchmarks.bootstrap_bench
+"""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.core.ids import uuid7
+from app.core.security import create_access_token, encrypt_message
+from app.db import database, models
+
+CONVERSATIONS = 50
+MESSAGES = 30
+VISIBLE = 20
+LAST_K = 20
+ROUNDS = 20
+RTT_MS = float(os.getenv("RTT_MS", "40"))
+
+
+def seed(engine):
+    models.Base.metadata.create_all(bind=engine)
+    me = uuid7()
+    friends = [uuid7() for _ in range(CONVERSATIONS)]
+    convo_ids = [uuid7() for _ in range(CONVERSATIONS)]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": u, "username": name, "email": f"{name}@example.com", "hashed_password": "x"}
+            for u, name in [(me, "me")] + [(f, f"friend{i}") for i, f in enumerate(friends)]
+        ])
+        conn.execute(insert(models.Conversation), [
+            {"id": c, "is_group_chat": False, "last_message_at": start + timedelta(hours=i)}
+            for i, c in enumerate(convo_ids)
+        ])
+        conn.execute(insert(models.Participant), [
+            {"user_id": u, "conversation_id": c} for c, f in zip(convo_ids, friends) for u in (me, f)
+        ])
+        conn.execute(insert(models.Message), [
+            {"id": uuid7(), "content": encrypt_message(f"message {n} in chat {i}, with some text"),
+             "sender_id": friends[i], "conversation_id": c, "created_at": start + timedelta(hours=i, seconds=n)}
+            for i, c in enumerate(convo_ids) for n in range(MESSAGES)
+        ])
+
+
+def main():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bootstrap.db')}",
+                           connect_args={"check_same_thread": False})
+    seed(engine)
+    Session = sessionmaker(bind=engine)
+
+    def override():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[database.get_db] = override
+    app.dependency_overrides[database.get_read_db] = override
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'me'})}"}
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    def sequence():
+        convos = client.get("/conversations/", headers=headers).json()
+        for convo in convos[:VISIBLE]:
+            client.get(f"/conversations/{convo['id']}/messages", headers=headers).raise_for_status()
+        return 1 + min(VISIBLE, len(convos))
+
+    def bootstrap():
+        res = client.get("/conversations/bootstrap", params={"conversations": VISIBLE, "messages": LAST_K}, headers=headers)
+        res.raise_for_status()
+        return 1
+
+    print(f"{CONVERSATIONS} conversations x {MESSAGES} messages, {VISIBLE} visible, RTT {RTT_MS:.0f} ms")
+    print(f"{'path':<30} {'requests':>8} {'queries':>8} {'server (ms)':>12} {'with RTT (ms)':>14}")
+    for label, run in (("list + messages per convo", sequence), ("bootstrap", bootstrap)):
+        run()  # warm up
+        statements.clear()
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            requests = run()
+        server_ms = (time.perf_counter() - started) / ROUNDS * 1000
+        print(f"{label:<30} {requests:>8} {len(statements) / ROUNDS:>8.0f} {server_ms:>12.1f} "
+              f"{server_ms + requests * RTT_MS:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
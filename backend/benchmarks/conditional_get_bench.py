@@ -0,0 +1,105 @@
+"""
+DB and CPU time saved by conditional GETs on the conversation list and history.
+
+Seeds one user with a 200-conversation inbox and a 100-message history page on SQLite,
+then compares a full 200 response with a 304 revalidation: wall time per request,
+SQL statements issued and time spent inside the database driver.
+
+Run from the backend directory:
+    python -m benchmarks.conditional_get_bench
+"""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.core.ids import uuid7
+from app.core.security import create_access_token, encrypt_message
+from app.db import database, models
+
+CONVERSATIONS = 200
+MESSAGES = 100
+REQUESTS = 200
+
+
+def seed(engine):
+    models.Base.metadata.create_all(bind=engine)
+    me, friend = uuid7(), uuid7()
+    convo_ids = [uuid7() for _ in range(CONVERSATIONS)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": me, "username": "me", "email": "me@example.com", "hashed_password": "x"},
+            {"id": friend, "username": "friend", "email": "friend@example.com", "hashed_password": "x"},
+        ])
+        conn.execute(insert(models.Conversation), [{"id": c, "is_group_chat": False} for c in convo_ids])
+        conn.execute(insert(models.Participant), [
+            {"user_id": user, "conversation_id": c} for c in convo_ids for user in (me, friend)
+        ])
+        conn.execute(insert(models.Message), [
+            {"id": uuid7(), "content": encrypt_message(f"message number {i} in the busiest chat"),
+             "sender_id": friend, "conversation_id": convo_ids[0]}
+            for i in range(MESSAGES)
+        ])
+    return convo_ids[0]
+
+
+class QueryStats:
+    def __init__(self, engine):
+        self.statements = 0
+        self.seconds = 0.0
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._bench_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.seconds += time.perf_counter() - context._bench_started
+
+    def reset(self):
+        self.statements, self.seconds = 0, 0.0
+
+
+def main():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'etag.db')}",
+                           connect_args={"check_same_thread": False})
+    convo_id = seed(engine)
+    Session = sessionmaker(bind=engine)
+
+    def override():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[database.get_db] = override
+    app.dependency_overrides[database.get_read_db] = override
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'me'})}"}
+    stats = QueryStats(engine)
+
+    for label, path in (("GET /conversations/ (200 convos)", "/conversations/"),
+                        (f"GET history page ({MESSAGES} msgs)", f"/conversations/{convo_id}/messages")):
+        etag = client.get(path, headers=headers).headers["ETag"]
+        for mode, extra in (("200 full", {}), ("304 revalidate", {"If-None-Match": etag})):
+            stats.reset()
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                res = client.get(path, headers={**headers, **extra})
+            elapsed = (time.perf_counter() - start) / REQUESTS
+            assert res.status_code == int(mode[:3])
+            print(f"{label:<36} {mode:<15} {elapsed * 1000:7.2f} ms/req   "
+                  f"{stats.statements / REQUESTS:4.1f} queries/req   {stats.seconds / REQUESTS * 1000:6.2f} ms in DB/req   "
+                  f"{len(res.content):>7} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Memory held by ConnectionManager for 100k open sockets across 20k conversations.
+
+Registers mock sockets (two per user, five per conversation on average) through the
+synchronous _add_connection helper and measures the growth with tracemalloc. The
+previous layout is rebuilt inline for comparison: lists per room and user, a set of
+conversation ids per user, a dict-backed record per socket, a heartbeat wheel with a
+slot lookup table, and a fresh id string for every socket.
+
+Run from the backend directory:
+    python -m benchmarks.connection_memory_bench
+"""
+import os
+import random
+import time
+import tracemalloc
+import uuid
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.heartbeat import wheel_slots
+from app.websocket import ConnectionManager
+
+SOCKETS = 100_000
+CONVERSATIONS = 20_000
+SOCKETS_PER_USER = 2
+
+
+class MockSocket:
+    __slots__ = ()
+
+
+def workload():
+    rng = random.Random(7)
+    users = [uuid.uuid4() for _ in range(SOCKETS // SOCKETS_PER_USER)]
+    conversations = [uuid.uuid4() for _ in range(CONVERSATIONS)]
+    sockets = [MockSocket() for _ in range(SOCKETS)]
+    # Ids as the endpoint sees them: UUID objects, stringified again for every socket.
+    return [(ws, users[i // SOCKETS_PER_USER], rng.choice(conversations)) for i, ws in enumerate(sockets)]
+
+
+class PlainConnection:
+    def __init__(self, websocket, user_id, conversation_id, now):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.connected_at = now
+        self.last_seen = now
+
+
+def add_legacy(indices, ws, user_id, conversation_id):
+    active, by_user, online, connections, wheel, slot_of = indices
+    active.setdefault(conversation_id, []).append(ws)
+    by_user.setdefault(user_id, []).append(ws)
+    online.setdefault(user_id, set()).add(conversation_id)
+    connection = connections[ws] = PlainConnection(ws, user_id, conversation_id, time.monotonic())
+    slot = len(connections) % len(wheel)
+    wheel[slot].add(connection)
+    slot_of[connection] = slot
+
+
+def measure(label, register, rows):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    holder = register(rows)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{label:<34} {grown / 2**20:9.1f} MiB {grown / len(rows):10.0f} B/socket")
+    return holder
+
+
+def main():
+    rows = workload()
+    print(f"{SOCKETS} sockets, {len(rows) // SOCKETS_PER_USER} users, {CONVERSATIONS} conversations")
+
+    def legacy(rows):
+        indices = ({}, {}, {}, {}, [set() for _ in range(wheel_slots())], {})
+        for ws, user_id, conversation_id in rows:
+            add_legacy(indices, ws, str(user_id), str(conversation_id))
+        return indices
+
+    def records(rows):
+        manager = ConnectionManager()
+        for ws, user_id, conversation_id in rows:
+            manager._add_connection(ws, str(user_id), str(conversation_id))
+        return manager
+
+    measure("lists, sets, dict records", legacy, rows)
+    manager = measure("Connection records, interned ids", records, rows)
+    stats = manager.stats()
+    print(f"{'manager.stats() estimate':<34} {stats['memory_bytes'] / 2**20:9.1f} MiB "
+          f"{stats['bytes_per_connection']:10d} B/socket")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Broadcast delivery latency per room size, with large rooms sent inline against the
+sharded fan-out scheduler (app/fanout.py).
+
+Many small rooms (2, 10 and 100 sockets) carry steady chat traffic while one large
+room gets a few announcements a second. Every socket is a fake whose send costs
+SEND_COST_US of CPU, roughly what framing and writing a message costs. Messages arrive
+on a fixed schedule (open loop), and latency runs from the scheduled arrival to the
+last socket in the room receiving it. Time spent waiting for a blocked event loop is
+therefore counted, not hidden. Reports p50/p95/p99 per room size for both modes.
+
+Run from the backend directory:
+    python -m benchmarks.fanout_bench [large_room_sockets]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import fanout
+from app.websocket import ConnectionManager
+
+LARGE_ROOM = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+SEND_COST_US = float(os.getenv("SEND_COST_US", "5"))
+DURATION = 3.0
+# room size -> (rooms, messages per second across those rooms)
+WORKLOAD = {2: (200, 2000), 10: (50, 200), 100: (10, 20), LARGE_ROOM: (1, 5)}
+
+
+class FakeSocket:
+    __slots__ = ("deliveries",)
+
+    def __init__(self, deliveries: Dict[str, float]):
+        self.deliveries = deliveries
+
+    async def send_text(self, message: str) -> None:
+        end = time.perf_counter() + SEND_COST_US / 1e6
+        while time.perf_counter() < end:
+            pass
+        self.deliveries[message] = time.perf_counter()
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run(threshold: float) -> Dict[int, List[float]]:
+    manager = ConnectionManager()
+    manager.fanout.threshold = threshold
+    deliveries: Dict[str, float] = {}
+    rooms = {}
+    for size, (count, _) in WORKLOAD.items():
+        rooms[size] = []
+        for r in range(count):
+            conversation_id = f"{size}-{r}"
+            rooms[size].append(conversation_id)
+            for n in range(size):
+                manager._add_connection(FakeSocket(deliveries), f"{conversation_id}-{n}", conversation_id)
+
+    scheduler = asyncio.create_task(manager.fanout.run())
+    await asyncio.sleep(0)
+    rng = random.Random(46)
+    arrivals = sorted(
+        (rng.uniform(0, DURATION), size, rng.choice(rooms[size]))
+        for size, (_, rate) in WORKLOAD.items()
+        for _ in range(int(rate * DURATION))
+    )
+    sent = []
+    start = time.perf_counter()
+    tasks = []
+    for n, (offset, size, conversation_id) in enumerate(arrivals):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        message = f"m{n}"
+        sent.append((message, size, start + offset))
+        # Each message comes from its own socket handler.
+        tasks.append(asyncio.create_task(manager.broadcast(message, conversation_id)))
+    await asyncio.gather(*tasks)
+    while manager.fanout.stats()["rooms_queued"]:
+        await asyncio.sleep(0.001)
+    scheduler.cancel()
+
+    latencies: Dict[int, List[float]] = {size: [] for size in WORKLOAD}
+    for message, size, scheduled in sent:
+        latencies[size].append((deliveries[message] - scheduled) * 1000)
+    return latencies
+
+
+def main():
+    print(f"{SEND_COST_US:g} us per send, {DURATION:g} s of traffic, large room of {LARGE_ROOM} sockets")
+    modes = [("inline", float("inf")), (f"sharded (threshold {fanout.FANOUT_THRESHOLD}, "
+                                        f"shard {fanout.FANOUT_SHARD_SIZE})", fanout.FANOUT_THRESHOLD)]
+    for label, threshold in modes:
+        latencies = asyncio.run(run(threshold))
+        print(f"\n{label}")
+        print(f"  {'room size':>10} {'messages':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for size, values in latencies.items():
+            print(f"  {size:>10} {len(values):>9} {percentile(values, 50):>9.2f} "
+                  f"{percentile(values, 95):>9.2f} {percentile(values, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
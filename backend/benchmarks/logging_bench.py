@@ -0,0 +1,73 @@
+"""
+Per-message logging overhead on the WebSocket hot path.
+
+Compares what the old code did (synchronous f-string formatting written straight to a
+stream handler) with the queue-based setup from app.core.log_config. The number that
+matters is the time spent on the calling thread, since that is the event loop.
+
+Run from the backend directory:
+    python -m benchmarks.logging_bench
+"""
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+from app.core.log_config import DeferredQueueHandler, RedactingFormatter, SamplingFilter, LOG_FORMAT
+
+MESSAGES = 50_000
+PAYLOAD = json.dumps({
+    "id": "0b8a1a52-7f1c-4c1e-9f2e-3d6f0b4a9c11",
+    "sender": {"id": "5f0c7f3e-0b9e-4a7e-8d55-3a1f4e2b9d01", "username": "alice"},
+    "content": "Hey, are we still on for the release review at 3pm?",
+    "created_at": "2024-05-01T12:00:00",
+    "conversation_id": "9a7b3c2d-1e0f-4a5b-8c7d-6e5f4a3b2c1d",
+    "status": "sent",
+})
+
+
+def _logger(name: str, handler: logging.Handler, sample_rate: float = None) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    if sample_rate is not None:
+        logger.addFilter(SamplingFilter(sample_rate))
+    return logger
+
+
+def _run(logger: logging.Logger, eager: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        if eager:
+            logger.debug(f"Broadcasting to conversation convo1: {PAYLOAD}")
+            logger.info("Broadcasting!!!")
+        else:
+            logger.debug("Broadcasting %d bytes to conversation %s", len(PAYLOAD), "convo1")
+    return (time.perf_counter() - start) / MESSAGES * 1e6
+
+
+def main():
+    sync_handler = logging.StreamHandler(io.StringIO())
+    sync_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    before = _run(_logger("bench.sync", sync_handler), eager=True)
+
+    results = {"sync, eager formatting (old)": before}
+    for label, rate in (("queue, lazy formatting", None), ("queue, lazy, sampled 1%", 0.01)):
+        log_queue = queue.Queue(maxsize=MESSAGES * 2)
+        sink = logging.StreamHandler(io.StringIO())
+        sink.setFormatter(RedactingFormatter(LOG_FORMAT))
+        listener = logging.handlers.QueueListener(log_queue, sink)
+        listener.start()
+        results[label] = _run(_logger(f"bench.{rate}", DeferredQueueHandler(log_queue), rate), eager=False)
+        listener.stop()
+
+    print(f"{MESSAGES} messages, caller-thread cost per message:")
+    for label, micros in results.items():
+        print(f"  {label:<32} {micros:8.2f} us  ({before / micros:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
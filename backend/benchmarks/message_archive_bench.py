@@ -0,0 +1,95 @@
+"""
+History reads from the table against archived segment files (SQLite).
+
+Seeds a year of messages across many conversations, times history pages at several
+depths, archives every month, then times the same pages again. Also reports the bytes per
+message in the database (table and its indexes) before archiving and in the segment files after.
+
+Run from the backend directory:
+    python -m benchmarks.message_archive_bench [messages]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app.cruds import chat_crud
+from app.core.ids import uuid7
+from app.core.security import encrypt_message
+from app.db import models, segments
+from app.db.database import Base
+from app.jobs.archive_messages import archive_messages
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+CONVERSATIONS = 200
+PAGE = 50
+ROUNDS = 200
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+random.seed(7)
+
+
+def seed(engine):
+    sender_id = uuid7()
+    convo_ids = [uuid7() for _ in range(CONVERSATIONS)]
+    step = timedelta(days=365) / MESSAGES
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": sender_id, "username": "bench",
+                                             "email": "bench@example.com", "hashed_password": "x"}])
+        conn.execute(insert(models.Conversation), [{"id": c, "is_group_chat": False} for c in convo_ids])
+        for start in range(0, MESSAGES, 10_000):
+            conn.execute(insert(models.Message), [
+                {"id": uuid7(), "content": encrypt_message(f"message {n}, some ordinary chat text"),
+                 "sender_id": sender_id, "conversation_id": random.choice(convo_ids),
+                 "created_at": START + n * step}
+                for n in range(start, min(start + 10_000, MESSAGES))
+            ])
+    return convo_ids
+
+
+def time_pages(Session, convo_ids) -> dict:
+    depth = MESSAGES // CONVERSATIONS
+    results = {}
+    with Session() as db:
+        for label, skip in (("oldest", 0), ("middle", depth // 2), ("newest", max(0, depth - PAGE))):
+            started = time.perf_counter()
+            for n in range(ROUNDS):
+                chat_crud.get_conversation_messages(db, convo_ids[n % CONVERSATIONS], skip=skip, limit=PAGE)
+            results[label] = (time.perf_counter() - started) / ROUNDS * 1000
+    return results
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    segments.MESSAGE_ARCHIVE_DIR = os.path.join(directory, "archive")
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'archive.db')}")
+    Base.metadata.create_all(engine)
+    convo_ids = seed(engine)
+    Session = sessionmaker(bind=engine)
+    with engine.connect() as conn:
+        table_bytes = conn.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name LIKE '%messages%'"
+        )).scalar()
+
+    hot = time_pages(Session, convo_ids)
+    with Session() as db:
+        written = archive_messages(db, cutoff=datetime(2025, 2, 1, tzinfo=timezone.utc))
+        segment_bytes = sum(segment.size_bytes for segment in written)
+    cold = time_pages(Session, convo_ids)
+
+    print(f"{MESSAGES:,} messages in {CONVERSATIONS} conversations, pages of {PAGE}")
+    print(f"{'page':<8} {'table (ms)':>11} {'segments (ms)':>14}")
+    for label in hot:
+        print(f"{label:<8} {hot[label]:>11.2f} {cold[label]:>14.2f}")
+    print(f"storage: table + indexes {table_bytes / MESSAGES:.0f} B/message, "
+          f"{len(written)} segments {segment_bytes / MESSAGES:.0f} B/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Storage size and encrypt/decrypt throughput of the compressed payload envelope.
+
+The corpus mixes what a chat table actually holds: mostly short messages, some
+paragraphs, and a tail of pasted logs, stack traces and source code.
+
+Run from the backend directory:
+    python -m benchmarks.message_compression_bench
+"""
+import inspect
+import json
+import os
+import random
+import time
+import traceback
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.cruds import user_crud  # noqa: F401  (security imports user_crud back)
+from app.core import security
+
+random.seed(11)
+WORDS = "the a to and of we it is on for that this release deploy review lunch meeting bug fix ok thanks".split()
+
+
+def short_message():
+    return " ".join(random.choices(WORDS, k=random.randint(2, 15)))
+
+
+def paragraph():
+    return ". ".join(short_message().capitalize() for _ in range(random.randint(4, 10))) + "."
+
+
+def pasted_log():
+    return "\n".join(
+        f"2024-05-01T12:{i // 60 % 60:02d}:{i % 60:02d}Z {random.choice(['INFO', 'WARN', 'DEBUG'])} "
+        f"worker-{random.randint(1, 8)} request_id={random.getrandbits(32):08x} latency_ms={random.randint(1, 900)}"
+        for i in range(random.randint(20, 200))
+    )
+
+
+def pasted_code():
+    return inspect.getsource(random.choice([json.decoder, traceback, random]))[: random.randint(1_000, 8_000)]
+
+
+def corpus(size=5_000):
+    kinds = [(short_message, 0.80), (paragraph, 0.15), (pasted_log, 0.03), (pasted_code, 0.02)]
+    makers, weights = zip(*kinds)
+    return [random.choices(makers, weights)[0]() for _ in range(size)]
+
+
+def raw_encrypt(text):
+    return security.fernet.encrypt(text.encode("utf-8")).decode("utf-8")
+
+
+def measure(label, encrypt, messages):
+    start = time.perf_counter()
+    tokens = [encrypt(m) for m in messages]
+    enc_s = time.perf_counter() - start
+    start = time.perf_counter()
+    security.decrypt_messages(tokens)
+    dec_s = time.perf_counter() - start
+    plain = sum(len(m.encode("utf-8")) for m in messages)
+    stored = sum(len(t) for t in tokens)
+    mb = plain / 1e6
+    print(f"  {label:<20} stored {stored / 1e6:7.2f} MB ({stored / plain:5.2f}x plaintext)"
+          f"   encrypt {mb / enc_s:7.1f} MB/s   decrypt {mb / dec_s:7.1f} MB/s")
+    return stored
+
+
+def main():
+    messages = corpus()
+    large = [m for m in messages if len(m.encode("utf-8")) >= security.MESSAGE_COMPRESSION_THRESHOLD]
+    codec = "zstd" if security.zstandard is not None else "zlib"
+    print(f"{len(messages)} messages, {sum(map(len, messages)) / 1e6:.2f} MB plaintext, "
+          f"{len(large)} above the {security.MESSAGE_COMPRESSION_THRESHOLD} byte threshold, codec {codec}")
+    for subset_label, subset in (("whole corpus", messages), ("large messages only", large)):
+        print(subset_label)
+        before = measure("raw Fernet (old)", raw_encrypt, subset)
+        after = measure("envelope (new)", security.encrypt_message, subset)
+        print(f"  saved {100 * (1 - after / before):.1f}% of stored bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Search latency against conversation history size (SQLite).
+
+Compares the blind keyword index (chat_crud.search_conversation_messages) with the
+only alternative without it: decrypt the whole conversation and scan the plaintext.
+
+Run from the backend directory:
+    python -m benchmarks.message_search_bench [sizes...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.cruds import chat_crud
+from app.core.ids import uuid7
+from app.core.security import blind_index_tokens, decrypt_messages, encrypt_message, normalize_terms
+from app.db import models
+
+SIZES = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+SCAN_LIMIT = 100_000
+random.seed(7)
+# Zipf-ish vocabulary: a handful of very common words and a long tail.
+VOCABULARY = [f"w{i}" for i in range(5_000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def seed(engine, size: int):
+    sender_id, convo_id = uuid7(), uuid7()
+    batch = 5_000
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": sender_id, "username": f"bench{size}",
+                                             "email": f"bench{size}@example.com", "hashed_password": "x"}])
+        for start in range(0, size, batch):
+            messages, terms = [], []
+            for _ in range(min(batch, size - start)):
+                text = " ".join(random.choices(VOCABULARY, WEIGHTS, k=random.randint(3, 25)))
+                message_id = uuid7()
+                messages.append({"id": message_id, "content": encrypt_message(text),
+                                 "sender_id": sender_id, "conversation_id": convo_id})
+                terms.extend({"conversation_id": convo_id, "token": token, "message_id": message_id}
+                             for token in blind_index_tokens(text))
+            conn.execute(insert(models.Message), messages)
+            conn.execute(insert(models.MessageTerm), terms)
+    return convo_id
+
+
+def scan_search(db, convo_id, query):
+    terms = set(normalize_terms(query))
+    tokens = db.execute(select(models.Message.content).where(models.Message.conversation_id == convo_id)).scalars().all()
+    return [text for text in decrypt_messages(tokens) if terms <= set(normalize_terms(text))]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    queries = {"rare term": "w4321", "two common terms": "w3 w7"}
+    print(f"{'messages':>10} {'query':<18} {'index (ms)':>12} {'hits':>6} {'decrypt+scan (ms)':>18}")
+    for size in SIZES:
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        convo_id = seed(engine, size)
+        db = sessionmaker(bind=engine)()
+        for label, query in queries.items():
+            index_ms, hits = timed(lambda: chat_crud.search_conversation_messages(db, convo_id, query, limit=50), 5)
+            scan = f"{timed(lambda: scan_search(db, convo_id, query), 1)[0]:18.1f}" if size <= SCAN_LIMIT else f"{'skipped':>18}"
+            print(f"{size:>10} {label:<18} {index_ms:12.2f} {len(hits):>6} {scan}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Query-plan regression harness for chat_crud and user_crud.
+
+Seeds a scaled dataset and runs every case in CASES, each of which calls one CRUD
+function. It captures the SQL each case issues and EXPLAINs every statement: EXPLAIN
+QUERY PLAN on SQLite, EXPLAIN (FORMAT JSON) on Postgres. A case fails when:
+  - a statement reads a large table sequentially, unless the scan is listed in
+    ACCEPTED_SCANS with a reason, or
+  - its plan got worse than the committed baseline (query_plans_baseline.json). On
+    SQLite that means more full scans or temporary B-trees. On Postgres it means a
+    total cost above PLAN_COST_TOLERANCE times the baseline.
+For every flagged scan it proposes an index on the columns the statement compares for
+equality. With --propose it writes those indexes out as an Alembic revision.
+
+The schema is built by the Alembic migrations (upgrade to head), as deploys build it, so
+the plans see the same indexes and, on Postgres, the monthly partitions of `messages`.
+Postgres runs need a scratch database: the harness drops its public schema and migrates
+it from scratch.
+
+Run from the backend directory:
+    python -m benchmarks.query_plans [--postgres URL] [--scale N] [--update-baseline] [--propose]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.cruds import user_crud, chat_crud
+from app import spool
+from app.core.ids import uuid7
+from app.core.security import blind_index_tokens, encrypt_message
+from app.db import migrate, models, partitions
+from app.db.database import Base
+from app.schemas import schemas
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "query_plans_baseline.json")
+# Tables with at least this many rows after seeding count as large.
+LARGE_TABLE_ROWS = int(os.getenv("QUERY_PLAN_LARGE_TABLE_ROWS", "500"))
+PLAN_COST_TOLERANCE = float(os.getenv("PLAN_COST_TOLERANCE", "1.2"))
+
+# (case, table) -> why a full read of that table is expected. Keep this list short.
+ACCEPTED_SCANS = {
+    ("user_crud.get_users", "users"): "unfiltered page of the directory, bounded by LIMIT",
+    ("user_crud.search_users[contains]", "users"):
+        "substring match: the trigram index serves it on Postgres, SQLite walks users in username order",
+}
+
+
+# --- Dataset ---
+
+@dataclass
+class Dataset:
+    user_id: uuid.UUID
+    friend_id: uuid.UUID
+    stranger_id: uuid.UUID
+    conversation_id: uuid.UUID
+    group_id: uuid.UUID
+    username: str
+    email: str
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+def seed(engine: Engine, scale: int) -> Dataset:
+    """
+    scale x (200 users, 100 conversations, 2,000 messages). One user is in every
+    conversation, like a busy account. A tenth of the conversations are groups of five.
+    """
+    rng = random.Random(43)
+    users = [uuid7() for _ in range(200 * scale)]
+    me = users[0]
+    conversations, participants, messages, terms = [], [], [], []
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for n in range(100 * scale):
+        convo_id = uuid7()
+        group = n % 10 == 0
+        members = {me, *rng.sample(users[1:], 4 if group else 1)}
+        conversations.append({"id": convo_id, "is_group_chat": group, "name": f"group {n}" if group else None,
+                              "last_message_at": start + timedelta(minutes=n)})
+        participants.extend({"user_id": u, "conversation_id": convo_id, "last_read_timestamp": start} for u in members)
+        for i in range(20):
+            plaintext = f"message {i} about topic{rng.randint(0, 50)} in chat {n}"
+            message_id = uuid7()
+            messages.append({"id": message_id, "content": encrypt_message(plaintext), "conversation_id": convo_id,
+                             "sender_id": rng.choice(sorted(members)), "created_at": start + timedelta(minutes=n, seconds=i)})
+            terms.extend({"conversation_id": convo_id, "token": token, "message_id": message_id}
+                         for token in blind_index_tokens(plaintext))
+
+    with engine.begin() as conn:
+        if partitions.is_partitioned(conn):
+            partitions.ensure_partitions(conn, start, start + timedelta(minutes=100 * scale))
+        conn.execute(insert(models.User), [
+            {"id": u, "username": f"user{i:06d}", "full_name": f"Person {i}", "email": f"user{i:06d}@example.com",
+             "hashed_password": "x"}
+            for i, u in enumerate(users)
+        ])
+        conn.execute(insert(models.Conversation), conversations)
+        conn.execute(insert(models.Participant), participants)
+        for start_row in range(0, len(messages), 5_000):
+            conn.execute(insert(models.Message), messages[start_row:start_row + 5_000])
+        for start_row in range(0, len(terms), 20_000):
+            conn.execute(insert(models.MessageTerm), terms[start_row:start_row + 20_000])
+        conn.execute(text("ANALYZE"))
+        counts = {
+            table.name: conn.execute(select(func.count()).select_from(table)).scalar()
+            for table in Base.metadata.sorted_tables
+        }
+
+    one_on_one = next(c for c in conversations if not c["is_group_chat"])
+    friend = next(p["user_id"] for p in participants if p["conversation_id"] == one_on_one["id"] and p["user_id"] != me)
+    group = next(c for c in conversations if c["is_group_chat"])
+    return Dataset(
+        user_id=me, friend_id=friend, stranger_id=users[-1], conversation_id=one_on_one["id"],
+        group_id=group["id"], username="user000100", email="user000100@example.com", counts=counts,
+    )
+
+
+# --- Cases ---
+
+Case = Callable[[Session, Dataset], object]
+
+CASES: Dict[str, Case] = {
+    "chat_crud.create_conversation[existing]": lambda db, d: chat_crud.create_conversation(
+        db, schemas.ConversationCreate(user_ids=[d.friend_id]), d.user_id),
+    "chat_crud.create_conversation[group]": lambda db, d: chat_crud.create_conversation(
+        db, schemas.ConversationCreate(name="new group", user_ids=[d.friend_id, d.stranger_id]), d.user_id),
+    "chat_crud.get_user_conversations": lambda db, d: chat_crud.get_user_conversations(db, d.user_id),
+    "chat_crud.get_user_conversations[limit]": lambda db, d: chat_crud.get_user_conversations(db, d.user_id, limit=50),
+    "chat_crud.get_conversation_participants": lambda db, d: chat_crud.get_conversation_participants(
+        db, [d.conversation_id, d.group_id]),
+    "chat_crud.get_conversation_list_version": lambda db, d: chat_crud.get_conversation_list_version(db, d.user_id),
+    "chat_crud.get_conversation_history_version": lambda db, d: chat_crud.get_conversation_history_version(
+        db, d.conversation_id),
+    "chat_crud.get_conversation_messages": lambda db, d: chat_crud.get_conversation_messages(db, d.conversation_id),
+    "chat_crud.get_conversation_messages[deep]": lambda db, d: chat_crud.get_conversation_messages(
+        db, d.conversation_id, skip=15, limit=5),
+    "chat_crud.get_latest_messages": lambda db, d: chat_crud.get_latest_messages(
+        db, [d.conversation_id, d.group_id], per_conversation=10),
+    "chat_crud.iter_conversation_messages": lambda db, d: list(chat_crud.iter_conversation_messages(
+        db, d.conversation_id)),
+    "chat_crud.is_user_participant": lambda db, d: chat_crud.is_user_participant(db, d.user_id, d.conversation_id),
+    "chat_crud.search_conversation_messages": lambda db, d: chat_crud.search_conversation_messages(
+        db, d.conversation_id, "topic7 message"),
+    "chat_crud.create_message": lambda db, d: chat_crud.create_message(
+        db, schemas.MessageCreate(content="a new message"), d.user_id, d.conversation_id),
+    "chat_crud.create_message[client_id]": lambda db, d: chat_crud.create_message(
+        db, schemas.MessageCreate(content="a new message"), d.user_id, d.conversation_id, client_message_id="c-1"),
+    "chat_crud.store_spooled_messages": lambda db, d: chat_crud.store_spooled_messages(
+        db, [spool.new_record(d.conversation_id, d.user_id, "spooled", client_message_id="c-2")]),
+    "chat_crud.mark_conversation_as_read": lambda db, d: chat_crud.mark_conversation_as_read(
+        db, d.user_id, d.conversation_id),
+    "chat_crud.create_attachment_message": lambda db, d: chat_crud.create_attachment_message(
+        db, d.conversation_id, d.user_id, None, "0" * 64, 1024, "notes.txt", "text/plain"),
+    "chat_crud.get_conversation_attachments": lambda db, d: chat_crud.get_conversation_attachments(
+        db, d.conversation_id),
+    "chat_crud.get_attachment": lambda db, d: chat_crud.get_attachment(db, d.conversation_id, uuid7()),
+    "user_crud.get_user": lambda db, d: user_crud.get_user(db, d.user_id),
+    "user_crud.get_user_by_email": lambda db, d: user_crud.get_user_by_email(db, d.email),
+    "user_crud.get_user_by_username": lambda db, d: user_crud.get_user_by_username(db, d.username),
+    "user_crud.get_users": lambda db, d: user_crud.get_users(db, limit=20),
+    "user_crud.search_users[prefix]": lambda db, d: user_crud.search_users(db, d.user_id, "user0001", limit=20),
+    "user_crud.search_users[contains]": lambda db, d: user_crud.search_users(
+        db, d.user_id, "person 12", match="contains", limit=20),
+    "user_crud.search_users[after]": lambda db, d: user_crud.search_users(db, d.user_id, after="user000500", limit=20),
+}
+
+
+# --- Capture and EXPLAIN ---
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+@dataclass
+class Statement:
+    sql: str
+    plan: List[str]
+    cost: Optional[float]
+    scans: List[str]  # tables read in full
+
+
+@dataclass
+class Result:
+    case: str
+    statements: List[Statement]
+    violations: List[str] = field(default_factory=list)
+    regressions: List[str] = field(default_factory=list)
+    proposals: List[Tuple[str, Tuple[str, ...]]] = field(default_factory=list)
+
+    @property
+    def summary(self) -> dict:
+        scans = sum(len(s.scans) for s in self.statements)
+        temp = sum(1 for s in self.statements for line in s.plan if "TEMP B-TREE" in line or line.startswith("Sort"))
+        costs = [s.cost for s in self.statements if s.cost is not None]
+        return {
+            "scans": scans,
+            "temp_sorts": temp,
+            "cost": round(sum(costs), 2) if costs else None,
+            "plans": [s.plan for s in self.statements],
+        }
+
+
+def capture(engine: Engine, db: Session, case: Case, dataset: Dataset) -> List[Tuple[str, object]]:
+    statements: List[Tuple[str, object]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if _EXPLAINABLE.match(statement):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        case(db, dataset)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    seen, unique = set(), []
+    for statement, parameters in statements:
+        if statement not in seen:
+            seen.add(statement)
+            unique.append((statement, parameters))
+    return unique
+
+
+def _sqlite_plan(conn, sql: str, parameters, large: set) -> Statement:
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, parameters).all()
+    plan = [row[3] for row in rows]
+    scans = []
+    for detail in plan:
+        # "SCAN t" and "SCAN t USING INDEX i" read every row; "USING COVERING INDEX" only
+        # avoids the table lookups. SEARCH is an index range or point lookup.
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in large:
+            scans.append(match.group(1))
+    return Statement(sql, plan, None, scans)
+
+
+def _postgres_plan(conn, sql: str, parameters, large: set) -> Statement:
+    document = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, parameters).scalar()
+    if isinstance(document, str):
+        document = json.loads(document)
+    root = document[0]["Plan"]
+    plan, scans = [], []
+
+    def walk(node, depth):
+        label = node["Node Type"]
+        if "Relation Name" in node:
+            label += f" on {node['Relation Name']}"
+        if "Index Name" in node:
+            label += f" using {node['Index Name']}"
+        plan.append("  " * depth + label)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in large:
+            scans.append(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return Statement(sql, plan, root["Total Cost"], scans)
+
+
+def explain(engine: Engine, captured: List[Tuple[str, object]], large: set) -> List[Statement]:
+    explain_one = _postgres_plan if engine.dialect.name == "postgresql" else _sqlite_plan
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # At this scale a sequential scan is often the cheapest plan, so Postgres
+            # picks it even where an index fits. With seq scans priced out, any Seq Scan
+            # left means no index can serve the statement.
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        return [explain_one(conn, sql, parameters, large) for sql, parameters in captured]
+
+
+# --- Checks ---
+
+def propose_index(sql: str, table: str) -> Tuple[str, ...]:
+    """Columns of `table` the statement compares for equality (=, IN), in order of appearance."""
+    columns = []
+    for column in re.findall(rf"\b{table}\.(\w+)\s*(?:=|IN\b)", sql, re.IGNORECASE):
+        if column not in columns:
+            columns.append(column)
+    return tuple(columns)
+
+
+def check(result: Result, baseline: Optional[dict]) -> None:
+    for statement in result.statements:
+        for table in statement.scans:
+            reason = ACCEPTED_SCANS.get((result.case, table))
+            if reason is not None:
+                continue
+            result.violations.append(f"full scan of {table}: {statement.sql.split(chr(10))[0][:120]}")
+            columns = propose_index(statement.sql, table)
+            if columns and (table, columns) not in result.proposals:
+                result.proposals.append((table, columns))
+    if baseline is None:
+        result.regressions.append("no baseline; run with --update-baseline")
+        return
+    summary = result.summary
+    if summary["scans"] > baseline["scans"]:
+        result.regressions.append(f"full scans {baseline['scans']} -> {summary['scans']}")
+    if summary["temp_sorts"] > baseline["temp_sorts"]:
+        result.regressions.append(f"temporary sorts {baseline['temp_sorts']} -> {summary['temp_sorts']}")
+    if summary["cost"] is not None and baseline.get("cost") is not None \
+            and summary["cost"] > baseline["cost"] * PLAN_COST_TOLERANCE:
+        result.regressions.append(f"plan cost {baseline['cost']} -> {summary['cost']}")
+
+
+def run(url: Optional[str] = None, scale: int = 5, baseline_path: str = BASELINE_PATH) -> Tuple[str, List[Result]]:
+    """Seeds a fresh database (a temporary SQLite file unless `url` is given) and checks every case."""
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'query_plans.db')}"
+    engine = create_engine(url)
+    try:
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                conn.execute(text("DROP SCHEMA public CASCADE"))
+                conn.execute(text("CREATE SCHEMA public"))
+        migrate.upgrade(engine)
+        dataset = seed(engine, scale)
+        large = {table for table, rows in dataset.counts.items() if rows >= LARGE_TABLE_ROWS}
+        dialect = engine.dialect.name
+        baseline = load_baseline(baseline_path).get(dialect, {})
+
+        Session = sessionmaker(bind=engine)
+        results = []
+        for name, case in CASES.items():
+            with Session() as db:
+                captured = capture(engine, db, case, dataset)
+                db.rollback()
+            result = Result(name, explain(engine, captured, large))
+            check(result, baseline.get(name))
+            results.append(result)
+        return dialect, results
+    finally:
+        engine.dispose()
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(dialect: str, results: List[Result], path: str = BASELINE_PATH) -> None:
+    baseline = load_baseline(path)
+    baseline[dialect] = {result.case: result.summary for result in results}
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def write_migration(proposals: List[Tuple[str, Tuple[str, ...]]]) -> str:
+    """Writes the proposed indexes as a new Alembic revision and returns its path."""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory.from_config(Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini")))
+    head = script.get_current_head()
+    revision = f"{int(head) + 1:04d}" if head and head.isdigit() else uuid.uuid4().hex[:12]
+    lines_up, lines_down = [], []
+    for table, columns in proposals:
+        name = json.dumps(f"ix_{table}_" + "_".join(columns))
+        lines_up.append(f"    op.create_index({name}, {json.dumps(table)}, {json.dumps(list(columns))}, if_not_exists=True)")
+        lines_down.append(f"    op.drop_index({name}, table_name={json.dumps(table)})")
+    path = os.path.join(script.dir, "versions", f"{revision}_query_plan_indexes.py")
+    with open(path, "w") as f:
+        f.write(
+            f'"""Indexes proposed by benchmarks/query_plans.py\n\n'
+            f"Revision ID: {revision}\nRevises: {head}\nCreate Date: {datetime.now(timezone.utc):%Y-%m-%d}\n\"\"\"\n"
+            f"from alembic import op\n\nrevision = {json.dumps(revision)}\ndown_revision = {json.dumps(head)}\n"
+            f"branch_labels = None\ndepends_on = None\n\n\n"
+            f"def upgrade():\n" + "\n".join(lines_up) + "\n\n\n"
+            f"def downgrade():\n" + "\n".join(lines_down) + "\n"
+        )
+    return path
+
+
+def report(dialect: str, results: List[Result]) -> None:
+    print(f"{dialect}: {len(results)} cases")
+    for result in results:
+        summary = result.summary
+        status = "FAIL" if result.violations or result.regressions else "ok"
+        cost = f" cost {summary['cost']}" if summary["cost"] is not None else ""
+        print(f"  {status:4} {result.case:<48} scans {summary['scans']} sorts {summary['temp_sorts']}{cost}")
+        for problem in result.violations + result.regressions:
+            print(f"         {problem}")
+        for table, columns in result.proposals:
+            print(f"         proposed index on {table} ({', '.join(columns)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of every CRUD function.")
+    parser.add_argument("--postgres", metavar="URL", default=os.getenv("QUERY_PLAN_POSTGRES_URL"),
+                        help="scratch Postgres database to run against instead of SQLite")
+    parser.add_argument("--scale", type=int, default=5)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--propose", action="store_true", help="write proposed indexes as an Alembic revision")
+    args = parser.parse_args()
+
+    dialect, results = run(args.postgres, args.scale)
+    report(dialect, results)
+    if args.update_baseline:
+        save_baseline(dialect, results)
+        print(f"Baseline for {dialect} written to {BASELINE_PATH}")
+    proposals = [proposal for result in results for proposal in result.proposals]
+    if args.propose and proposals:
+        print(f"Wrote {write_migration(list(dict.fromkeys(proposals)))}")
+    failed = any(result.violations or (result.regressions and not args.update_baseline) for result in results)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
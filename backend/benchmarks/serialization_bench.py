@@ -0,0 +1,139 @@
+"""
+Response-building cost of the list endpoints: ORM objects validated through the
+pydantic response_model versus the row tuples + FastJSONResponse fast path.
+
+Seeds a 500-conversation inbox (three participants each) and a 100-message history
+page on SQLite, then times building the response body both ways. "load" is the
+query (plus lazy loads for the ORM path), "encode" is validation/dict building and
+JSON encoding. Both paths must produce the same bytes; the script checks that.
+
+Run from the backend directory:
+    python -m benchmarks.serialization_bench
+"""
+import os
+import time
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.cruds import chat_crud
+from app.core.ids import uuid7
+from app.core.security import decrypt_message, encrypt_message
+from app.db import models
+from app.schemas import schemas, serializers
+
+CONVERSATIONS = 500
+MESSAGES = 100
+ROUNDS = 20
+
+
+def seed(engine):
+    models.Base.metadata.create_all(bind=engine)
+    users = [uuid7() for _ in range(3)]
+    convo_ids = [uuid7() for _ in range(CONVERSATIONS)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": u, "username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": "x"}
+            for i, u in enumerate(users)
+        ])
+        conn.execute(insert(models.Conversation), [
+            {"id": c, "name": f"group {i}", "is_group_chat": True} for i, c in enumerate(convo_ids)
+        ])
+        conn.execute(insert(models.Participant), [
+            {"user_id": u, "conversation_id": c} for c in convo_ids for u in users
+        ])
+        conn.execute(insert(models.Message), [
+            {"id": uuid7(), "content": encrypt_message(f"message number {i} with a bit of text"),
+             "sender_id": users[i % 3], "conversation_id": convo_ids[0]}
+            for i in range(MESSAGES)
+        ])
+    return users[0], convo_ids[0]
+
+
+def orm_conversations(db, user_id):
+    # The pre-fast-path shape: ORM conversations, participants lazy-loaded during validation.
+    convos = (
+        db.query(models.Conversation)
+        .join(models.Participant)
+        .filter(models.Participant.user_id == user_id)
+        .order_by(models.Conversation.last_message_at.desc())
+        .all()
+    )
+    for convo in convos:
+        convo.has_unread = False
+    return convos
+
+
+def orm_messages(db, conversation_id):
+    messages = (
+        db.query(models.Message)
+        .filter(models.Message.conversation_id == conversation_id)
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+        .limit(MESSAGES)
+        .all()
+    )
+    return [
+        {"content": decrypt_message(m.content), "id": m.id, "status": m.status,
+         "sender": m.sender, "created_at": m.created_at}
+        for m in messages
+    ]
+
+
+def timed(Session, load, encode):
+    load_s = encode_s = 0.0
+    body = b""
+    for _ in range(ROUNDS):
+        db = Session()
+        started = time.perf_counter()
+        data = load(db)
+        loaded = time.perf_counter()
+        body = encode(data)
+        load_s += loaded - started
+        encode_s += time.perf_counter() - loaded
+        db.close()
+    return load_s / ROUNDS * 1000, encode_s / ROUNDS * 1000, body
+
+
+def main():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    Session = sessionmaker(bind=engine)
+    user_id, convo_id = seed(engine)
+
+    conversation_adapter = TypeAdapter(List[schemas.Conversation])
+    message_adapter = TypeAdapter(List[schemas.Message])
+    cases = [
+        (
+            f"inbox ({CONVERSATIONS} conversations)",
+            (lambda db: orm_conversations(db, user_id),
+             lambda objs: conversation_adapter.dump_json(conversation_adapter.validate_python(objs, from_attributes=True))),
+            (lambda db: chat_crud.get_user_conversations(db, user_id),
+             lambda rows: serializers.FastJSONResponse(serializers.conversation_dicts(rows)).body),
+        ),
+        (
+            f"history ({MESSAGES} messages)",
+            (lambda db: orm_messages(db, convo_id),
+             lambda objs: message_adapter.dump_json(message_adapter.validate_python(objs, from_attributes=True))),
+            (lambda db: chat_crud.get_conversation_messages(db, convo_id, limit=MESSAGES),
+             lambda rows: serializers.FastJSONResponse(serializers.message_dicts(rows)).body),
+        ),
+    ]
+
+    print(f"orjson: {'yes' if serializers.orjson else 'no (pydantic-core fallback)'}")
+    print(f"{'payload':<28} {'path':<10} {'load (ms)':>10} {'encode (ms)':>12} {'total (ms)':>11}")
+    for label, old, new in cases:
+        results = []
+        for name, (load, encode) in (("orm", old), ("fast", new)):
+            load_ms, encode_ms, body = timed(Session, load, encode)
+            results.append(body)
+            print(f"{label:<28} {name:<10} {load_ms:10.2f} {encode_ms:12.2f} {load_ms + encode_ms:11.2f}")
+        print(f"{'':<28} {'bytes equal':<10} {str(results[0] == results[1]):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+User directory search at 1M users (SQLite).
+
+Compares the old GET /users/ access pattern (offset pages, current user dropped in
+Python, matching done by the client) with user_crud.search_users: an indexed prefix
+search and keyset pages deep into the directory.
+
+Run from the backend directory:
+    python -m benchmarks.user_search_bench [users]
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.ids import uuid7
+from app.cruds import user_crud
+from app.db import models
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+FIRST_NAMES = ["ada", "grace", "alan", "edsger", "barbara", "donald", "margaret", "ken", "dennis", "linus"]
+
+
+def seed(engine):
+    models.Base.metadata.create_all(bind=engine)
+    batch = 50_000
+    with engine.begin() as conn:
+        for start in range(0, USERS, batch):
+            conn.execute(insert(models.User), [
+                {
+                    "id": uuid7(),
+                    "username": f"{FIRST_NAMES[i % len(FIRST_NAMES)]}{i:07d}",
+                    "full_name": f"{FIRST_NAMES[(i * 7) % len(FIRST_NAMES)].title()} Person{i}",
+                    "email": f"user{i:07d}@example.com",
+                    "hashed_password": "x",
+                }
+                for i in range(start, min(start + batch, USERS))
+            ])
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "users_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    start = time.perf_counter()
+    seed(engine)
+    print(f"seeded {USERS} users in {time.perf_counter() - start:.1f}s")
+
+    db = sessionmaker(bind=engine)()
+    me = db.query(models.User).first()
+    deep_offset = USERS - 200
+    deep_cursor = user_crud.get_users(db, skip=deep_offset - 1, limit=1)[0].username
+
+    rows = [
+        ("old: offset page near the end", lambda: [
+            u for u in user_crud.get_users(db, skip=deep_offset, limit=100) if u.id != me.id
+        ]),
+        ("new: keyset page near the end", lambda: user_crud.search_users(
+            db, exclude_user_id=me.id, after=deep_cursor, limit=100)),
+        ("old: scan for 'grace0099' client-side", lambda: [
+            u for u in db.query(models.User).all() if u.username.startswith("grace0099")
+        ]),
+        ("new: prefix search 'grace0099'", lambda: user_crud.search_users(
+            db, exclude_user_id=me.id, query="grace0099", limit=100)),
+        ("new: prefix search on email 'user09999'", lambda: user_crud.search_users(
+            db, exclude_user_id=me.id, query="user09999", limit=100)),
+        ("new: substring search 'person99999' (scan on SQLite)", lambda: user_crud.search_users(
+            db, exclude_user_id=me.id, query="person99999", match="contains", limit=100)),
+    ]
+    for label, fn in rows:
+        ms, result = timed(fn, repeat=1 if "client-side" in label else 5)
+        print(f"  {label:<52} {ms:10.2f} ms  ({len(result)} rows)")
+
+
+if __name__ == "__main__":
+    main()
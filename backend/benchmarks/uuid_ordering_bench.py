@@ -0,0 +1,97 @@
+"""
+Insert throughput and index size with random (uuid4) against time-ordered (uuid7)
+message ids, on SQLite.
+
+Both runs insert the same messages in batches into a file database and report
+rows/s, the size of the primary-key index and the (conversation_id, created_at, id)
+index, and how much of each is wasted in half-empty pages. With uuid4 every insert lands
+on a random leaf and splits it. With uuid7 inserts append at the right edge.
+
+Set BENCH_POSTGRES_URL to run the same comparison against Postgres; that run reports
+pg_relation_size.
+
+Run from the backend directory:
+    python -m benchmarks.uuid_ordering_bench [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert, text
+
+from app.core.ids import uuid7
+from app.db import models
+from app.db.database import Base
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+BATCH = 1_000
+CONVERSATIONS = 50
+GENERATORS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+def run(engine, make_id) -> float:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    sender_id = make_id()
+    convo_ids = [make_id() for _ in range(CONVERSATIONS)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": sender_id, "username": "bench",
+                                             "email": "bench@example.com", "hashed_password": "x"}])
+        conn.execute(insert(models.Conversation), [{"id": c, "is_group_chat": False} for c in convo_ids])
+    start = time.perf_counter()
+    for offset in range(0, ROWS, BATCH):
+        with engine.begin() as conn:
+            conn.execute(insert(models.Message), [
+                {"id": make_id(), "content": "x" * 40, "sender_id": sender_id,
+                 "conversation_id": convo_ids[n % CONVERSATIONS]}
+                for n in range(offset, min(offset + BATCH, ROWS))
+            ])
+    return time.perf_counter() - start
+
+
+def sqlite_index_sizes(engine) -> dict:
+    """Pages and unused bytes per index, from the dbstat virtual table."""
+    sizes = {}
+    with engine.connect() as conn:
+        for name in ("sqlite_autoindex_messages_1", "ix_messages_conversation_order"):
+            pages, unused, page_size = conn.execute(text(
+                "SELECT count(*), sum(unused), max(pgsize) FROM dbstat WHERE name = :name"
+            ), {"name": name}).one()
+            sizes[name] = (pages * page_size, unused / (pages * page_size))
+    return sizes
+
+
+def postgres_index_sizes(engine) -> dict:
+    with engine.connect() as conn:
+        return {
+            name: (conn.execute(text("SELECT pg_relation_size(:name)"), {"name": name}).scalar(), None)
+            for name in ("messages_pkey", "ix_messages_conversation_order")
+        }
+
+
+def report(label: str, engine, index_sizes) -> None:
+    print(label)
+    for kind, make_id in GENERATORS.items():
+        elapsed = run(engine, make_id)
+        print(f"  {kind}: {ROWS / elapsed:9,.0f} rows/s")
+        for name, (size, unused) in index_sizes(engine).items():
+            waste = f", {unused:.0%} unused" if unused is not None else ""
+            print(f"    {name:32} {size / 1024:9,.0f} KiB{waste}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        report(f"SQLite, {ROWS:,} messages in batches of {BATCH}", engine, sqlite_index_sizes)
+        engine.dispose()
+    postgres_url = os.getenv("BENCH_POSTGRES_URL")
+    if postgres_url:
+        report(f"Postgres, {ROWS:,} messages in batches of {BATCH}", create_engine(postgres_url), postgres_index_sizes)
+
+
+if __name__ == "__main__":
+    main()
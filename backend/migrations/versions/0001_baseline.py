@@ -0,0 +1,107 @@
+"""Baseline: the schema that create_all used to build
+
+Brings an empty database, or one created by an earlier create_all, to the schema
+as it stood before versioned migrations. Existing tables are kept; only missing
+tables, columns and indexes are added.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+MESSAGE_STATUS = sa.Enum("sent", "delivered", "read", name="messagestatus")
+
+LAST_MESSAGE_COLUMNS = (
+    ("last_message_id", sa.Uuid),
+    ("last_message_sender_id", sa.Uuid),
+    ("last_message_preview", sa.Text),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    postgres = bind.dialect.name == "postgresql"
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Uuid, primary_key=True),
+            sa.Column("email", sa.String, nullable=False),
+            sa.Column("username", sa.String, nullable=False),
+            sa.Column("full_name", sa.String),
+            sa.Column("hashed_password", sa.String, nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+            sa.Column("avatar_url", sa.String, nullable=True),
+        )
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+    pattern_ops = " text_pattern_ops" if postgres else ""
+    for column in ("username", "full_name", "email"):
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_users_{column}_lower ON users (lower({column}){pattern_ops})")
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_users_search_trgm ON users "
+            "USING gin ((lower(username || ' ' || coalesce(full_name, '') || ' ' || email)) gin_trgm_ops)"
+        )
+
+    if "conversations" not in tables:
+        op.create_table(
+            "conversations",
+            sa.Column("id", sa.Uuid, primary_key=True),
+            sa.Column("name", sa.String, nullable=True),
+            sa.Column("is_group_chat", sa.Boolean),
+            sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+            sa.Column("last_message_at", sa.TIMESTAMP(timezone=True), nullable=True),
+            sa.Column("last_message_id", sa.Uuid, nullable=True),
+            sa.Column("last_message_sender_id", sa.Uuid, sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("last_message_preview", sa.Text, nullable=True),
+        )
+    else:
+        present = {column["name"] for column in inspector.get_columns("conversations")}
+        for name, type_ in LAST_MESSAGE_COLUMNS:
+            if name not in present:
+                op.add_column("conversations", sa.Column(name, type_, nullable=True))
+
+    if "participants" not in tables:
+        op.create_table(
+            "participants",
+            sa.Column("user_id", sa.Uuid, sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("conversation_id", sa.Uuid, sa.ForeignKey("conversations.id"), primary_key=True),
+            sa.Column("last_read_timestamp", sa.TIMESTAMP(timezone=True)),
+        )
+
+    if "messages" not in tables:
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.Uuid, primary_key=True),
+            sa.Column("content", sa.Text, nullable=False),
+            sa.Column("sender_id", sa.Uuid, sa.ForeignKey("users.id")),
+            sa.Column("conversation_id", sa.Uuid, sa.ForeignKey("conversations.id")),
+            sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+            sa.Column("status", MESSAGE_STATUS, nullable=False),
+        )
+
+    if "message_terms" not in tables:
+        op.create_table(
+            "message_terms",
+            sa.Column("conversation_id", sa.Uuid, primary_key=True),
+            sa.Column("token", sa.String(32), primary_key=True),
+            sa.Column("message_id", sa.Uuid, primary_key=True),
+        )
+
+
+def downgrade():
+    for table in ("message_terms", "messages", "participants", "conversations", "users"):
+        op.drop_table(table)
+    if op.get_bind().dialect.name == "postgresql":
+        MESSAGE_STATUS.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,33 @@
+"""Index messages by (conversation_id, created_at, id)
+
+Messages and conversations now get time-ordered UUIDv7 ids from the application
+(app/core/ids.py), and history is ordered by (created_at, id) so ties on created_at
+have a stable order. This index serves that order per conversation. Existing uuid4
+ids stay as they are; the column type does not change.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_messages_conversation_order"
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        # Build without blocking writes to a live messages table.
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, "messages", ["conversation_id", "created_at", "id"],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX, "messages", ["conversation_id", "created_at", "id"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name="messages")
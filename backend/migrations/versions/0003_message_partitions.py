@@ -0,0 +1,86 @@
+"""Partition messages by month and add the message_segments registry
+
+On Postgres, `messages` becomes a table partitioned by RANGE (created_at): one
+partition per month from the oldest message through PARTITION_MONTHS_AHEAD months from
+now, plus a DEFAULT partition. The primary key becomes (id, created_at), because a
+partitioned table's unique keys must include the partition key. Nothing references
+messages.id by foreign key. The existing rows are copied, so run this in a maintenance
+window on large tables.
+
+SQLite has no declarative partitioning, so `messages` stays a single table there.
+Both dialects get `message_segments`, the registry of months the archive job has moved
+into segment files.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.db import partitions
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "message_segments" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "message_segments",
+            sa.Column("period_start", sa.TIMESTAMP(timezone=True), primary_key=True),
+            sa.Column("period_end", sa.TIMESTAMP(timezone=True), nullable=False),
+            sa.Column("file_name", sa.String, nullable=False),
+            sa.Column("message_count", sa.Integer, nullable=False),
+            sa.Column("size_bytes", sa.BigInteger, nullable=False),
+            sa.Column("sha256", sa.String(64), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        )
+    if bind.dialect.name == "postgresql" and not partitions.is_partitioned(bind):
+        _partition_messages(bind)
+
+
+def _partition_messages(bind):
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_messages_conversation_order")
+    op.execute("UPDATE messages_unpartitioned SET created_at = now() WHERE created_at IS NULL")
+    op.execute(
+        "CREATE TABLE messages ("
+        " LIKE messages_unpartitioned INCLUDING DEFAULTS,"
+        " PRIMARY KEY (id, created_at),"
+        " FOREIGN KEY (sender_id) REFERENCES users (id),"
+        " FOREIGN KEY (conversation_id) REFERENCES conversations (id)"
+        ") PARTITION BY RANGE (created_at)"
+    )
+    op.execute(f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
+    now = datetime.now(timezone.utc)
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM messages_unpartitioned")).scalar() or now
+    partitions.ensure_partitions(bind, oldest, partitions.add_months(partitions.month_start(now), partitions.PARTITION_MONTHS_AHEAD + 1))
+    op.execute("CREATE INDEX ix_messages_conversation_order ON messages (conversation_id, created_at, id)")
+    op.execute("INSERT INTO messages SELECT * FROM messages_unpartitioned")
+    op.execute("DROP TABLE messages_unpartitioned")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql" and partitions.is_partitioned(bind):
+        op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+        op.execute("DROP INDEX IF EXISTS ix_messages_conversation_order")
+        op.execute(
+            "CREATE TABLE messages ("
+            " LIKE messages_partitioned INCLUDING DEFAULTS,"
+            " PRIMARY KEY (id),"
+            " FOREIGN KEY (sender_id) REFERENCES users (id),"
+            " FOREIGN KEY (conversation_id) REFERENCES conversations (id)"
+            ")"
+        )
+        op.execute("INSERT INTO messages SELECT * FROM messages_partitioned")
+        op.execute("DROP TABLE messages_partitioned CASCADE")
+        op.execute("CREATE INDEX ix_messages_conversation_order ON messages (conversation_id, created_at, id)")
+    op.drop_table("message_segments")
@@ -0,0 +1,32 @@
+"""Index participants by conversation_id
+
+The participants primary key is (user_id, conversation_id), which serves "conversations
+of a user" but not "members of a conversation". Every membership lookup by
+conversation (participant lists, the history ETag, the 1-on-1 duplicate check) read
+the whole table. Proposed by benchmarks/query_plans.py.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_participants_conversation_id"
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, "participants", ["conversation_id"],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX, "participants", ["conversation_id"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name="participants")
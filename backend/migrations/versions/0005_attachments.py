@@ -0,0 +1,39 @@
+"""Attachments
+
+One row per file sent in a conversation. The bytes are in the blob store
+(app/core/blob_store.py), addressed by sha256.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "attachments" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "attachments",
+        sa.Column("id", sa.Uuid, primary_key=True),
+        sa.Column("conversation_id", sa.Uuid, sa.ForeignKey("conversations.id"), nullable=False),
+        sa.Column("message_id", sa.Uuid, nullable=False),
+        sa.Column("uploader_id", sa.Uuid, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("size", sa.BigInteger, nullable=False),
+        sa.Column("filename", sa.String, nullable=False),
+        sa.Column("content_type", sa.String, nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_attachments_conversation_id", "attachments", ["conversation_id", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_attachments_conversation_id", table_name="attachments")
+    op.drop_table("attachments")
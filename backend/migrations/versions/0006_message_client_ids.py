@@ -0,0 +1,32 @@
+"""Message idempotency keys
+
+Maps (sender_id, client_message_id) to the stored message, so a client retrying a
+send, or the message spool (app/spool.py) replaying after a crash, cannot create the
+message twice.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "message_client_ids" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "message_client_ids",
+        sa.Column("sender_id", sa.Uuid, primary_key=True),
+        sa.Column("client_message_id", sa.String(64), primary_key=True),
+        sa.Column("message_id", sa.Uuid, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("message_client_ids")
@@ -0,0 +1,33 @@
+"""Per-conversation history version
+
+A counter on conversations bumped by every stored message and by archiving or
+restoring a month. The history ETag includes it, so a page that changes without the
+newest message changing (a spooled message drained late, an archive run) is not
+answered with a stale 304.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("conversations")}
+    if "history_version" in columns:
+        return
+    op.add_column(
+        "conversations",
+        sa.Column("history_version", sa.Integer, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("conversations") as batch:
+        batch.drop_column("history_version")
@@ -0,0 +1,83 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cruds import chat_crud
+from app.websocket import manager
+
+from app.db import models
+
+from conftest import get_auth_headers, send_message
+
+
+def _inbox(client: TestClient, db: Session, prefix: str, conversations: int, messages: int):
+    """Registers a user with `conversations` chats of `messages` messages each, oldest chat first."""
+    # Explicit, distinct timestamps: SQLite's CURRENT_TIMESTAMP only has second resolution.
+    clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    me = client.post("/auth/register", json={"email": f"{prefix}@example.com", "username": prefix, "password": "password123"}).json()
+    headers = get_auth_headers(client, prefix)
+    convo_ids = []
+    for i in range(conversations):
+        friend = client.post("/auth/register", json={"email": f"{prefix}{i}@example.com", "username": f"{prefix}{i}", "password": "password123"}).json()
+        convo_id = client.post("/conversations/", json={"user_ids": [friend["id"]]}, headers=headers).json()["id"]
+        for n in range(messages):
+            clock += timedelta(seconds=1)
+            msg = send_message(db, uuid.UUID(friend["id"]), uuid.UUID(convo_id), f"{prefix} chat {i} message {n}")
+            msg.created_at = clock
+            db.get(models.Conversation, msg.conversation_id).last_message_at = clock
+            db.flush()
+        convo_ids.append(convo_id)
+    return headers, me["id"], convo_ids
+
+
+def test_bootstrap_returns_recent_conversations_messages_and_presence(test_client: TestClient, db_session: Session):
+    """
+    Test that bootstrap lists the most recent conversations with their last K messages and who is online.
+    """
+    headers, my_id, convo_ids = _inbox(test_client, db_session, "boot", conversations=3, messages=5)
+    ws = object()
+    manager._add_connection(ws, my_id, convo_ids[2])
+    try:
+        res = test_client.get("/conversations/bootstrap", params={"conversations": 2, "messages": 3}, headers=headers)
+    finally:
+        manager._remove_connection(ws, my_id, convo_ids[2])
+    assert res.status_code == 200
+    body = res.json()
+
+    assert [c["id"] for c in body["conversations"]] == [convo_ids[2], convo_ids[1]]
+    assert [m["content"] for m in body["messages"][convo_ids[2]]] == [f"boot chat 2 message {n}" for n in (2, 3, 4)]
+    assert len(body["messages"][convo_ids[1]]) == 3
+    assert body["presence"] == {convo_ids[2]: [my_id], convo_ids[1]: []}
+
+
+def test_bootstrap_query_count_does_not_grow_with_inbox(test_client: TestClient, db_session: Session):
+    headers, _, _ = _inbox(test_client, db_session, "many", conversations=6, messages=2)
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        res = test_client.get("/conversations/bootstrap", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert res.status_code == 200 and len(res.json()["conversations"]) == 6
+    # user lookup for auth, conversations, participants, latest messages
+    assert len(statements) == 4
+
+
+def test_latest_messages_across_query_chunks(test_client: TestClient, db_session: Session, monkeypatch):
+    monkeypatch.setattr(chat_crud, "LATEST_MESSAGES_CHUNK", 2)
+    _, _, convo_ids = _inbox(test_client, db_session, "chunky", conversations=3, messages=4)
+    ids = [uuid.UUID(convo_id) for convo_id in convo_ids]
+
+    latest = chat_crud.get_latest_messages(db_session, ids + [uuid.uuid4()], per_conversation=2)
+
+    assert set(latest) == set(ids)
+    for i, convo_id in enumerate(ids):
+        assert [row[1] for row in latest[convo_id]] == [f"chunky chat {i} message {n}" for n in (2, 3)]
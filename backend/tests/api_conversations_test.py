@@ -1,6 +1,12 @@
+import uuid
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
 from typing import Dict
 
+from app import spool
+from app.cruds import chat_crud
+from app.schemas import schemas
+
 # This is a helper function to reduce boilerplate code in tests.
 # It handles logging in a user and returning the authorization headers.
 def get_auth_headers(client: TestClient, username: str, password: str = "password123") -> Dict[str, str]:
@@ -114,3 +120,69 @@ def test_cannot_get_messages_from_unrelated_conversation(test_client: TestClient
     assert get_messages_res.status_code == 403
     assert get_messages_res.json() == {"detail": "User is not a participant of this conversation"}
 
+
+def test_conversation_list_etag_returns_304_until_something_changes(test_client: TestClient):
+    """
+    Test that polling the conversation list with If-None-Match gets a 304 while
+    nothing changed, and a fresh 200 once a new conversation appears.
+    """
+    test_client.post("/auth/register", json={"email": "poller@test.com", "username": "poller", "password": "password123"})
+    friend_res = test_client.post("/auth/register", json={"email": "friend@test.com", "username": "friend", "password": "password123"})
+    headers = get_auth_headers(test_client, "poller")
+
+    first = test_client.get("/conversations/", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    unchanged = test_client.get("/conversations/", headers={**headers, "If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    test_client.post("/conversations/", json={"user_ids": [friend_res.json()["id"]]}, headers=headers)
+    changed = test_client.get("/conversations/", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 1
+
+
+def test_message_history_etag_changes_with_read_state_and_page(test_client: TestClient):
+    """
+    Test that history ETags differ per page and change when the read state changes.
+    """
+    test_client.post("/auth/register", json={"email": "reader@test.com", "username": "reader", "password": "password123"})
+    other_res = test_client.post("/auth/register", json={"email": "writer@test.com", "username": "writer", "password": "password123"})
+    headers = get_auth_headers(test_client, "reader")
+    convo_id = test_client.post("/conversations/", json={"user_ids": [other_res.json()["id"]]}, headers=headers).json()["id"]
+
+    page = test_client.get(f"/conversations/{convo_id}/messages", headers=headers)
+    etag = page.headers["ETag"]
+    assert test_client.get(f"/conversations/{convo_id}/messages", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    other_page = test_client.get(f"/conversations/{convo_id}/messages?skip=100", headers={**headers, "If-None-Match": etag})
+    assert other_page.status_code == 200
+
+    test_client.post(f"/conversations/{convo_id}/read", headers=headers)
+    assert test_client.get(f"/conversations/{convo_id}/messages", headers={**headers, "If-None-Match": etag}).status_code == 200
+
+
+def test_message_history_etag_changes_when_an_older_message_is_drained(test_client: TestClient, db_session):
+    """
+    Test that a spooled message drained into the middle of a page changes the ETag,
+    although the conversation's newest message stays the same.
+    """
+    sender = test_client.post("/auth/register", json={"email": "drainer@test.com", "username": "drainer", "password": "password123"}).json()
+    other_res = test_client.post("/auth/register", json={"email": "watcher@test.com", "username": "watcher", "password": "password123"})
+    headers = get_auth_headers(test_client, "drainer")
+    convo_id = test_client.post("/conversations/", json={"user_ids": [other_res.json()["id"]]}, headers=headers).json()["id"]
+    sender_id = uuid.UUID(sender["id"])
+    chat_crud.create_message(db_session, schemas.MessageCreate(content="newest"), sender_id, uuid.UUID(convo_id))
+
+    page = test_client.get(f"/conversations/{convo_id}/messages", headers=headers)
+    etag = page.headers["ETag"]
+    late = spool.new_record(uuid.UUID(convo_id), sender_id, "accepted during the outage")
+    late["created_at"] = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    chat_crud.store_spooled_messages(db_session, [late])
+
+    refreshed = test_client.get(f"/conversations/{convo_id}/messages", headers={**headers, "If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert [m["content"] for m in refreshed.json()] == ["accepted during the outage", "newest"]
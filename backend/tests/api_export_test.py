@@ -0,0 +1,123 @@
+import asyncio
+import csv
+import io
+import json
+import os
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.main import app
+from app.core.ids import uuid7
+from app.core.security import encrypt_message
+from app.cruds import chat_crud
+from app.db import models
+from app.schemas import schemas
+
+from conftest import get_auth_headers, setup_conversation
+
+slow = pytest.mark.skipif(not os.getenv("RUN_SLOW_TESTS"), reason="set RUN_SLOW_TESTS=1 to run")
+
+
+def test_export_ndjson_and_csv(test_client: TestClient, db_session: Session):
+    """
+    Test that an export streams every message, decrypted, in both formats.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "exporter")
+    for text in ["first", "second, with a comma", "third \"quoted\""]:
+        chat_crud.create_message(db_session, schemas.MessageCreate(content=text), sender_id, convo_id)
+
+    ndjson_res = test_client.get(f"/conversations/{convo_id}/export", headers=headers)
+    assert ndjson_res.status_code == 200
+    assert ndjson_res.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in ndjson_res.text.splitlines()]
+    assert [line["content"] for line in lines] == ["first", "second, with a comma", "third \"quoted\""]
+    assert lines[0]["sender"]["username"] == "exporter_a"
+
+    csv_res = test_client.get(f"/conversations/{convo_id}/export?format=csv", headers=headers)
+    assert csv_res.status_code == 200
+    rows = list(csv.reader(io.StringIO(csv_res.text)))
+    assert rows[0][:4] == ["id", "sender_id", "sender_username", "content"]
+    assert [row[3] for row in rows[1:]] == ["first", "second, with a comma", "third \"quoted\""]
+
+
+def test_export_requires_participation(test_client: TestClient):
+    _, _, convo_id = setup_conversation(test_client, "private_export")
+    test_client.post("/auth/register", json={"email": "snoop@test.com", "username": "snoop", "password": "password123"})
+
+    res = test_client.get(f"/conversations/{convo_id}/export", headers=get_auth_headers(test_client, "snoop"))
+    assert res.status_code == 403
+
+
+def _rss_kb(field: str) -> int:
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith(field):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+async def _drain_export(path: str, headers: Dict[str, str]) -> int:
+    """
+    Drives the ASGI app directly and discards the body as it arrives. TestClient would
+    buffer the whole response, which is exactly what this test must not do.
+    Returns the number of NDJSON lines received.
+    """
+    request_sent = False
+    never = asyncio.Event()
+    lines = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await never.wait()
+
+    async def send(message):
+        nonlocal lines
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        elif message["type"] == "http.response.body":
+            lines += message.get("body", b"").count(b"\n")
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return lines
+
+
+@pytest.mark.parametrize("count", [20_000, pytest.param(1_000_000, marks=slow)])
+def test_export_memory_is_bounded(test_client: TestClient, db_session: Session, count: int):
+    """
+    Test that exporting a large conversation keeps peak RSS within a fixed budget,
+    independent of the number of messages.
+    """
+    if not os.path.exists("/proc/self/clear_refs"):
+        pytest.skip("peak RSS accounting needs Linux /proc")
+    headers, sender_id, convo_id = setup_conversation(test_client, f"bulk{count}")
+
+    token = encrypt_message("a perfectly ordinary chat message of ordinary length")
+    batch = 10_000
+    for start in range(0, count, batch):
+        db_session.execute(insert(models.Message), [
+            {"id": uuid7(), "content": token, "sender_id": sender_id, "conversation_id": convo_id}
+            for _ in range(min(batch, count - start))
+        ])
+
+    # Reset the high-water mark so only the export itself is measured.
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    baseline_kb = _rss_kb("VmRSS")
+
+    exported = asyncio.run(_drain_export(f"/conversations/{convo_id}/export", headers))
+
+    assert exported == count
+    assert _rss_kb("VmHWM") - baseline_kb < 64 * 1024
@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.jobs.rebuild_message_index import rebuild_message_index
+
+from conftest import send_message, setup_conversation
+
+
+def test_search_matches_all_terms_normalized(test_client: TestClient, db_session: Session):
+    """
+    Test that search requires every query term and ignores case and accents.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "finder")
+    send_message(db_session, sender_id, convo_id, "Lunch at the Café tomorrow?")
+    send_message(db_session, sender_id, convo_id, "The cafe was closed, sorry")
+    send_message(db_session, sender_id, convo_id, "Release notes are ready")
+
+    res = test_client.get(f"/conversations/{convo_id}/search", params={"q": "CAFE"}, headers=headers)
+    assert res.status_code == 200
+    assert {m["content"] for m in res.json()} == {"Lunch at the Café tomorrow?", "The cafe was closed, sorry"}
+
+    res = test_client.get(f"/conversations/{convo_id}/search", params={"q": "cafe closed"}, headers=headers)
+    assert [m["content"] for m in res.json()] == ["The cafe was closed, sorry"]
+
+
+def test_index_stores_no_plaintext_and_is_per_conversation(test_client: TestClient, db_session: Session):
+    headers, sender_id, convo_id = setup_conversation(test_client, "scoped")
+    other_headers, other_sender, other_convo = setup_conversation(test_client, "elsewhere")
+    send_message(db_session, sender_id, convo_id, "quarterly budget draft")
+    send_message(db_session, other_sender, other_convo, "quarterly budget final")
+
+    tokens = {row.token for row in db_session.query(models.MessageTerm).filter_by(conversation_id=convo_id)}
+    assert tokens and not tokens & {"quarterly", "budget", "draft"}
+
+    res = test_client.get(f"/conversations/{convo_id}/search", params={"q": "budget"}, headers=headers)
+    assert [m["content"] for m in res.json()] == ["quarterly budget draft"]
+
+    # The other conversation's participant cannot search this one.
+    res = test_client.get(f"/conversations/{convo_id}/search", params={"q": "budget"}, headers=other_headers)
+    assert res.status_code == 403
+
+
+def test_rebuild_job_restores_index(test_client: TestClient, db_session: Session):
+    headers, sender_id, convo_id = setup_conversation(test_client, "rebuilt")
+    for i in range(5):
+        send_message(db_session, sender_id, convo_id, f"status update number{i}")
+    db_session.query(models.MessageTerm).filter_by(conversation_id=convo_id).delete()
+
+    assert rebuild_message_index(db_session, conversation_id=convo_id, batch_size=2) == 5
+
+    res = test_client.get(f"/conversations/{convo_id}/search", params={"q": "update number3"}, headers=headers)
+    assert [m["content"] for m in res.json()] == ["status update number3"]
@@ -0,0 +1,75 @@
+from fastapi.testclient import TestClient
+
+from conftest import get_auth_headers
+
+
+def _register(client: TestClient, username: str, full_name: str = None, email: str = None):
+    res = client.post("/auth/register", json={
+        "email": email or f"{username}@example.com",
+        "username": username,
+        "full_name": full_name,
+        "password": "password123",
+    })
+    assert res.status_code == 201
+
+
+def test_directory_pages_are_full_and_exclude_current_user(test_client: TestClient):
+    """
+    Test that keyset pages are never short because of the current user and that the
+    cursor walks the whole directory without gaps or duplicates.
+    """
+    for name in ["dir_a", "dir_b", "dir_c", "dir_d", "dir_e"]:
+        _register(test_client, name)
+    headers = get_auth_headers(test_client, "dir_b")
+
+    seen, after = [], None
+    while True:
+        params = {"q": "dir_", "limit": 2}
+        if after:
+            params["after"] = after
+        res = test_client.get("/users/", params=params, headers=headers)
+        assert res.status_code == 200
+        page = [user["username"] for user in res.json()]
+        seen.extend(page)
+        after = res.headers.get("X-Next-Cursor")
+        if not after:
+            break
+        assert len(page) == 2
+
+    assert seen == ["dir_a", "dir_c", "dir_d", "dir_e"]
+
+
+def test_search_matches_username_full_name_and_email(test_client: TestClient):
+    _register(test_client, "zed", full_name="Grace Hopper")
+    _register(test_client, "yara", email="grace.h@example.com")
+    _register(test_client, "gracie")
+    _register(test_client, "searcher")
+    headers = get_auth_headers(test_client, "searcher")
+
+    prefix = test_client.get("/users/", params={"q": "GRAC"}, headers=headers).json()
+    assert {user["username"] for user in prefix} == {"zed", "yara", "gracie"}
+
+    contains = test_client.get("/users/", params={"q": "hopper", "match": "contains"}, headers=headers).json()
+    assert [user["username"] for user in contains] == ["zed"]
+
+    # LIKE wildcards in the search term are matched literally.
+    assert test_client.get("/users/", params={"q": "%", "match": "contains"}, headers=headers).json() == []
+
+
+def test_deprecated_skip_still_pages(test_client: TestClient):
+    for name in ["old_a", "old_b", "old_c"]:
+        _register(test_client, name)
+    headers = get_auth_headers(test_client, "old_a")
+    res = test_client.get("/users/", params={"q": "old_", "skip": 1}, headers=headers)
+    assert res.status_code == 200
+    assert [user["username"] for user in res.json()] == ["old_c"]
+
+
+def test_pagination_headers_are_exposed_to_the_frontend(test_client: TestClient):
+    _register(test_client, "cors_a")
+    _register(test_client, "cors_b")
+    headers = {**get_auth_headers(test_client, "cors_a"), "Origin": "http://localhost:3000"}
+    res = test_client.get("/users/", params={"q": "cors_", "limit": 1}, headers=headers)
+    assert res.headers["X-Next-Cursor"] == "cors_b"
+    exposed = {h.strip().lower() for h in res.headers["Access-Control-Expose-Headers"].split(",")}
+    assert {"x-next-cursor", "etag"} <= exposed
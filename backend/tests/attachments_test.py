@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.api.v1 import attachments
+from app.core import blob_store
+from app.db import models
+
+from conftest import get_auth_headers, setup_conversation
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+
+
+@pytest.fixture
+def attachment_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "ATTACHMENT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _upload(client: TestClient, headers, convo_id, content, filename="report.bin", **params):
+    return client.post(
+        f"/conversations/{convo_id}/attachments",
+        params={"filename": filename, **params},
+        content=content,
+        headers={**headers, "Content-Type": "application/octet-stream"},
+    )
+
+
+def test_upload_then_download(test_client: TestClient, db_session: Session, attachment_dir):
+    """
+    Test that an upload is stored under its digest, creates a message and downloads unchanged.
+    """
+    headers, _, convo_id = setup_conversation(test_client, "uploader")
+    res = _upload(test_client, headers, convo_id, PAYLOAD, filename="../../etc/report.bin", caption="Q3 numbers")
+    assert res.status_code == 201
+    body = res.json()
+    digest = hashlib.sha256(PAYLOAD).hexdigest()
+    assert (body["filename"], body["size"], body["sha256"]) == ("report.bin", len(PAYLOAD), digest)
+    assert os.path.exists(blob_store.blob_path(digest))
+
+    history = test_client.get(f"/conversations/{convo_id}/messages", headers=headers).json()
+    assert [(m["id"], m["content"]) for m in history] == [(body["message_id"], "Q3 numbers")]
+
+    res = test_client.get(f"/conversations/{convo_id}/attachments/{body['id']}", headers=headers)
+    assert res.status_code == 200
+    assert res.content == PAYLOAD
+    assert res.headers["etag"] == f'"{digest}"'
+    assert res.headers["accept-ranges"] == "bytes"
+    assert "report.bin" in res.headers["content-disposition"]
+
+    res = test_client.get(f"/conversations/{convo_id}/attachments/{body['id']}",
+                          headers={**headers, "If-None-Match": f'"{digest}"'})
+    assert res.status_code == 304
+
+    listed = test_client.get(f"/conversations/{convo_id}/attachments", headers=headers).json()
+    assert [a["id"] for a in listed] == [body["id"]]
+
+
+def test_range_request(test_client: TestClient, db_session: Session, attachment_dir):
+    headers, _, convo_id = setup_conversation(test_client, "ranger")
+    attachment_id = _upload(test_client, headers, convo_id, PAYLOAD).json()["id"]
+
+    res = test_client.get(f"/conversations/{convo_id}/attachments/{attachment_id}",
+                          headers={**headers, "Range": "bytes=1000-1999"})
+    assert res.status_code == 206
+    assert res.content == PAYLOAD[1000:2000]
+    assert res.headers["content-range"] == f"bytes 1000-1999/{len(PAYLOAD)}"
+
+
+def test_identical_uploads_share_a_blob(test_client: TestClient, db_session: Session, attachment_dir):
+    headers, _, convo_id = setup_conversation(test_client, "twice")
+    first = _upload(test_client, headers, convo_id, PAYLOAD, filename="a.bin").json()
+    # Streamed in chunks without a Content-Length.
+    second = _upload(test_client, headers, convo_id, (PAYLOAD[i:i + 65536] for i in range(0, len(PAYLOAD), 65536)),
+                     filename="b.bin").json()
+
+    assert first["id"] != second["id"] and first["sha256"] == second["sha256"]
+    assert [p.name for p in (attachment_dir / "blobs").rglob("*") if p.is_file()] == [first["sha256"]]
+    assert list((attachment_dir / "tmp").iterdir()) == []
+
+
+def test_non_participant_cannot_upload_or_download(test_client: TestClient, db_session: Session, attachment_dir):
+    headers, _, convo_id = setup_conversation(test_client, "insider")
+    attachment_id = _upload(test_client, headers, convo_id, b"private").json()["id"]
+    test_client.post("/auth/register", json={"email": "outsider@example.com", "username": "outsider", "password": "password123"})
+    outsider = get_auth_headers(test_client, "outsider")
+
+    assert _upload(test_client, outsider, convo_id, b"spam").status_code == 403
+    assert test_client.get(f"/conversations/{convo_id}/attachments/{attachment_id}", headers=outsider).status_code == 403
+    assert test_client.get(f"/conversations/{convo_id}/attachments", headers=outsider).status_code == 403
+    assert db_session.query(models.Attachment).count() == 1
+
+
+def test_no_transaction_is_held_while_the_body_streams(test_client: TestClient, db_session: Session, attachment_dir):
+    headers, _, convo_id = setup_conversation(test_client, "slowpoke")
+    seen = []
+
+    def body():
+        for n in range(4):
+            seen.append(db_session.in_transaction())
+            yield PAYLOAD[n * 1024:(n + 1) * 1024]
+
+    res = _upload(test_client, headers, convo_id, body())
+    assert res.status_code == 201
+    assert seen and not any(seen)
+
+
+def test_size_limit(test_client: TestClient, db_session: Session, attachment_dir, monkeypatch):
+    """
+    Test that oversized uploads are refused, by Content-Length or mid-stream, and leave nothing behind.
+    """
+    monkeypatch.setattr(blob_store, "ATTACHMENT_MAX_BYTES", 1000)
+    headers, _, convo_id = setup_conversation(test_client, "hoarder")
+
+    assert _upload(test_client, headers, convo_id, b"x" * 1001).status_code == 413
+    assert _upload(test_client, headers, convo_id, (b"x" * 300 for _ in range(4))).status_code == 413
+    assert _upload(test_client, headers, convo_id, b"x" * 1000).status_code == 201
+    assert db_session.query(models.Attachment).count() == 1
+    assert list((attachment_dir / "tmp").iterdir()) == []
+
+
+def test_accel_redirect(test_client: TestClient, db_session: Session, attachment_dir, monkeypatch):
+    monkeypatch.setattr(attachments, "ATTACHMENT_ACCEL_REDIRECT", "/_attachments/")
+    headers, _, convo_id = setup_conversation(test_client, "proxied")
+    body = _upload(test_client, headers, convo_id, b"served by nginx", filename="note.txt").json()
+
+    res = test_client.get(f"/conversations/{convo_id}/attachments/{body['id']}", headers=headers)
+    assert res.status_code == 200 and res.content == b""
+    assert res.headers["x-accel-redirect"] == "/_attachments/" + blob_store.relative_path(body["sha256"])
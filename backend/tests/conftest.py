@@ -1,15 +1,21 @@
 
+import os
+import uuid
 import pytest
-from typing import Generator
+from typing import Dict, Generator
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
-from sqlalchemy.engine import Engine
+
+# The test database is built with create_all below, not by migrations.
+os.environ.setdefault("SCHEMA_VERSION_CHECK", "0")
 
 from app.main import app
+from app.cruds import chat_crud
 from app.db.database import Base
-from app.db.database import get_db
+from app.db.database import get_db, get_read_db
+from app.schemas import schemas
 
 # --- Test Database Setup ---
 # Use an in-memory SQLite database for testing to keep tests fast and isolated.
@@ -25,16 +31,17 @@ class BoolAnd:
     def finalize(self):
         return self.result
 
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+
+
 # This SQLAlchemy event listener is the core of the patch.
-# It runs for every new connection and registers our custom function.
-@event.listens_for(Engine, "connect")
+# It runs for every new SQLite connection and registers our custom function.
+@event.listens_for(engine, "connect")
 def connect(dbapi_connection, connection_record):
     dbapi_connection.create_aggregate("bool_and", 1, BoolAnd)
 
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -76,6 +83,38 @@ def test_client(db_session) -> Generator:
 
     # Override the get_db dependency in the main app
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     
     with TestClient(app) as client:
-        yield client
\ No newline at end of file
+        yield client
+
+
+# --- Helpers shared by the test modules (import them with `from conftest import ...`) ---
+def get_auth_headers(client: TestClient, username: str, password: str = "password123") -> Dict[str, str]:
+    """Logs in a user and returns authorization headers."""
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 200, f"Failed to log in user {username}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def setup_conversation(client: TestClient, prefix: str):
+    """Registers two users, creates a 1-on-1 conversation and returns (headers, sender_id, convo_id)."""
+    user_a = client.post("/auth/register", json={"email": f"{prefix}_a@example.com", "username": f"{prefix}_a", "password": "password123"}).json()
+    user_b = client.post("/auth/register", json={"email": f"{prefix}_b@example.com", "username": f"{prefix}_b", "password": "password123"}).json()
+    headers = get_auth_headers(client, f"{prefix}_a")
+    convo = client.post("/conversations/", json={"user_ids": [user_b["id"]]}, headers=headers).json()
+    return headers, uuid.UUID(user_a["id"]), uuid.UUID(convo["id"])
+
+
+def send_message(db: Session, sender_id, convo_id, text: str):
+    return chat_crud.create_message(db, schemas.MessageCreate(content=text), sender_id, convo_id)
+
+
+class FakeClock:
+    """A monotonic clock that only moves when a test sets `now`."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
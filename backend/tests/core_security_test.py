@@ -1,3 +1,4 @@
+import pytest
 from app.core import security
 from app.db.models import User
 from app.schemas.schemas import UserCreate
@@ -53,4 +54,47 @@ def test_get_user_from_invalid_token(db_session: Session):
     """
     invalid_token = "this.is.not.a.valid.token"
     user = security.get_user_from_token(db=db_session, token=invalid_token)
-    assert user is None
\ No newline at end of file
+    assert user is None
+
+def test_message_encryption_round_trip_and_compression():
+    """
+    Test that long messages are compressed inside the token and short ones are not,
+    and that both decrypt back to the original text.
+    """
+    short = "see you at 3 ✌️"
+    long_log = "\n".join(f"2024-05-01 12:00:{i % 60:02d} INFO worker-{i % 4} processed job {i}" for i in range(200))
+
+    short_token = security.encrypt_message(short)
+    long_token = security.encrypt_message(long_log)
+
+    assert security.decrypt_message(short_token) == short
+    assert security.decrypt_messages([long_token, short_token]) == [long_log, short]
+    assert security.fernet.decrypt(short_token.encode()) == short.encode("utf-8")
+    assert security.fernet.decrypt(long_token.encode())[0] == security.ENVELOPE_ZLIB
+    assert len(long_token) < len(long_log) / 2
+
+
+def test_zstd_compression_when_configured(monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(security, "MESSAGE_COMPRESSION", "zstd")
+    text = "the same line again and again\n" * 100
+    token = security.encrypt_message(text)
+    assert security.fernet.decrypt(token.encode())[0] == security.ENVELOPE_ZSTD
+    assert security.decrypt_message(token) == text
+
+
+def test_zstd_message_without_zstandard_fails_clearly(monkeypatch):
+    monkeypatch.setattr(security, "zstandard", None)
+    token = security.fernet.encrypt(bytes([security.ENVELOPE_ZSTD]) + b"compressed elsewhere").decode()
+    with pytest.raises(RuntimeError, match="zstandard"):
+        security.decrypt_message(token)
+
+
+def test_legacy_uncompressed_tokens_still_decrypt():
+    """
+    Test that tokens written before the envelope existed (raw UTF-8) decrypt unchanged,
+    even when they are long.
+    """
+    legacy_text = "x" * 5000
+    legacy_token = security.fernet.encrypt(legacy_text.encode("utf-8")).decode()
+    assert security.decrypt_message(legacy_token) == legacy_text
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.security import decrypt_message
+from app.db import database, models
+from app.ephemeral import TypingCoalescer, parse_event, typing_coalescer
+
+from conftest import FakeClock, setup_conversation
+
+
+def test_keystrokes_coalesce_into_one_update_per_flush():
+    """
+    Test that repeated typing frames only produce an update when the state changes.
+    """
+    typing = TypingCoalescer(ttl=5, clock=FakeClock())
+    for _ in range(50):
+        typing.update("c1", "alice", True)
+    typing.update("c1", "bob", True)
+    assert list(typing.flush()) == [("c1", ["alice", "bob"])]
+
+    for _ in range(50):
+        typing.update("c1", "alice", True)
+    assert list(typing.flush()) == []
+
+    typing.update("c1", "alice", False)
+    typing.update("c1", "alice", False)
+    assert list(typing.flush()) == [("c1", ["bob"])]
+
+
+def test_stale_typing_state_expires():
+    clock = FakeClock()
+    typing = TypingCoalescer(ttl=5, clock=clock)
+    typing.update("c1", "alice", True)
+    list(typing.flush())
+
+    clock.now += 4
+    typing.update("c1", "alice", True)  # refresh keeps alice typing
+    clock.now += 4
+    assert list(typing.flush()) == []
+
+    clock.now += 2
+    assert list(typing.flush()) == [("c1", [])]
+    assert typing._typing == {}
+
+
+def test_parse_event_only_accepts_marked_json_objects():
+    assert parse_event('{"type": "typing", "ephemeral": true, "typing": true}') == {
+        "type": "typing", "ephemeral": True, "typing": True,
+    }
+    assert parse_event('{"type": "pong", "ephemeral": true}') == {"type": "pong", "ephemeral": True}
+    assert parse_event('{"type": "typing", "typing": true}') is None
+    assert parse_event('{"type": "pong", "ephemeral": "yes"}') is None
+    assert parse_event("hello") is None
+    assert parse_event("{not json") is None
+    assert parse_event('{"type": "message", "content": "hi"}') is None
+    assert parse_event("[1, 2]") is None
+
+
+def test_message_that_looks_like_a_control_frame_is_stored(test_client: TestClient, db_session: Session, monkeypatch):
+    """
+    Test that chat text which happens to be a typing or pong frame, without the
+    ephemeral marker, is stored and broadcast like any other message.
+    """
+    headers, _, convo_id = setup_conversation(test_client, "lookalike")
+    token = headers["Authorization"].split()[1]
+    # The socket handler opens sessions of its own; keep them inside the test's transaction.
+    monkeypatch.setattr(database, "SessionLocal", lambda: Session(bind=db_session.bind))
+    texts = ['{"type": "typing", "typing": true}', '{"type": "pong"}']
+    with test_client.websocket_connect(f"/ws/{convo_id}/{token}") as websocket:
+        websocket.send_text(json.dumps({"type": "typing", "ephemeral": True, "typing": True}))
+        for text in texts:
+            websocket.send_text(text)
+        websocket.send_text(json.dumps({"type": "message", "content": texts[0], "client_message_id": "m-1"}))
+        websocket.send_text("done")
+        received = []
+        while not received or received[-1] != "done":
+            frame = websocket.receive_json()
+            if "content" in frame:
+                received.append(frame["content"])
+
+    assert received == texts + texts[:1] + ["done"]
+    stored = db_session.query(models.Message).filter_by(conversation_id=convo_id).all()
+    assert sorted(decrypt_message(m.content) for m in stored) == sorted(texts + texts[:1] + ["done"])
+    assert typing_coalescer.typing_users(str(convo_id)) == []
+
+
+@pytest.mark.asyncio
+async def test_run_broadcasts_room_state():
+    typing = TypingCoalescer(ttl=5)
+    broadcast = AsyncMock()
+    task = asyncio.create_task(typing.run(broadcast, interval=0.01))
+    typing.update("c1", "alice", True)
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    broadcast.assert_awaited_once_with(
+        json.dumps({"type": "typing", "conversation_id": "c1", "user_ids": ["alice"]}), "c1"
+    )
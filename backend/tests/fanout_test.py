@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.websocket import ConnectionManager
+
+
+class RecordingSocket:
+    def __init__(self, log, name, fail=False):
+        self.log = log
+        self.name = name
+        self.fail = fail
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.log.append((self.name, message))
+
+
+def _room(manager, log, conversation_id, size, **kwargs):
+    sockets = [RecordingSocket(log, f"{conversation_id}-{n}", **kwargs) for n in range(size)]
+    for n, websocket in enumerate(sockets):
+        manager._add_connection(websocket, f"{conversation_id}-user{n}", conversation_id)
+    return sockets
+
+
+async def _settle(manager):
+    while manager.fanout.stats()["rooms_queued"]:
+        await asyncio.sleep(0)
+
+
+def _manager(threshold, shard_size):
+    manager = ConnectionManager()
+    manager.fanout.threshold = threshold
+    manager.fanout.shard_size = shard_size
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_large_room_is_sharded_and_small_rooms_are_not_held_up():
+    """
+    Test that a broadcast to a large room returns at once and is delivered in shards,
+    while a small room's broadcast is sent inline ahead of it.
+    """
+    log = []
+    manager = _manager(threshold=5, shard_size=2)
+    _room(manager, log, "big", 6)
+    _room(manager, log, "small", 2)
+    task = asyncio.create_task(manager.fanout.run(workers=1))
+    await asyncio.sleep(0)
+
+    await manager.broadcast("announcement", "big")
+    assert log == []
+    await manager.broadcast("hi", "small")
+    assert log == [("small-0", "hi"), ("small-1", "hi")]
+
+    await _settle(manager)
+    task.cancel()
+    assert sorted(name for name, message in log if message == "announcement") == [f"big-{n}" for n in range(6)]
+    assert manager.fanout.stats()["shards_sent"] == 3
+
+
+@pytest.mark.asyncio
+async def test_large_rooms_take_turns_one_shard_at_a_time():
+    log = []
+    manager = _manager(threshold=3, shard_size=2)
+    _room(manager, log, "a", 4)
+    _room(manager, log, "b", 4)
+    task = asyncio.create_task(manager.fanout.run(workers=1))
+    await asyncio.sleep(0)
+
+    await manager.broadcast("to a", "a")
+    await manager.broadcast("to b", "b")
+    await _settle(manager)
+    task.cancel()
+
+    rooms = [name.split("-")[0] for name, _ in log]
+    assert rooms == ["a", "a", "b", "b", "a", "a", "b", "b"]
+
+
+@pytest.mark.asyncio
+async def test_room_order_is_kept_and_closed_sockets_are_skipped():
+    """
+    Test that once a room has queued work, later broadcasts queue behind it even if the
+    room shrank below the threshold, and that sockets gone by their turn are skipped.
+    """
+    log = []
+    manager = _manager(threshold=3, shard_size=1)
+    sockets = _room(manager, log, "room", 3)
+    await manager.broadcast("inline", "room")  # scheduler not running: sent inline
+    task = asyncio.create_task(manager.fanout.run(workers=2))
+    await asyncio.sleep(0)
+
+    await manager.broadcast("first", "room")
+    manager._remove_connection(sockets[2], "room-user2", "room")
+    await manager.broadcast("second", "room")
+    await _settle(manager)
+    task.cancel()
+
+    for n in range(2):
+        assert [message for name, message in log if name == f"room-{n}"] == ["inline", "first", "second"]
+    assert [message for name, message in log if name == "room-2"] == ["inline"]
+
+
+@pytest.mark.asyncio
+async def test_failed_sends_do_not_stop_the_fanout():
+    log = []
+    manager = _manager(threshold=2, shard_size=2)
+    _room(manager, log, "room", 3, fail=True)
+    healthy = RecordingSocket(log, "healthy")
+    manager._add_connection(healthy, "healthy-user", "room")
+    task = asyncio.create_task(manager.fanout.run(workers=1))
+    await asyncio.sleep(0)
+
+    await manager.broadcast("still delivered", "room")
+    await _settle(manager)
+    task.cancel()
+
+    assert log == [("healthy", "still delivered")]
+    assert manager.stats()["fanout"]["failed_sends"] == 3
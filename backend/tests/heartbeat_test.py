@@ -0,0 +1,140 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import security
+from app.heartbeat import TimerWheel
+from app.websocket import PING_MESSAGE, ConnectionManager
+
+from conftest import FakeClock, get_auth_headers
+
+
+def test_timer_wheel_visits_every_item_once_per_rotation():
+    wheel = TimerWheel(slots=4)
+    for item in range(10):
+        wheel.add(item)
+        wheel.advance()  # spread items over the slots, as sockets arriving over time would be
+    seen = [item for _ in range(4) for item in wheel.advance()]
+    assert sorted(seen) == list(range(10))
+
+    wheel.remove(3)
+    seen = [item for _ in range(4) for item in wheel.advance()]
+    assert sorted(seen) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert len(wheel) == 9
+
+
+def test_new_item_waits_a_full_rotation():
+    wheel = TimerWheel(slots=3)
+    wheel.add("a")
+    assert wheel.advance() == [] and wheel.advance() == []
+    assert wheel.advance() == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_live_sockets_are_pinged_and_silent_ones_reaped():
+    """
+    Test that a heartbeat pass pings sockets we heard from recently and removes the rest,
+    broadcasting the reaped user as offline.
+    """
+    clock = FakeClock()
+    manager = ConnectionManager(clock=clock)
+    alive, silent = AsyncMock(), AsyncMock()
+    await manager.connect(alive, "alice", "c1")
+    await manager.connect(silent, "bob", "c1")
+    alive.reset_mock()
+
+    clock.now += 120
+    manager.touch(alive)
+    await manager.check_heartbeats(list(manager.connections.values()), clock.now)
+
+    alive.send_text.assert_any_await(PING_MESSAGE)
+    alive.send_text.assert_any_await('{"type": "status", "user_id": "bob", "status": "offline"}')
+    silent.close.assert_awaited_once_with(code=1001)
+    assert set(manager.connections) == {alive}
+    assert "bob" not in manager.online_users
+    assert manager.stats()["heartbeat"]["reaped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_ping_reaps_socket():
+    manager = ConnectionManager()
+    ws = AsyncMock()
+    await manager.connect(ws, "alice", "c1")
+    ws.send_text.side_effect = RuntimeError("connection lost")
+
+    await manager.check_heartbeats(list(manager.connections.values()), manager.clock())
+    assert manager.connections == {} and manager.active_connections == {}
+    assert len(manager.heartbeat_wheel) == 0
+
+
+@pytest.mark.asyncio
+async def test_dead_peer_does_not_stop_the_pass():
+    """
+    Test that a socket that fails on send, while a reaped user's offline status goes
+    out, neither keeps the status from the rest of the room nor stops the reaping.
+    """
+    clock = FakeClock()
+    manager = ConnectionManager(clock=clock)
+    alive, dead, bob, carol = AsyncMock(), AsyncMock(), AsyncMock(), AsyncMock()
+    await manager.connect(dead, "dave", "c1")
+    await manager.connect(bob, "bob", "c1")
+    await manager.connect(carol, "carol", "c1")
+    await manager.connect(alive, "alice", "c1")
+    dead.send_text.side_effect = RuntimeError("connection lost")
+
+    clock.now += 120
+    manager.touch(alive)
+    manager.touch(dead)
+    await manager.check_heartbeats([manager.connections[bob], manager.connections[carol]], clock.now)
+
+    alive.send_text.assert_any_await('{"type": "status", "user_id": "bob", "status": "offline"}')
+    alive.send_text.assert_any_await('{"type": "status", "user_id": "carol", "status": "offline"}')
+    assert set(manager.connections) == {alive, dead}
+
+
+@pytest.mark.asyncio
+async def test_failing_check_is_isolated(monkeypatch):
+    clock = FakeClock()
+    manager = ConnectionManager(clock=clock)
+    bob, carol = AsyncMock(), AsyncMock()
+    await manager.connect(bob, "bob", "c1")
+    await manager.connect(carol, "carol", "c2")
+    reap = manager.reap
+    reaped = []
+
+    async def flaky_reap(connection):
+        reaped.append(connection.user_id)
+        if connection.user_id == "bob":
+            raise RuntimeError("unexpected")
+        await reap(connection)
+
+    monkeypatch.setattr(manager, "reap", flaky_reap)
+    clock.now += 120
+    await manager.check_heartbeats([manager.connections[bob], manager.connections[carol]], clock.now)
+    assert reaped == ["bob", "carol"]
+    assert carol not in manager.connections
+
+
+@pytest.mark.asyncio
+async def test_stats_report_memory_per_connection():
+    manager = ConnectionManager()
+    for i in range(20):
+        await manager.connect(AsyncMock(), f"user{i % 5}", f"c{i % 3}")
+    stats = manager.stats()
+    assert stats["sockets"] == 20 and stats["users_online"] == 5 and stats["conversations_active"] == 3
+    assert 0 < stats["bytes_per_connection"] < stats["memory_bytes"]
+
+
+def test_connection_stats_endpoint_is_for_admins(test_client: TestClient, monkeypatch):
+    monkeypatch.setattr(security, "ADMIN_USERNAMES", {"watch"})
+    for username in ("watch", "peek"):
+        test_client.post("/auth/register", json={"email": f"{username}@example.com", "username": username, "password": "password123"})
+    res = test_client.get("/stats/connections", headers=get_auth_headers(test_client, "watch"))
+    assert res.status_code == 200
+    body = res.json()
+    assert {"sockets", "heartbeat", "bytes_per_connection", "queues"} <= set(body)
+    assert set(body["queues"]) == {"log", "typing", "spool"}
+
+    assert test_client.get("/stats/connections", headers=get_auth_headers(test_client, "peek")).status_code == 403
+    assert test_client.get("/stats/connections").status_code == 401
@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.cruds import chat_crud
+from app.db import models
+from app.jobs.rebuild_last_message import rebuild_last_message
+
+from conftest import send_message, setup_conversation
+
+
+def test_inbox_shows_encrypted_truncated_preview(test_client: TestClient, db_session: Session):
+    """
+    Test that sending a message updates the conversation's preview, stored encrypted and truncated.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "preview")
+    send_message(db_session, sender_id, convo_id, "first")
+    last = send_message(db_session, sender_id, convo_id, "long news " * 50)
+
+    convo = db_session.get(models.Conversation, convo_id)
+    assert convo.last_message_id == last.id
+    assert "news" not in convo.last_message_preview
+
+    [listed] = test_client.get("/conversations/", headers=headers).json()
+    assert listed["last_message"] == {
+        "id": str(last.id),
+        "sender": {"id": str(sender_id), "username": "preview_a"},
+        "content": ("long news " * 50)[:chat_crud.MESSAGE_PREVIEW_LENGTH],
+    }
+
+
+def test_new_conversation_has_no_preview(test_client: TestClient):
+    headers, _, _ = setup_conversation(test_client, "quiet")
+    [listed] = test_client.get("/conversations/", headers=headers).json()
+    assert listed["last_message"] is None
+
+
+def test_rebuild_job_backfills_missing_previews(test_client: TestClient, db_session: Session):
+    headers, sender_id, convo_id = setup_conversation(test_client, "legacy")
+    last_id = send_message(db_session, sender_id, convo_id, "written before previews existed").id
+    db_session.query(models.Conversation).filter_by(id=convo_id).update(
+        {"last_message_id": None, "last_message_sender_id": None, "last_message_preview": None}
+    )
+
+    assert rebuild_last_message(db_session, missing_only=True) >= 1
+    [listed] = test_client.get("/conversations/", headers=headers).json()
+    assert listed["last_message"]["id"] == str(last_id)
+    assert listed["last_message"]["content"] == "written before previews existed"
+
+
+def test_rebuild_job_keeps_a_pointer_set_while_it_ran(test_client: TestClient, db_session: Session, monkeypatch):
+    """
+    Test that a message sent between the job reading the latest message and writing the
+    pointer keeps its own pointer and preview, instead of the older message the job read.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "racing")
+    send_message(db_session, sender_id, convo_id, "before the job")
+    read_latest = chat_crud.get_latest_messages
+    sent = []
+
+    def latest_then_send(db, conversation_ids, per_conversation):
+        latest = read_latest(db, conversation_ids, per_conversation)
+        sent.append(send_message(db_session, sender_id, convo_id, "while the job ran").id)
+        return latest
+
+    monkeypatch.setattr(chat_crud, "get_latest_messages", latest_then_send)
+    rebuild_last_message(db_session)
+
+    [listed] = test_client.get("/conversations/", headers=headers).json()
+    assert listed["last_message"]["id"] == str(sent[0])
+    assert listed["last_message"]["content"] == "while the job ran"
@@ -0,0 +1,88 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+from unittest.mock import AsyncMock
+
+from app.core.log_config import (
+    DeferredQueueHandler,
+    RedactingFormatter,
+    SamplingFilter,
+    parse_sample_rates,
+)
+from app.websocket import ConnectionManager
+
+
+def _record(level=logging.INFO, msg="event %s", args=("x",)) -> logging.LogRecord:
+    return logging.LogRecord("app.test", level, __file__, 1, msg, args, None)
+
+
+def test_sampling_filter_keeps_one_in_n():
+    """
+    Test that records below WARNING are sampled while warnings always pass.
+    """
+    sampler = SamplingFilter(0.1)
+    kept = sum(sampler.filter(_record()) for _ in range(1000))
+    assert kept == 100
+    assert all(sampler.filter(_record(level=logging.WARNING)) for _ in range(10))
+
+
+def test_parse_sample_rates_ignores_malformed_entries():
+    assert parse_sample_rates("app.websocket=0.01, app.main = 0.5,broken,x=abc") == {
+        "app.websocket": 0.01,
+        "app.main": 0.5,
+    }
+
+
+def test_queue_handler_snapshots_the_message_and_drops_when_full():
+    """
+    Test that the handler renders the message when the record is logged, so a later
+    change to its args does not show up, and never blocks.
+    """
+    log_queue = queue.Queue(maxsize=1)
+    handler = DeferredQueueHandler(log_queue)
+    members = ["alice"]
+    handler.emit(_record(msg="members %s", args=(members,)))
+    members.append("bob")
+    handler.emit(_record())
+
+    queued = log_queue.get_nowait()
+    assert queued.getMessage() == "members ['alice']" and queued.args is None
+    assert handler.dropped == 1
+
+
+def test_queue_handler_leaves_the_traceback_to_the_listener():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("app.test", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+    log_queue = queue.Queue()
+    DeferredQueueHandler(log_queue).emit(record)
+
+    queued = log_queue.get_nowait()
+    assert queued.exc_text is None
+    assert "ValueError: boom" in RedactingFormatter("%(message)s").format(queued)
+
+
+def test_redacting_formatter_scrubs_message_content():
+    payload = json.dumps({"id": "1", "content": "my \"secret\" plan", "status": "sent"})
+    formatted = RedactingFormatter("%(message)s").format(_record(msg="payload %s", args=(payload,)))
+    assert "secret" not in formatted
+    assert '"content": "[redacted]"' in formatted
+
+
+@pytest.mark.asyncio
+async def test_broadcast_never_logs_plaintext(caplog):
+    """
+    Test that broadcasting a chat message does not write its body to the logs.
+    """
+    manager = ConnectionManager()
+    await manager.connect(AsyncMock(), "user1", "convo1")
+
+    with caplog.at_level(logging.DEBUG, logger="app.websocket"):
+        for _ in range(200):
+            await manager.broadcast(json.dumps({"content": "top secret plaintext"}), "convo1")
+
+    assert "top secret plaintext" not in caplog.text
@@ -0,0 +1,187 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.core.security import encrypt_message
+from app.db import models, partitions, segments
+from app.jobs.archive_messages import archive_messages, restore_month
+
+from conftest import send_message, setup_conversation
+
+OLD_MONTH = datetime(2021, 3, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "MESSAGE_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _backdate(db: Session, message, when: datetime):
+    db.query(models.Message).filter_by(id=message.id).update({"created_at": when})
+
+
+def _history(client: TestClient, headers, convo_id, **params):
+    res = client.get(f"/conversations/{convo_id}/messages", params=params, headers=headers)
+    assert res.status_code == 200
+    return res
+
+
+def test_archived_history_reads_back_unchanged(test_client: TestClient, db_session: Session, archive_dir):
+    """
+    Test that history pages are byte-for-byte the same before and after their months are archived.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "archivist")
+    _, other_sender, other_convo = setup_conversation(test_client, "bystander")
+    for day in range(6):
+        _backdate(db_session, send_message(db_session, sender_id, convo_id, f"old message {day}"), OLD_MONTH + timedelta(days=day))
+    _backdate(db_session, send_message(db_session, other_sender, other_convo, "someone else's"), OLD_MONTH)
+    _backdate(db_session, send_message(db_session, sender_id, convo_id, "next month"), OLD_MONTH + timedelta(days=40))
+    for content in ["recent one", "recent two"]:
+        send_message(db_session, sender_id, convo_id, content)
+    pages = [dict(skip=0, limit=100), dict(skip=2, limit=3), dict(skip=5, limit=3), dict(skip=7, limit=5)]
+    before = [_history(test_client, headers, convo_id, **page).content for page in pages]
+
+    written = archive_messages(db_session, cutoff=datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    assert [(s.file_name[:16], s.message_count) for s in written] == [("messages-2021-03", 7), ("messages-2021-04", 1)]
+    assert sorted(p.name for p in archive_dir.iterdir()) == [s.file_name for s in written]
+    assert db_session.query(models.Message).filter_by(conversation_id=convo_id).count() == 2
+    assert [_history(test_client, headers, convo_id, **page).content for page in pages] == before
+
+    export = test_client.get(f"/conversations/{convo_id}/export", headers=headers).text.splitlines()
+    assert len(export) == 9 and '"old message 0"' in export[0] and '"recent two"' in export[-1]
+
+
+def _search(client: TestClient, headers, convo_id, query: str):
+    res = client.get(f"/conversations/{convo_id}/search", params={"q": query}, headers=headers)
+    assert res.status_code == 200
+    return [m["content"] for m in res.json()]
+
+
+def test_restore_moves_a_month_back(test_client: TestClient, db_session: Session, archive_dir):
+    """
+    Test that archiving drops a month's keyword index entries along with its rows, and
+    restoring it makes the messages searchable again. Both change the history ETag.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "restorer")
+    message = send_message(db_session, sender_id, convo_id, "from the vault")
+    _backdate(db_session, message, OLD_MONTH)
+    before = _history(test_client, headers, convo_id)
+    archive_messages(db_session, cutoff=datetime(2022, 1, 1, tzinfo=timezone.utc))
+    assert db_session.query(models.MessageTerm).filter_by(message_id=message.id).count() == 0
+    assert _search(test_client, headers, convo_id, "vault") == []
+    archived = _history(test_client, headers, convo_id)
+    assert archived.headers["ETag"] != before.headers["ETag"]
+
+    assert restore_month(db_session, OLD_MONTH) == 1
+    assert not list(archive_dir.iterdir())
+    assert db_session.query(models.MessageSegment).count() == 0
+    restored = _history(test_client, headers, convo_id)
+    assert restored.content == before.content
+    assert restored.headers["ETag"] not in (before.headers["ETag"], archived.headers["ETag"])
+    assert _search(test_client, headers, convo_id, "vault") == ["from the vault"]
+
+
+def test_rearchived_month_is_not_served_from_the_old_file(
+    test_client: TestClient, db_session: Session, archive_dir, monkeypatch
+):
+    """
+    Test the key rotation steps (restore, rewrite the rows, archive again) as seen by an
+    app server other than the one running the job: history must come from the new
+    segment, not from the reader it still holds on the old file.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "rotator")
+    message = send_message(db_session, sender_id, convo_id, "before rotation")
+    _backdate(db_session, message, OLD_MONTH)
+    first = archive_messages(db_session, cutoff=datetime(2022, 1, 1, tzinfo=timezone.utc))[0].file_name
+    assert _history(test_client, headers, convo_id).json()[0]["content"] == "before rotation"
+
+    with monkeypatch.context() as m:
+        m.setattr(segments, "close_segment", lambda *args: None)  # the job ran in another process
+        restore_month(db_session, OLD_MONTH)
+    db_session.query(models.Message).filter_by(id=message.id).update({"content": encrypt_message("after rotation")})
+    db_session.commit()
+    second = archive_messages(db_session, cutoff=datetime(2022, 1, 1, tzinfo=timezone.utc))[0].file_name
+
+    assert second != first
+    assert [p.name for p in archive_dir.iterdir()] == [second]
+    assert _history(test_client, headers, convo_id).json()[0]["content"] == "after rotation"
+    assert all(os.path.basename(path) != first for path, _ in segments._readers)
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="needs a scratch Postgres database")
+def test_month_already_in_the_default_partition_gets_its_own():
+    """
+    Test that a month whose rows landed in the DEFAULT partition, because no job created
+    its partition in time, still gets one, with the rows moved over.
+    """
+    url = os.environ["TEST_POSTGRES_URL"]
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url)
+    config.attributes["configure_logger"] = False
+    command.downgrade(config, "base")
+    command.upgrade(config, "head")
+    late = partitions.add_months(partitions.month_start(datetime.now(timezone.utc)), partitions.PARTITION_MONTHS_AHEAD + 2)
+    sender_id, convo_id = uuid.uuid4(), uuid.uuid4()
+    engine = create_engine(url)
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (:id, 'late', 'late@example.com', 'x')"), {"id": sender_id})
+            connection.execute(text("INSERT INTO conversations (id, is_group_chat) VALUES (:id, false)"), {"id": convo_id})
+            for day in (0, 10):
+                connection.execute(text(
+                    "INSERT INTO messages (id, content, sender_id, conversation_id, created_at, status) "
+                    "VALUES (:id, 'x', :sender, :convo, :at, 'sent')"
+                ), {"id": uuid.uuid4(), "sender": sender_id, "convo": convo_id, "at": late + timedelta(days=day)})
+
+        with engine.begin() as connection:
+            created = partitions.ensure_partitions(connection, late, partitions.add_months(late, 1))
+
+        name = partitions.partition_name(late)
+        with engine.connect() as connection:
+            assert created == [name]
+            assert connection.execute(text(f"SELECT count(*) FROM {name}")).scalar() == 2
+            assert connection.execute(text(f"SELECT count(*) FROM {partitions.DEFAULT_PARTITION}")).scalar() == 0
+            assert connection.execute(text(
+                "SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass('messages') AND inhrelid = to_regclass(:name)"
+            ), {"name": partitions.DEFAULT_PARTITION}).scalar() == 1
+    finally:
+        engine.dispose()
+        command.downgrade(config, "base")
+
+
+def test_recent_months_stay_in_the_table(test_client: TestClient, db_session: Session, archive_dir):
+    headers, sender_id, convo_id = setup_conversation(test_client, "hotdata")
+    send_message(db_session, sender_id, convo_id, "today")
+    assert archive_messages(db_session, cutoff=datetime.now(timezone.utc) - timedelta(days=180)) == []
+    assert not list(archive_dir.iterdir())
+
+
+def test_segment_index_finds_every_conversation(tmp_path):
+    path = str(tmp_path / "many.seg")
+    writer = segments.SegmentWriter(path, naive_timestamps=False)
+    written = {}
+    for n in range(300):
+        convo_id = uuid.uuid4()
+        written[convo_id] = [
+            (uuid.uuid4(), f"token-{n}-{i}", OLD_MONTH + timedelta(minutes=i), models.MessageStatus.read, uuid.uuid4())
+            for i in range(n % 4 + 1)
+        ]
+        writer.add_conversation(convo_id, written[convo_id])
+    writer.close()
+
+    reader = segments.SegmentReader(path)
+    for convo_id, rows in written.items():
+        assert reader.rows(convo_id) == rows
+        assert reader.rows(convo_id, skip=1, limit=2) == rows[1:3]
+    assert reader.count(uuid.uuid4()) == 0
+    assert dict(reader.conversations()) == written
+    reader.close()
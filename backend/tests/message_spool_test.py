@@ -0,0 +1,299 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import main, spool
+from app.core.security import decrypt_message
+from app.cruds import chat_crud
+from app.db import models
+from app.db import database
+from app.db.database import Base
+from app.ephemeral import parse_message
+from app.schemas import schemas
+from app.spool import MessageSpool
+
+from conftest import setup_conversation
+
+
+class PausableDatabase:
+    """
+    A local SQLite database standing in for Postgres. While paused, every statement
+    fails with OperationalError, as it would with the server down.
+    """
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.paused = False
+        event.listen(self.engine, "before_cursor_execute", self._check)
+
+    def _check(self, *args):
+        if self.paused:
+            raise OperationalError("statement", {}, ConnectionRefusedError("database paused"))
+
+    def seed(self):
+        sender_id, conversation_id = uuid.uuid4(), uuid.uuid4()
+        with self.Session() as db:
+            db.add(models.User(id=sender_id, username="spooler", email="spooler@example.com", hashed_password="x"))
+            db.add(models.Conversation(id=conversation_id, is_group_chat=False))
+            db.add(models.Participant(user_id=sender_id, conversation_id=conversation_id))
+            db.commit()
+        return sender_id, conversation_id
+
+    def messages(self):
+        with self.Session() as db:
+            return db.execute(
+                select(models.Message.id, models.Message.content).order_by(models.Message.created_at, models.Message.id)
+            ).all()
+
+
+async def _until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_RETRY_INITIAL", 0.01)
+    return PausableDatabase(tmp_path / "standin.db")
+
+
+@pytest.mark.asyncio
+async def test_outage_is_spooled_and_drained_in_order(tmp_path, standin):
+    """
+    Test that messages accepted while the database is down are fsynced together,
+    drained in order once it returns, announced as persisted, and the file emptied.
+    """
+    sender_id, convo_id = standin.seed()
+    message_spool = MessageSpool(str(tmp_path / "spool"))
+    message_spool.open()
+    broadcast = AsyncMock()
+    standin.paused = True
+    task = asyncio.create_task(message_spool.run(standin.Session, broadcast, rate=1000, batch_size=2))
+    message_spool.engage("test outage")
+
+    new = [spool.new_record(convo_id, sender_id, f"during outage {n}") for n in range(5)]
+    records = await asyncio.gather(*(message_spool.append(record) for record in new))
+    assert message_spool.stats()["fsyncs"] == 1
+    with open(message_spool.path, "rb") as f:
+        assert [json.loads(line)["id"] for line in f] == [r["id"] for r in records]
+
+    await asyncio.sleep(0.1)
+    assert message_spool.stats()["drain_failures"] > 0
+    assert message_spool.stats()["pending"] == 5 and message_spool.active()
+
+    standin.paused = False
+    await _until(lambda: not message_spool.active())
+    task.cancel()
+
+    stored = standin.messages()
+    assert [str(message_id) for message_id, _ in stored] == [r["id"] for r in records]
+    assert [decrypt_message(content) for _, content in stored] == [f"during outage {n}" for n in range(5)]
+    assert os.path.getsize(message_spool.path) == 0
+    announced = [json.loads(call.args[0]) for call in broadcast.await_args_list]
+    assert {a["type"] for a in announced} == {"messages_persisted"}
+    assert [message_id for a in announced for message_id in a["message_ids"]] == [r["id"] for r in records]
+
+
+@pytest.mark.asyncio
+async def test_replay_after_crash_is_idempotent(tmp_path, standin):
+    """
+    Test that a worker restarting on its spool skips records that already reached the
+    database and drops a line torn by the crash.
+    """
+    sender_id, convo_id = standin.seed()
+    directory = str(tmp_path / "spool")
+    crashed = MessageSpool(directory)
+    crashed.open()
+    records = await asyncio.gather(*(
+        crashed.append(spool.new_record(convo_id, sender_id, f"message {n}", client_message_id=f"c{n}"))
+        for n in range(3)
+    ))
+    with standin.Session() as db:
+        chat_crud.store_spooled_messages(db, records[:1])  # drained just before the crash
+    crashed.close()
+    with open(crashed.path, "ab") as f:
+        f.write(b'{"id": "torn')
+
+    restarted = MessageSpool(directory)
+    assert restarted.open() == 3
+    assert restarted.path == crashed.path and restarted.active()
+    task = asyncio.create_task(restarted.run(standin.Session, AsyncMock()))
+    await _until(lambda: not restarted.active())
+    task.cancel()
+
+    assert [str(message_id) for message_id, _ in standin.messages()] == [r["id"] for r in records]
+    with standin.Session() as db:
+        assert db.execute(select(func.count()).select_from(models.MessageClientId)).scalar() == 3
+
+
+@pytest.mark.asyncio
+async def test_rejected_record_is_dead_lettered_and_the_rest_drain(tmp_path, standin):
+    """
+    Test that a record the database rejects for good (here an IntegrityError) is moved
+    to the dead-letter file and reported, instead of holding back every later message.
+    """
+    sender_id, convo_id = standin.seed()
+    with standin.Session() as db:
+        # A client id row left pointing at nothing: storing a message under it again
+        # violates the primary key.
+        db.add(models.MessageClientId(sender_id=sender_id, client_message_id="stale", message_id=uuid.uuid4()))
+        db.commit()
+    message_spool = MessageSpool(str(tmp_path / "spool"))
+    message_spool.open()
+    records = await asyncio.gather(*(
+        message_spool.append(spool.new_record(convo_id, sender_id, text, client_message_id=client_id))
+        for text, client_id in [("first", "a"), ("poison", "stale"), ("third", "c")]
+    ))
+    broadcast = AsyncMock()
+    task = asyncio.create_task(message_spool.run(standin.Session, broadcast, rate=1000))
+    await _until(lambda: not message_spool.active())
+    task.cancel()
+
+    assert [str(message_id) for message_id, _ in standin.messages()] == [records[0]["id"], records[2]["id"]]
+    with open(tmp_path / "spool" / spool.DEAD_LETTER_FILE) as f:
+        dead = [json.loads(line) for line in f]
+    assert [(d["id"], d["error"]) for d in dead] == [(records[1]["id"], "IntegrityError")]
+    assert message_spool.stats()["dead_lettered"] == 1 and message_spool.stats()["drain_failures"] == 0
+    announced = [json.loads(call.args[0]) for call in broadcast.await_args_list]
+    assert {"type": "messages_failed", "conversation_id": str(convo_id), "sender_id": str(sender_id),
+            "message_ids": [records[1]["id"]]} in announced
+
+
+@pytest.mark.asyncio
+async def test_workers_own_separate_files_and_take_over_dead_ones(tmp_path, standin):
+    sender_id, convo_id = standin.seed()
+    directory = str(tmp_path / "spool")
+    first, second = MessageSpool(directory), MessageSpool(directory)
+    first.open()
+    second.open()
+    assert first.path != second.path
+    await first.append(spool.new_record(convo_id, sender_id, "from the first worker"))
+    await second.append(spool.new_record(convo_id, sender_id, "from the second worker"))
+    first.close()
+    second.close()
+
+    survivor = MessageSpool(directory)
+    assert survivor.open() == 2
+    assert os.listdir(directory) == [os.path.basename(survivor.path)]
+    with open(survivor.path, "rb") as f:
+        assert len(f.readlines()) == 2
+
+
+@pytest.mark.asyncio
+async def test_drain_is_rate_limited(tmp_path, standin):
+    sender_id, convo_id = standin.seed()
+    message_spool = MessageSpool(str(tmp_path / "spool"))
+    message_spool.open()
+    await asyncio.gather(*(
+        message_spool.append(spool.new_record(convo_id, sender_id, f"queued {n}")) for n in range(20)
+    ))
+
+    started = time.monotonic()
+    task = asyncio.create_task(message_spool.run(standin.Session, AsyncMock(), rate=100, batch_size=5))
+    await _until(lambda: not message_spool.active())
+    task.cancel()
+
+    # Four batches of five at 100 messages/s: three pauses of 50 ms between them.
+    assert time.monotonic() - started >= 0.14
+    assert len(standin.messages()) == 20
+
+
+@pytest.mark.asyncio
+async def test_client_message_id_is_accepted_once(tmp_path):
+    message_spool = MessageSpool(str(tmp_path / "spool"))
+    message_spool.open()
+    sender_id, convo_id = uuid.uuid4(), uuid.uuid4()
+    first = await message_spool.append(spool.new_record(convo_id, sender_id, "hello", client_message_id="abc"))
+    retry = await message_spool.append(spool.new_record(convo_id, sender_id, "hello", client_message_id="abc"))
+
+    assert retry["id"] == first["id"]
+    assert message_spool.stats()["pending"] == 1 and message_spool.stats()["duplicates"] == 1
+
+
+def test_create_message_with_client_id_is_idempotent(test_client, db_session: Session):
+    _, sender_id, convo_id = setup_conversation(test_client, "retrier")
+    message = schemas.MessageCreate(content="only once")
+    first = chat_crud.create_message(db_session, message, sender_id, convo_id, client_message_id="tab1-42")
+    retry = chat_crud.create_message(db_session, message, sender_id, convo_id, client_message_id="tab1-42")
+
+    assert retry.id == first.id
+    assert db_session.query(models.Message).filter_by(conversation_id=convo_id).count() == 1
+
+
+def test_late_drain_does_not_move_the_last_message_back(test_client, db_session: Session):
+    """
+    Test that a spooled message drained after a newer direct write leaves the
+    conversation's last-message pointer and preview on the newer message.
+    """
+    _, sender_id, convo_id = setup_conversation(test_client, "laggard")
+    spooled = spool.new_record(convo_id, sender_id, "accepted during the outage")
+    spooled["created_at"] = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    newer = chat_crud.create_message(db_session, schemas.MessageCreate(content="written directly"), sender_id, convo_id)
+    convo = db_session.get(models.Conversation, convo_id)
+    pointer = (convo.last_message_at, convo.last_message_id, convo.last_message_preview)
+
+    chat_crud.store_spooled_messages(db_session, [spooled])
+
+    db_session.refresh(convo)
+    assert (convo.last_message_at, convo.last_message_id, convo.last_message_preview) == pointer
+    assert convo.last_message_id == newer.id
+    assert decrypt_message(convo.last_message_preview) == "written directly"
+    assert db_session.get(models.Message, uuid.UUID(spooled["id"])) is not None
+
+
+def test_hung_write_is_spooled_without_blocking_the_socket(test_client, db_session: Session, tmp_path, monkeypatch):
+    """
+    Test that a write that does not return within SPOOL_SLOW_WRITE is spooled, under the
+    id the direct write was using, instead of holding up the socket until it returns.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "hung")
+    token = headers["Authorization"].split()[1]
+    message_spool = MessageSpool(str(tmp_path / "spool"))
+    message_spool.open()
+    monkeypatch.setattr(main, "message_spool", message_spool)
+    monkeypatch.setattr(spool, "SPOOL_SLOW_WRITE", 0.05)
+    monkeypatch.setattr(database, "SessionLocal", lambda: db_session)
+    release = threading.Event()
+    written = []
+
+    def hung_create_message(db, message, sender, conversation, client_message_id=None, message_id=None):
+        written.append(message_id)
+        release.wait(5)
+        raise OperationalError("INSERT", {}, TimeoutError("database hung"))
+
+    monkeypatch.setattr(chat_crud, "create_message", hung_create_message)
+    try:
+        with test_client.websocket_connect(f"/ws/{convo_id}/{token}") as websocket:
+            started = time.monotonic()
+            websocket.send_text(json.dumps({"type": "message", "content": "are you there?", "client_message_id": "h-1"}))
+            frame = websocket.receive_json()
+            while "content" not in frame:
+                frame = websocket.receive_json()
+            elapsed = time.monotonic() - started
+    finally:
+        release.set()
+
+    assert frame["status"] == "pending" and frame["client_message_id"] == "h-1"
+    assert elapsed < 2
+    assert frame["id"] == str(written[0])
+    assert message_spool.active() and message_spool.stats()["pending"] == 1
+
+
+def test_parse_message_frames():
+    assert parse_message("plain text") == ("plain text", None)
+    assert parse_message('{"type": "message", "content": "hi", "client_message_id": "c-1"}') == ("hi", "c-1")
+    assert parse_message('{"not": "a frame"}') == ('{"not": "a frame"}', None)
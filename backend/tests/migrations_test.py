@@ -0,0 +1,103 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect
+
+from app.core import security
+from app.db import migrate
+from app.db.database import Base
+
+from conftest import get_auth_headers
+
+
+def _config(url: str) -> Config:
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url)
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def _schema_diffs(engine):
+    with engine.connect() as connection:
+        diffs = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+    # Expression indexes (lower(...)) are not reflected by SQLite; they are created with raw DDL.
+    return [d for d in diffs if not (d[0] in ("add_index", "remove_index") and d[1].name.endswith("_lower"))]
+
+
+def test_upgrade_head_builds_the_model_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    command.upgrade(_config(url), "head")
+
+    engine = create_engine(url)
+    assert _schema_diffs(engine) == []
+    indexes = {index["name"] for index in inspect(engine).get_indexes("messages")}
+    assert "ix_messages_conversation_order" in indexes
+
+
+def test_upgrade_adopts_a_create_all_database(tmp_path):
+    """Databases built by create_all before migrations existed upgrade in place."""
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+
+    command.upgrade(_config(url), "head")
+    assert _schema_diffs(engine) == []
+
+
+def test_downgrade_to_base_and_back(tmp_path):
+    url = f"sqlite:///{tmp_path / 'roundtrip.db'}"
+    config = _config(url)
+    command.upgrade(config, "head")
+    command.downgrade(config, "base")
+    assert set(inspect(create_engine(url)).get_table_names()) == {"alembic_version"}
+    command.upgrade(config, "head")
+    assert _schema_diffs(create_engine(url)) == []
+
+
+def test_migrate_upgrade_then_schema_check(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'deploy.db'}")
+    head = migrate.head_revision()
+    assert migrate.SCHEMA_REVISION == head, "bump SCHEMA_REVISION in app/db/migrate.py"
+
+    assert migrate.upgrade(engine) == head
+    assert migrate.upgrade(engine) == head  # already current: nothing to do
+    assert migrate.check_schema_version(engine) == head
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="needs a scratch Postgres database")
+def test_migrate_upgrade_on_postgres():
+    """The deploy step runs every revision, including the CONCURRENTLY index build, on Postgres."""
+    url = os.environ["TEST_POSTGRES_URL"]
+    command.downgrade(_config(url), "base")
+    engine = create_engine(url)
+    try:
+        assert migrate.upgrade(engine) == migrate.head_revision()
+        assert migrate.check_schema_version(engine) == migrate.SCHEMA_REVISION
+    finally:
+        engine.dispose()
+        command.downgrade(_config(url), "base")
+
+
+def test_schema_check_rejects_an_unmigrated_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stale.db'}")
+    Base.metadata.create_all(engine)
+    with pytest.raises(migrate.SchemaVersionError, match="python -m app.db.migrate"):
+        migrate.check_schema_version(engine)
+
+
+def test_startup_reports_phase_timings_to_admins(test_client, monkeypatch):
+    monkeypatch.setattr(security, "ADMIN_USERNAMES", {"boottimer"})
+    for username in ("boottimer", "curious"):
+        test_client.post("/auth/register", json={"email": f"{username}@example.com", "username": username, "password": "password123"})
+    res = test_client.get("/stats/startup", headers=get_auth_headers(test_client, "boottimer"))
+    assert res.status_code == 200
+    timings = res.json()
+    assert {"import", "db_connect", "pool_warmup"} <= set(timings["phases_ms"])
+    assert timings["total_ms"] >= timings["phases_ms"]["import"]
+
+    assert test_client.get("/stats/startup", headers=get_auth_headers(test_client, "curious")).status_code == 403
+    assert test_client.get("/stats/startup").status_code == 401
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from benchmarks import query_plans
+
+
+def _failures(results):
+    return {r.case: r.violations + r.regressions for r in results if r.violations or r.regressions}
+
+
+def test_crud_query_plans_match_sqlite_baseline():
+    """
+    Test that no CRUD query scans a large table and no plan got worse than the committed baseline.
+    On failure: add the index (python -m benchmarks.query_plans --propose), or if the new
+    plan is intended, refresh the baseline with --update-baseline.
+    """
+    dialect, results = query_plans.run()
+    assert dialect == "sqlite"
+    assert _failures(results) == {}
+
+
+@pytest.mark.skipif(not os.getenv("QUERY_PLAN_POSTGRES_URL"), reason="needs a scratch Postgres database")
+def test_crud_query_plans_match_postgres_baseline():
+    dialect, results = query_plans.run(os.environ["QUERY_PLAN_POSTGRES_URL"])
+    assert dialect == "postgresql"
+    assert _failures(results) == {}
+
+
+def test_scan_is_flagged_with_an_index_proposal():
+    sql = "SELECT participants.user_id FROM participants WHERE participants.conversation_id IN (?, ?)"
+    result = query_plans.Result("example", [query_plans.Statement(sql, ["SCAN participants"], None, ["participants"])])
+    query_plans.check(result, {"scans": 0, "temp_sorts": 0, "cost": None})
+    assert result.proposals == [("participants", ("conversation_id",))]
+    assert result.regressions == ["full scans 0 -> 1"]
@@ -0,0 +1,86 @@
+from fastapi.testclient import TestClient
+
+from app.core import security
+from app.core.rate_limit import RateLimiter, TokenBucket
+
+from conftest import FakeClock, get_auth_headers
+
+
+def _limiter(clock, socket=(1, 3), user=(0, 0), conversation=(0, 0), **kwargs):
+    return RateLimiter(socket_limit=socket, user_limit=user, conversation_limit=conversation, clock=clock, **kwargs)
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=4, now=0)
+    assert bucket.refill(0) == 4
+    bucket.tokens = 0
+    assert bucket.wait_time() == 0.5
+    assert bucket.refill(1) == 2
+    assert bucket.refill(100) == 4
+
+
+def test_socket_limit_rejects_with_retry_after():
+    """
+    Test that a socket can send its burst, is then throttled, and recovers at the refill rate.
+    """
+    clock = FakeClock()
+    limiter = _limiter(clock)
+
+    assert [limiter.check("ws", "u", "c") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.check("ws", "u", "c") == 1.0
+    assert limiter.check("other-ws", "u", "c") == 0.0
+
+    clock.now += 1
+    assert limiter.check("ws", "u", "c") == 0.0
+    assert limiter.stats()["allowed"] == 5
+    assert limiter.stats()["rejected"] == {"socket": 1, "user": 0, "conversation": 0}
+
+
+def test_user_limit_spans_sockets_and_rejection_does_not_drain_other_scopes():
+    clock = FakeClock()
+    limiter = _limiter(clock, socket=(1, 10), user=(1, 2))
+
+    assert limiter.check("tab-1", "u", "c") == 0.0
+    assert limiter.check("tab-2", "u", "c") == 0.0
+    assert limiter.check("tab-3", "u", "c") > 0
+    assert limiter.rejected["user"] == 1
+    # The rejected frame did not cost tab-3 a socket token.
+    assert limiter._buckets["socket"]["tab-3"].tokens == 10
+
+
+def test_least_recently_used_bucket_is_evicted_and_released():
+    clock = FakeClock()
+    limiter = _limiter(clock, max_tracked=2)
+    limiter.check("a", "u", "c")
+    limiter.check("b", "u", "c")
+    limiter.check("a", "u", "c")
+    limiter.check("c", "u", "c")
+    assert list(limiter._buckets["socket"]) == ["a", "c"]
+
+    limiter.release("c")
+    assert limiter.stats()["tracked"]["socket"] == 1
+
+
+def test_table_stays_capped_when_every_bucket_is_busy():
+    """
+    Test that a flood of new keys, all of them mid-burst, cannot grow a table past
+    max_tracked (there are no idle buckets to drop).
+    """
+    clock = FakeClock()
+    limiter = _limiter(clock, socket=(1, 3), max_tracked=100)
+    for n in range(1000):
+        limiter.check(f"ws-{n}", "u", "c")
+    assert limiter.stats()["tracked"]["socket"] == 100
+    assert limiter.stats()["evicted"] == 900
+
+
+def test_rate_limit_stats_endpoint_is_for_admins(test_client: TestClient, monkeypatch):
+    monkeypatch.setattr(security, "ADMIN_USERNAMES", {"ops"})
+    for username in ("ops", "nosy"):
+        test_client.post("/auth/register", json={"email": f"{username}@example.com", "username": username, "password": "password123"})
+    res = test_client.get("/stats/rate-limits", headers=get_auth_headers(test_client, "ops"))
+    assert res.status_code == 200
+    assert set(res.json()["rejected"]) == {"socket", "user", "conversation"}
+
+    assert test_client.get("/stats/rate-limits", headers=get_auth_headers(test_client, "nosy")).status_code == 403
+    assert test_client.get("/stats/rate-limits").status_code == 401
@@ -0,0 +1,122 @@
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.core import security
+from app.db import database, models
+from app.db.database import Base, ReplicaRouter, subject_from_request
+
+from conftest import FakeClock, get_auth_headers
+
+
+@pytest.fixture
+def two_databases(tmp_path):
+    """A primary and a 'replica' SQLite database. The replica never receives writes, like a lagging replica."""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=primary)() as db:
+        db.add(models.User(id=uuid.uuid4(), email="w@example.com", username="writer", hashed_password="x"))
+        db.commit()
+    yield sessionmaker(bind=primary), sessionmaker(bind=replica)
+    primary.dispose()
+    replica.dispose()
+
+
+def _sees_writer(session) -> bool:
+    with session:
+        return session.query(models.User).filter_by(username="writer").first() is not None
+
+
+def test_reads_go_to_replica_except_inside_read_your_writes_window(two_databases):
+    primary, replica = two_databases
+    clock = FakeClock()
+    router = ReplicaRouter(primary, replica, read_your_writes_seconds=5, clock=clock)
+
+    assert not _sees_writer(router.session_for("writer"))
+
+    router.note_write("writer")
+    assert _sees_writer(router.session_for("writer"))
+    assert not _sees_writer(router.session_for("someone_else"))
+    assert not _sees_writer(router.session_for(None))
+
+    clock.now += 6
+    assert not _sees_writer(router.session_for("writer"))
+
+
+def test_write_token_pins_reads_on_another_worker(two_databases):
+    """
+    Test read-your-writes across workers: each worker has its own router, so only the
+    token the writer got back can pin its next read on a worker that never saw the write.
+    """
+    primary, replica = two_databases
+    clock, wall_clock = FakeClock(), FakeClock()
+    worker_a = ReplicaRouter(primary, replica, read_your_writes_seconds=5, clock=clock, wall_clock=wall_clock)
+    worker_b = ReplicaRouter(primary, replica, read_your_writes_seconds=5, clock=clock, wall_clock=wall_clock)
+
+    token = worker_a.note_write("writer")
+    assert not _sees_writer(worker_b.session_for("writer"))
+    assert _sees_writer(worker_b.session_for("writer", worker_b.written_at(token, "writer")))
+
+    assert worker_b.written_at(token, "someone_else") is None
+    assert worker_b.written_at(token[:-2] + "xx", "writer") is None
+    wall_clock.now += 6
+    assert not _sees_writer(worker_b.session_for("writer", worker_b.written_at(token, "writer")))
+
+
+def test_write_responses_carry_the_token_and_reads_honor_it(test_client, two_databases, monkeypatch):
+    primary, replica = two_databases
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(primary, replica))
+    test_client.post("/auth/register", json={"email": "rw@example.com", "username": "rw", "password": "password123"})
+    headers = get_auth_headers(test_client, "rw")
+
+    res = test_client.post("/conversations/", json={"user_ids": []}, headers=headers)
+    token = res.headers[database.READ_YOUR_WRITES_HEADER]
+    assert test_client.get("/", headers=headers).headers.get(database.READ_YOUR_WRITES_HEADER) is None
+
+    # Another worker: nothing in its own memory, only the header.
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(primary, replica))
+    assert _read_bind(headers) is replica.kw["bind"]
+    assert _read_bind({**headers, database.READ_YOUR_WRITES_HEADER: token}) is primary.kw["bind"]
+
+
+def _read_bind(headers):
+    request = Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+    dependency = database.get_read_db(request)
+    bind = next(dependency).get_bind()
+    dependency.close()
+    return bind
+
+
+def test_unhealthy_replica_falls_back_to_primary(two_databases, tmp_path):
+    primary, _ = two_databases
+    clock = FakeClock()
+    # A replica URL that cannot be opened: the parent directory does not exist.
+    broken = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    router = ReplicaRouter(primary, broken, health_check_seconds=10, clock=clock)
+
+    assert _sees_writer(router.session_for(None))
+    assert not router.replica_healthy()
+
+    # Recovery is noticed at the next health check, not before.
+    (tmp_path / "missing").mkdir()
+    clock.now += 5
+    assert not router.replica_healthy()
+    clock.now += 5
+    assert router.replica_healthy()
+
+
+def test_no_replica_configured_uses_primary(two_databases):
+    primary, _ = two_databases
+    assert _sees_writer(ReplicaRouter(primary, None).session_for(None))
+
+
+def test_subject_from_request_reads_bearer_token():
+    token = security.create_access_token({"sub": "alice"})
+    request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+    assert subject_from_request(request) == "alice"
+    assert subject_from_request(Request({"type": "http", "headers": []})) is None
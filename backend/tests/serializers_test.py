@@ -0,0 +1,149 @@
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.models import MessageStatus
+from app.schemas import schemas, serializers
+
+from conftest import send_message, setup_conversation
+
+ALICE = SimpleNamespace(id=uuid.UUID("0192b3c4-0000-7000-8000-00000000a11c"), username="alice")
+BOB = SimpleNamespace(id=uuid.UUID("0192b3c4-0000-7000-8000-000000000b0b"), username="bøb")
+
+# (id, content, created_at, status, sender): aware UTC, microseconds and naive (SQLite)
+# timestamps, every status, and content that needs escaping or is not ASCII.
+MESSAGES = [
+    (uuid.UUID("0192b3c4-0001-7000-8000-000000000001"), "plain",
+     datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc), MessageStatus.sent, ALICE),
+    (uuid.UUID("0192b3c4-0001-7000-8000-000000000002"), 'quotes " and \\ slashes </script>',
+     datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc), MessageStatus.delivered, BOB),
+    (uuid.UUID("0192b3c4-0001-7000-8000-000000000003"), "ünïcödé ✓ 😀\nline\ttab\u2028sep\x01",
+     datetime(2026, 3, 1, 12, 1, 30), MessageStatus.read, ALICE),
+]
+
+# What `response_model=List[schemas.Message]` produced for MESSAGES before the fast path.
+MESSAGES_GOLDEN = (
+    '[{"content":"plain","id":"0192b3c4-0001-7000-8000-000000000001","status":"sent","sender":{"id":"0192b3c4-0000-7000-8000-00000000a11c","username":"alice"},"created_at":"2026-03-01T12:00:00Z"},'
+    '{"content":"quotes \\" and \\\\ slashes </script>","id":"0192b3c4-0001-7000-8000-000000000002","status":"delivered","sender":{"id":"0192b3c4-0000-7000-8000-000000000b0b","username":"bøb"},"created_at":"2026-03-01T12:00:00.123456Z"},'
+    '{"content":"ünïcödé ✓ 😀\\nline\\ttab\u2028sep\\u0001","id":"0192b3c4-0001-7000-8000-000000000003","status":"read","sender":{"id":"0192b3c4-0000-7000-8000-00000000a11c","username":"alice"},"created_at":"2026-03-01T12:01:30"}]'
+).encode()
+
+# What `response_model=List[schemas.Conversation]` produced for conversation_rows().
+CONVERSATIONS_GOLDEN = (
+    '[{"name":"Ünïcode \\"group\\"","id":"0192b3c4-0002-7000-8000-000000000001","is_group_chat":true,"participants":[{"id":"0192b3c4-0000-7000-8000-00000000a11c","username":"alice"},{"id":"0192b3c4-0000-7000-8000-000000000b0b","username":"bøb"}],"last_message_at":"2026-03-01T12:00:00.123456Z","has_unread":true,"last_message":{"id":"0192b3c4-0001-7000-8000-000000000002","sender":{"id":"0192b3c4-0000-7000-8000-000000000b0b","username":"bøb"},"content":"quotes \\" and \\\\ slashes </script>"}},'
+    '{"name":null,"id":"0192b3c4-0002-7000-8000-000000000002","is_group_chat":false,"participants":[{"id":"0192b3c4-0000-7000-8000-00000000a11c","username":"alice"}],"last_message_at":null,"has_unread":false,"last_message":null}]'
+).encode()
+
+
+def old_response_bytes(response_model, payload) -> bytes:
+    """The body a plain route declared with `response_model` returns, as the endpoints did."""
+    app = FastAPI()
+
+    @app.get("/", response_model=response_model)
+    def endpoint():
+        return payload
+
+    return TestClient(app).get("/").content
+
+
+def message_objects():
+    return [
+        SimpleNamespace(id=msg_id, content=content, created_at=created_at, status=msg_status, sender=sender)
+        for msg_id, content, created_at, msg_status, sender in MESSAGES
+    ]
+
+
+def message_rows():
+    return [
+        (msg_id, content, created_at, msg_status, sender.id, sender.username)
+        for msg_id, content, created_at, msg_status, sender in MESSAGES
+    ]
+
+
+def conversation_rows():
+    last = MESSAGES[1]
+    return [
+        (uuid.UUID("0192b3c4-0002-7000-8000-000000000001"), "Ünïcode \"group\"", True,
+         datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc), True,
+         [(ALICE.id, ALICE.username), (BOB.id, BOB.username)],
+         (last[0], last[4].id, last[4].username, last[1])),
+        (uuid.UUID("0192b3c4-0002-7000-8000-000000000002"), None, False, None, False,
+         [(ALICE.id, ALICE.username)], None),
+    ]
+
+
+def conversation_objects():
+    return [
+        SimpleNamespace(
+            id=convo_id, name=name, is_group_chat=is_group_chat, last_message_at=last_message_at,
+            has_unread=has_unread,
+            participants=[SimpleNamespace(user=SimpleNamespace(id=user_id, username=username))
+                          for user_id, username in participants],
+            last_message=None if last_message is None else SimpleNamespace(
+                id=last_message[0], sender=SimpleNamespace(id=last_message[1], username=last_message[2]),
+                content=last_message[3],
+            ),
+        )
+        for convo_id, name, is_group_chat, last_message_at, has_unread, participants, last_message in conversation_rows()
+    ]
+
+
+@pytest.fixture(params=["orjson", "pydantic-core"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serializers, "orjson", None)
+    return request.param
+
+
+def test_golden_matches_the_response_model_path():
+    """
+    Test that the golden bytes are still what the old response_model path produces, so
+    the fast path is held to that path and not to a copy of itself.
+    """
+    assert old_response_bytes(List[schemas.Message], message_objects()) == MESSAGES_GOLDEN
+    assert old_response_bytes(List[schemas.Conversation], conversation_objects()) == CONVERSATIONS_GOLDEN
+
+
+def test_message_dicts_match_golden(encoder):
+    assert serializers.FastJSONResponse(serializers.message_dicts(message_rows())).body == MESSAGES_GOLDEN
+
+
+def test_conversation_dicts_match_golden(encoder):
+    assert serializers.FastJSONResponse(serializers.conversation_dicts(conversation_rows())).body == CONVERSATIONS_GOLDEN
+
+
+def test_message_page_matches_response_model_bytes(test_client: TestClient, db_session: Session):
+    """
+    Test that the endpoint returns exactly the bytes response_model=List[Message] gives
+    for the same stored messages.
+    """
+    headers, sender_id, convo_id = setup_conversation(test_client, "bytes")
+    for text in ["plain", 'quotes " and \\ slashes', "ünïcödé ✓", "x" * 600]:
+        send_message(db_session, sender_id, convo_id, text)
+
+    res = test_client.get(f"/conversations/{convo_id}/messages", headers=headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/json"
+    assert "ETag" in res.headers
+
+    orm_messages = (
+        db_session.query(models.Message)
+        .filter(models.Message.conversation_id == convo_id)
+        .order_by(models.Message.created_at, models.Message.id)
+        .all()
+    )
+    plaintext = {m["id"]: m["content"] for m in res.json()}
+    expected = old_response_bytes(List[schemas.Message], [
+        SimpleNamespace(content=plaintext[str(m.id)], id=m.id, status=m.status, sender=m.sender, created_at=m.created_at)
+        for m in orm_messages
+    ])
+    assert res.content == expected
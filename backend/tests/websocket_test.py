@@ -103,3 +103,22 @@ async def test_connect_informs_about_existing_users(manager: ConnectionManager):
     # Assert that User B received a list containing User A's ID
     expected_online_list = json.dumps({"type": "online_users_list", "user_ids": ["user_a"]})
     user_b_ws.send_text.assert_any_await(expected_online_list)
+
+
+async def test_indices_share_one_compact_record(manager: ConnectionManager):
+    """
+    Test that every index points at the same slotted record and that ids are shared.
+    """
+    ws_1, ws_2 = AsyncMock(), AsyncMock()
+    await manager.connect(ws_1, "".join(["user", "_a"]), "convo1")
+    await manager.connect(ws_2, "".join(["user", "_a"]), "".join(["convo", "2"]))
+
+    record = manager.connections[ws_1]
+    assert not hasattr(record, "__dict__")
+    assert manager.active_connections["convo1"][ws_1] is record
+    assert manager.user_connections["user_a"][ws_1] is record
+    assert manager.connections[ws_2].user_id is record.user_id
+
+    # Closing one tab only takes the user out of that conversation.
+    await manager.disconnect(ws_2, "user_a", "convo2")
+    assert manager.online_users == {"user_a": {"convo1"}}
@@ -1,9 +1,24 @@
 
 import React, { useState, useEffect, useRef } from 'react';
-import { connectWebSocket, disconnectWebSocket, sendMessage } from '../../services/socket';
-import { getMessagesForConversation } from '../../services/api';
+import { connectWebSocket, disconnectWebSocket, sendMessage, sendTyping } from '../../services/socket';
+import { getMessagesForConversation, getAttachments, uploadAttachment, downloadAttachment } from '../../services/api';
 import './ChatWindow.css'; // Renamed from Chat.css
 
+const formatSize = (bytes) => {
+  if (bytes < 1024) return `${bytes} B`;
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+  return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+};
+
+// Adds attachments to the message id -> attachments map, skipping ones already there.
+const mergeAttachments = (byMessage, list) => {
+  const next = { ...byMessage };
+  list.forEach(a => {
+    const existing = next[a.message_id] || [];
+    if (!existing.some(e => e.id === a.id)) next[a.message_id] = [...existing, a];
+  });
+  return next;
+};
 
 const ChatWindow = ({ conversation, user, onNewMessage }) => {
   const [allMessages, setAllMessages] = useState([]);
@@ -11,7 +26,13 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
   const [newMessage, setNewMessage] = useState('');
   const [onlineUsers, setOnlineUsers] = useState(new Set());
   const [searchQuery, setSearchQuery] = useState('');
+  const [typingUserIds, setTypingUserIds] = useState([]);
+  // message id -> attachments sent with it
+  const [attachments, setAttachments] = useState({});
+  const [uploading, setUploading] = useState(false);
   const messagesEndRef = useRef(null);
+  const fileInputRef = useRef(null);
+  const lastTypingSentRef = useRef(0);
 
   // Effect 1: Fetch historical messages and set up WebSocket
   useEffect(() => {
@@ -19,6 +40,8 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
     setAllMessages([]);
     setFilteredMessages([]);
     setOnlineUsers(new Set());
+    setTypingUserIds([]);
+    setAttachments({});
 
     const fetchMessages = async () => {
       if (conversation) {
@@ -28,6 +51,13 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
         } catch (error) {
           console.error("Failed to fetch messages", error);
         }
+        try {
+          const response = await getAttachments(conversation.id);
+          const list = response?.data || [];
+          setAttachments(prev => mergeAttachments(prev, list));
+        } catch (error) {
+          console.error("Failed to fetch attachments", error);
+        }
       }
     };
     fetchMessages();
@@ -53,9 +83,29 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
                     msg.message_ids.includes(m.id) ? { ...m, status: 'read' } : m
                 )
             );
+        } else if (msg.type === 'messages_persisted') {
+            // Messages accepted while the database was unavailable have now been stored.
+            setAllMessages(prev =>
+                prev.map(m =>
+                    msg.message_ids.includes(m.id) && m.status === 'pending' ? { ...m, status: 'sent' } : m
+                )
+            );
+        } else if (msg.type === 'messages_failed') {
+            // The database rejected these spooled messages for good; they were not stored.
+            setAllMessages(prev =>
+                prev.map(m => (msg.message_ids.includes(m.id) ? { ...m, status: 'failed' } : m))
+            );
+        } else if (msg.type === 'typing') {
+            setTypingUserIds(msg.user_ids);
+        } else if (msg.type === 'error') {
+            // e.g. code 'rate_limited' with retry_after seconds; the message was not sent.
+            console.warn("Message rejected by server", msg.code, msg.retry_after);
         } else { // It's a regular chat message
             if (msg.conversation_id === conversation.id) {
-                setAllMessages(prev => [...prev, msg]);
+                setAllMessages(prev =>
+                    prev.some(m => m.id === msg.id) ? prev.map(m => (m.id === msg.id ? msg : m)) : [...prev, msg]
+                );
+                if (msg.attachments) setAttachments(prev => mergeAttachments(prev, msg.attachments));
             } else {
                 onNewMessage(msg);
             }
@@ -94,6 +144,50 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
     if (newMessage.trim() && conversation) {
       sendMessage(newMessage);
       setNewMessage('');
+      lastTypingSentRef.current = 0;
+    }
+  };
+
+  const handleFileSelected = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file || !conversation) return;
+    setUploading(true);
+    try {
+      // The message comes back over the WebSocket like any other.
+      await uploadAttachment(conversation.id, file, newMessage.trim() || null);
+      setNewMessage('');
+    } catch (error) {
+      console.error("Failed to upload attachment", error);
+    } finally {
+      setUploading(false);
+    }
+  };
+
+  const handleDownload = async (attachment) => {
+    try {
+      const response = await downloadAttachment(conversation.id, attachment.id);
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = attachment.filename;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error("Failed to download attachment", error);
+    }
+  };
+
+  const handleInputChange = (e) => {
+    setNewMessage(e.target.value);
+    // Refresh the server's typing state at most every 2s; it expires on its own if we stop.
+    const now = Date.now();
+    if (e.target.value && now - lastTypingSentRef.current > 2000) {
+      sendTyping(true);
+      lastTypingSentRef.current = now;
+    } else if (!e.target.value && lastTypingSentRef.current) {
+      sendTyping(false);
+      lastTypingSentRef.current = 0;
     }
   };
 
@@ -103,6 +197,9 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
   
   const otherUser = conversation.is_group_chat ? null : conversation.participants.find(p => p.username !== user.username);
   const isOtherUserOnline = otherUser && onlineUsers.has(otherUser.id);
+  const typingNames = conversation.participants
+    .filter(p => p.username !== user.username && typingUserIds.includes(p.id))
+    .map(p => p.username);
 
 
   return (
@@ -126,15 +223,27 @@ const ChatWindow = ({ conversation, user, onNewMessage }) => {
           <div key={msg.id} className={`message-item ${msg.sender.username === user.username ? 'my-message' : ''}`}>
              <div className="message-sender">{msg.sender.username}</div>
              <div className="message-content">{msg.content}</div>
+             {(attachments[msg.id] || []).map(a => (
+               <button key={a.id} type="button" className="message-attachment" onClick={() => handleDownload(a)}>
+                 📎 {a.filename} ({formatSize(a.size)})
+               </button>
+             ))}
              <div className="message-timestamp">{new Date(msg.created_at).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}</div>
              {msg.sender.username === user.username && <span className="message-status">{msg.status}</span>}
           </div>
         ))}
         <div ref={messagesEndRef} />
       </main>
+      {typingNames.length > 0 && (
+        <div className="typing-indicator">{typingNames.join(', ')} {typingNames.length === 1 ? 'is' : 'are'} typing…</div>
+      )}
       <footer className="chat-input-area">
         <form onSubmit={handleSendMessage} className="message-form">
-          <input type="text" value={newMessage} onChange={(e) => setNewMessage(e.target.value)} placeholder="Type a message..." className="message-input" autoFocus />
+          <input type="file" ref={fileInputRef} onChange={handleFileSelected} style={{ display: 'none' }} data-testid="attachment-input" />
+          <button type="button" className="attach-btn" onClick={() => fileInputRef.current.click()} disabled={uploading}>
+            {uploading ? 'Uploading…' : 'Attach'}
+          </button>
+          <input type="text" value={newMessage} onChange={handleInputChange} placeholder="Type a message..." className="message-input" autoFocus />
           <button type="submit" className="send-btn">Send</button>
         </form>
       </footer>
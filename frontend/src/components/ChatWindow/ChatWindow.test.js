@@ -117,4 +117,106 @@ describe('ChatWindow Component', () => {
     await screen.findByText('Online');
     expect(screen.getByText('Online')).toBeInTheDocument();
   });
+
+  test('shows who is typing and sends typing frames', async () => {
+    let onMessageCallback;
+    socket.connectWebSocket.mockImplementation((convoId, token, cb) => {
+      onMessageCallback = cb;
+    });
+
+    await act(async () => {
+      render(<ChatWindow conversation={mockConversation} user={mockUser} />);
+    });
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({ type: 'typing', conversation_id: 'convo1', user_ids: ['user2'] }) })
+    );
+    expect(screen.getByText('otheruser is typing…')).toBeInTheDocument();
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({ type: 'typing', conversation_id: 'convo1', user_ids: [] }) })
+    );
+    expect(screen.queryByText('otheruser is typing…')).not.toBeInTheDocument();
+
+    fireEvent.change(screen.getByPlaceholderText('Type a message...'), { target: { value: 'H' } });
+    expect(socket.sendTyping).toHaveBeenCalledWith(true);
+  });
+
+  test('uploads an attachment and shows it when the message arrives', async () => {
+    let onMessageCallback;
+    socket.connectWebSocket.mockImplementation((convoId, token, cb) => {
+      onMessageCallback = cb;
+    });
+    api.uploadAttachment.mockResolvedValue({ data: { id: 'att1' } });
+
+    await act(async () => {
+      render(<ChatWindow conversation={mockConversation} user={mockUser} />);
+    });
+
+    const file = new File(['quarterly numbers'], 'report.pdf', { type: 'application/pdf' });
+    fireEvent.change(screen.getByPlaceholderText('Type a message...'), { target: { value: 'Q3 report' } });
+    await act(async () => {
+      fireEvent.change(screen.getByTestId('attachment-input'), { target: { files: [file] } });
+    });
+
+    expect(api.uploadAttachment).toHaveBeenCalledWith('convo1', file, 'Q3 report');
+    expect(screen.getByPlaceholderText('Type a message...').value).toBe('');
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({
+        id: 'msg3', sender: { id: 'user1', username: 'testuser' }, content: 'Q3 report',
+        created_at: new Date().toISOString(), conversation_id: 'convo1', status: 'sent',
+        attachments: [{ id: 'att1', message_id: 'msg3', filename: 'report.pdf', size: 17, content_type: 'application/pdf' }],
+      }) })
+    );
+    expect(screen.getByText('Q3 report')).toBeInTheDocument();
+    expect(screen.getByRole('button', { name: /report\.pdf \(17 B\)/ })).toBeInTheDocument();
+  });
+
+  test('marks a message sent during an outage as sent once it is persisted', async () => {
+    let onMessageCallback;
+    socket.connectWebSocket.mockImplementation((convoId, token, cb) => {
+      onMessageCallback = cb;
+    });
+
+    await act(async () => {
+      render(<ChatWindow conversation={mockConversation} user={mockUser} />);
+    });
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({
+        id: 'msg4', sender: { id: 'user1', username: 'testuser' }, content: 'Sent while the database was down',
+        created_at: new Date().toISOString(), conversation_id: 'convo1', status: 'pending',
+      }) })
+    );
+    expect(screen.getByText('pending')).toBeInTheDocument();
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({ type: 'messages_persisted', message_ids: ['msg4'] }) })
+    );
+    expect(screen.queryByText('pending')).not.toBeInTheDocument();
+    expect(screen.getAllByText('Sent while the database was down')).toHaveLength(1);
+  });
+
+  test('marks a spooled message the server could not store as failed', async () => {
+    let onMessageCallback;
+    socket.connectWebSocket.mockImplementation((convoId, token, cb) => {
+      onMessageCallback = cb;
+    });
+
+    await act(async () => {
+      render(<ChatWindow conversation={mockConversation} user={mockUser} />);
+    });
+
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({
+        id: 'msg5', sender: { id: 'user1', username: 'testuser' }, content: 'Never stored',
+        created_at: new Date().toISOString(), conversation_id: 'convo1', status: 'pending',
+      }) })
+    );
+    act(() =>
+      onMessageCallback({ data: JSON.stringify({ type: 'messages_failed', message_ids: ['msg5'] }) })
+    );
+    expect(screen.getByText('failed')).toBeInTheDocument();
+  });
 });
@@ -24,7 +24,14 @@ const ConversationList = ({ conversations, onSelectConversation, activeConversat
               className={`conversation-item ${convo.id === activeConversationId ? 'active' : ''}`}
               onClick={() => onSelectConversation(convo)}
             >
-              <span>{displayName}</span>
+              <div className="conversation-text">
+                <span>{displayName}</span>
+                {convo.last_message && (
+                  <span className="conversation-preview">
+                    {convo.last_message.sender.username === user.username ? 'You: ' : ''}{convo.last_message.content}
+                  </span>
+                )}
+              </div>
               {/* Display a blue dot if the conversation has unread messages */}
               {convo.has_unread && <span className="unread-dot"></span>}
             </div>
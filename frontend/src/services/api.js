@@ -16,9 +16,26 @@ export const login = (username, password) => {
   });
 };
 
+// After a write the server returns a signed token with the time of the write. Sending it
+// back keeps our next reads on the primary database, whichever server handles them.
+const READ_YOUR_WRITES_HEADER = 'X-Read-Your-Writes';
+let readYourWritesToken = null;
+export const setReadYourWritesToken = (token) => {
+  readYourWritesToken = token;
+};
+
+api.interceptors.request.use((config) => {
+  if (readYourWritesToken) {
+    config.headers[READ_YOUR_WRITES_HEADER] = readYourWritesToken;
+  }
+  return config;
+});
+
 // Add a response interceptor to handle 401 Unauthorized errors
 api.interceptors.response.use(
   (response) => {
+    const token = response.headers && response.headers[READ_YOUR_WRITES_HEADER.toLowerCase()];
+    if (token) setReadYourWritesToken(token);
     // If the request was successful (status code 2xx), just return the response
     return response;
   },
@@ -52,4 +69,16 @@ export const createConversation = (userIds, name = null) => api.post('/conversat
 export const getMessagesForConversation = (conversationId) => api.get(`/conversations/${conversationId}/messages`);
 export const markConversationAsRead = (conversationId) => api.post(`/conversations/${conversationId}/read`);
 
+// --- Attachments ---
+// The file is sent as the raw request body; the server streams it to disk as it arrives.
+export const uploadAttachment = (conversationId, file, caption = null, onUploadProgress) =>
+  api.post(`/conversations/${conversationId}/attachments`, file, {
+    params: { filename: file.name, caption: caption || undefined },
+    headers: { 'Content-Type': file.type || 'application/octet-stream' },
+    onUploadProgress,
+  });
+export const getAttachments = (conversationId) => api.get(`/conversations/${conversationId}/attachments`);
+export const downloadAttachment = (conversationId, attachmentId) =>
+  api.get(`/conversations/${conversationId}/attachments/${attachmentId}`, { responseType: 'blob' });
+
 export default api;
\ No newline at end of file
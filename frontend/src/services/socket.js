@@ -1,21 +1,49 @@
+import { setReadYourWritesToken } from './api';
 
 let socket = null;
+let currentConversationId = null;
+let reconnectTimer = null;
 
 const WEBSOCKET_URL = 'ws://localhost:8000/ws';
+const RECONNECT_MAX_DELAY_MS = 30000;
 
-export const connectWebSocket = (conversationId, token, onMessageCallback) => {
+// Message frames the server has not echoed back yet, by client_message_id. They are
+// resent with the same id after a reconnect, and the server stores each id once.
+const unacknowledged = new Map();
+
+export const connectWebSocket = (conversationId, token, onMessageCallback, reconnectDelay = 1000) => {
   // Disconnect any existing socket before creating a new one
   if (socket) {
     disconnectWebSocket();
   }
 
+  currentConversationId = conversationId;
   socket = new WebSocket(`${WEBSOCKET_URL}/${conversationId}/${token}`);
 
   socket.onopen = () => {
     console.log(`WebSocket connected to conversation ${conversationId}`);
+    reconnectDelay = 1000;
+    unacknowledged.forEach((frame) => {
+      if (frame.conversationId === conversationId) {
+        socket.send(frame.data);
+      }
+    });
   };
 
   socket.onmessage = (event) => {
+    const frame = JSON.parse(event.data);
+    // Answer the server's heartbeat; silent sockets are closed after a minute.
+    if (frame.type === 'ping') {
+      socket.send(JSON.stringify({ type: 'pong', ephemeral: true }));
+      return;
+    }
+    if (frame.type === 'read_your_writes') {
+      setReadYourWritesToken(frame.token);
+      return;
+    }
+    if (frame.client_message_id) {
+      unacknowledged.delete(frame.client_message_id);
+    }
     // Defensively check if the callback is a function before calling it
     if (onMessageCallback && typeof onMessageCallback === 'function') {
       onMessageCallback(event);
@@ -26,6 +54,12 @@ export const connectWebSocket = (conversationId, token, onMessageCallback) => {
     console.log('WebSocket disconnected');
     // Nullify the socket variable so we know we are disconnected
     socket = null; 
+    // The connection dropped (disconnectWebSocket removes this handler first): reconnect,
+    // backing off, so unacknowledged messages get resent.
+    reconnectTimer = setTimeout(() => {
+      reconnectTimer = null;
+      connectWebSocket(conversationId, token, onMessageCallback, Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY_MS));
+    }, reconnectDelay);
   };
 
   socket.onerror = (error) => {
@@ -34,6 +68,9 @@ export const connectWebSocket = (conversationId, token, onMessageCallback) => {
 };
 
 export const disconnectWebSocket = () => {
+  clearTimeout(reconnectTimer);
+  reconnectTimer = null;
+  currentConversationId = null;
   if (socket) {
     // Remove listeners before closing to prevent race conditions on close
     socket.onopen = null;
@@ -45,10 +82,23 @@ export const disconnectWebSocket = () => {
   }
 };
 
+// Each message gets its client id once. Until the server echoes it back, the frame is
+// kept and resent under the same id after a reconnect, so a retry is stored once.
 export const sendMessage = (message) => {
+  if (currentConversationId === null) {
+    console.error('WebSocket is not connected to a conversation.');
+    return;
+  }
+  const clientMessageId = crypto.randomUUID();
+  const data = JSON.stringify({ type: 'message', content: message, client_message_id: clientMessageId });
+  unacknowledged.set(clientMessageId, { conversationId: currentConversationId, data });
   if (socket && socket.readyState === WebSocket.OPEN) {
-    socket.send(message);
-  } else {
-    console.error('WebSocket is not connected or not in an open state.');
+    socket.send(data);
   }
-};
\ No newline at end of file
+};
+// Typing indicators are frames marked ephemeral; the server coalesces them and never stores them.
+export const sendTyping = (isTyping) => {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    socket.send(JSON.stringify({ type: 'typing', ephemeral: true, typing: isTyping }));
+  }
+};